@@ -1,7 +1,6 @@
 """
 controller server implementation
 """
-import json
 import logging
 import os
 import random
@@ -10,9 +9,11 @@ import time
 import csi_pb2
 import csi_pb2_grpc
 import grpc
+from glusterquota import limit_usage
 from kadalulib import (PV_TYPE_RAWBLOCK, PV_TYPE_SUBVOL, PV_TYPE_VIRTBLOCK,
-                       CommandException, execute, logf, reachable_host,
-                       send_analytics_tracker, get_single_pv_per_pool)
+                       logf, reachable_host, send_analytics_tracker,
+                       get_single_pv_per_pool)
+from poolinfo import get_pool_info, get_uid, is_synced
 from volumeutils import (HOSTVOL_MOUNTDIR, check_external_volume,
                          create_block_volume, create_subdir_volume,
                          delete_volume, expand_mounted_volume,
@@ -22,7 +23,6 @@ from volumeutils import (HOSTVOL_MOUNTDIR, check_external_volume,
                          update_free_size, update_subdir_volume,
                          yield_list_of_pvcs)
 
-VOLINFO_DIR = "/var/lib/gluster"
 KADALU_VERSION = os.environ.get("KADALU_VERSION", "latest")
 
 # Generator to be used in ListVolumes
@@ -47,29 +47,9 @@ def execute_gluster_quota_command(privkey, user, host, gvolname, path, size):
         logging.error(logf(errmsg))
         return errmsg
 
-    quota_cmd = [
-        "ssh",
-        "-oStrictHostKeyChecking=no",
-        "-i",
-        "%s" % privkey,
-        "%s@%s" % (user, host),
-        "sudo",
-        "gluster",
-        "volume",
-        "quota",
-        "%s" % gvolname,
-        "limit-usage",
-        "/%s" % path,
-        "%s" % size,
-    ]
-    try:
-        execute(*quota_cmd)
-    except CommandException as err:
-        errmsg = "Unable to set Gluster Quota via ssh"
-        logging.error(logf(errmsg, error=err))
-        return errmsg
-
-    return None
+    # SSH connection to the host is reused and the requests
+    # of the same volume are batched (See glusterquota.py)
+    return limit_usage((privkey, user, host), gvolname, path, size)
 
 # Assuming multiple volume_capabilities isn't requested
 def is_block_request(request):
@@ -175,15 +155,24 @@ class ControllerServer(csi_pb2_grpc.ControllerServicer):
         ))
 
         # UID is stored at the time of installation in configmap.
-        uid = None
-        with open(os.path.join(VOLINFO_DIR, "uid")) as uid_file:
-            uid = uid_file.read()
+        uid = get_uid()
 
         host_volumes = get_pv_hosting_volumes(filters)
         logging.debug(logf(
             "Got list of hosting Volumes",
             volumes=",".join(v['name'] for v in host_volumes)
         ))
+
+        # Pool info may not be synced yet. Fail fast and let the
+        # external-provisioner retry instead of waiting here. If the
+        # Pool info is available, no matching storage is handled below.
+        if not host_volumes and not is_synced():
+            errmsg = "Storage pool info is not yet synced"
+            logging.error(logf(errmsg, **filters))
+            context.set_details(errmsg)
+            context.set_code(grpc.StatusCode.UNAVAILABLE)
+            return csi_pb2.CreateVolumeResponse()
+
         hostvol = None
         ext_volume = None
         data = {}
@@ -202,9 +191,7 @@ class ControllerServer(csi_pb2_grpc.ControllerServicer):
                 context.set_code(grpc.StatusCode.RESOURCE_EXHAUSTED)
                 return csi_pb2.CreateVolumeResponse()
 
-            info_file_path = os.path.join(VOLINFO_DIR, "%s.info" % hostvol)
-            with open(info_file_path) as info_file:
-                data = json.load(info_file)
+            data = get_pool_info(hostvol)
 
             hostvoltype = data['type']
 
@@ -484,8 +471,8 @@ class ControllerServer(csi_pb2_grpc.ControllerServicer):
         global GEN
         # Need to check for no hostvol creation only once
         if GEN is None:
-            # Handle no hostvol creation, with ~10s timeout
-            volumes = get_pv_hosting_volumes(iteration=3)
+            # Handle no hostvol creation
+            volumes = get_pv_hosting_volumes()
             if not volumes:
                 errmsg = "No PV hosting volume is created yet"
                 logging.error(errmsg)
@@ -1,12 +1,18 @@
 import logging
 import os
-import re
 
 import uvicorn
 from fastapi import FastAPI
 from kadalulib import logf, logging_setup
+from monitorctl import monitored_processes
+from resourceutils import pod_metrics, sample_gluster_processes
 from volumeutils import HOSTVOL_MOUNTDIR, yield_pvc_from_mntdir
 
+# PVC usage is read by statvfs of each PVC through the mount. Set
+# PVC_METRICS_CRAWL=no if the PV usage is exported by quotad from the
+# Quota report of the bricks, only the storage metrics are sent then.
+PVC_METRICS_CRAWL = os.environ.get("PVC_METRICS_CRAWL", "yes").lower() != "no"
+
 metrics_app = FastAPI()
 
 @metrics_app.get("/_api/metrics")
@@ -16,44 +22,16 @@ def metrics():
     Starts process by exposing the data collected in port 8050 at '/_api/metrics'.
     """
 
+    # Resource usage of the Pod and of each glusterfs
+    # client process. Stats which are not available are
+    # returned as -1 (For example, in LXD containers)
     data = {
-        "pod": {},
+        "pod": pod_metrics(),
+        "processes": sample_gluster_processes(),
+        "monitor": monitored_processes(),
         "storages": []
     }
 
-    # Return -1 if unable to fetch 'cgroup' data,
-    # until new method is found to get CPU & Memory data in LXD containers.
-    memory_usage_in_bytes = -1
-    cpu_usage_in_nanoseconds = -1
-
-    # CPU (cgroup2)
-    if os.path.exists('/sys/fs/cgroup/cpu.stat'):
-        with open('/sys/fs/cgroup/cpu.stat', 'r') as cpu_fd:
-            for line in cpu_fd: # loop over all lines till we find usage_usec
-                if re.search('usage_usec', line):
-                    # Convert from usec (microseconds) to nanoseconds
-                    cpu_usage_in_nanoseconds = int(line.split(' ')[1]) * 1000
-
-    # CPU (cgroup)
-    elif os.path.exists('/sys/fs/cgroup/cpu/cpuacct.usage'):
-        with open('/sys/fs/cgroup/cpu/cpuacct.usage', 'r') as cpu_fd:
-            cpu_usage_in_nanoseconds = int(cpu_fd.read().strip())
-
-    # Memory (cgroup2)
-    if os.path.exists('/sys/fs/cgroup/system.slice/memory.current'):
-        with open('/sys/fs/cgroup/system.slice/memory.current', 'r') as memory_fd:
-            memory_usage_in_bytes = int(memory_fd.read().strip())
-
-    # Memory (cgroup)
-    elif os.path.exists('/sys/fs/cgroup/memory/memory.usage_in_bytes'):
-        with open('/sys/fs/cgroup/memory/memory.usage_in_bytes', 'r') as memory_fd:
-            memory_usage_in_bytes = int(memory_fd.read().strip())
-
-    data["pod"] = {
-        "memory_usage_in_bytes": memory_usage_in_bytes,
-        "cpu_usage_in_nanoseconds": cpu_usage_in_nanoseconds
-    }
-
     if os.environ.get("CSI_ROLE", "-") == "nodeplugin":
         # pool & pvc details can be read from provisioner
         # avoid sending redundant data from nodeplugins
@@ -97,6 +75,10 @@ def metrics():
                 "pvc": []
             }
 
+            if not PVC_METRICS_CRAWL:
+                data["storages"].append(storage)
+                continue
+
             storage_info_path = os.path.join(storage_path, "info")
             if not os.path.exists(storage_info_path):
                 data["storages"].append(storage)
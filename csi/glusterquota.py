@@ -0,0 +1,225 @@
+"""
+Gluster directory Quota of External storage pools over SSH
+
+SSH connections to the external Gluster hosts are multiplexed using
+ControlMaster, so only the first command to a host does the SSH
+handshake and the connection is kept open for SSH_CONTROL_PERSIST
+seconds after the last command.
+
+limit-usage requests of the same volume received within
+GLUSTER_QUOTA_BATCH_WAIT seconds are run together in one SSH command.
+A request waits at most GLUSTER_QUOTA_BATCH_TIMEOUT seconds for its
+batch to complete.
+
+quota-deem-statfs is checked once per volume and set only if it is
+not enabled already.
+"""
+import logging
+import os
+import shlex
+import threading
+import time
+
+from kadalulib import CommandException, execute, logf, makedirs
+
+SSH_CONTROL_DIR = "/var/run/kadalu/ssh"
+SSH_CONTROL_PERSIST = os.environ.get("SSH_CONTROL_PERSIST", "300")
+BATCH_WAIT = float(os.environ.get("GLUSTER_QUOTA_BATCH_WAIT", "0.2"))
+BATCH_TIMEOUT = float(os.environ.get("GLUSTER_QUOTA_BATCH_TIMEOUT", "300"))
+STATUS_PREFIX = "kadalu-quota-status"
+DEEM_STATFS_OPTION = "features.quota-deem-statfs"
+LIMIT_USAGE_ERROR = "Unable to set Gluster Quota via ssh"
+
+
+def ssh_args(conn):
+    """
+    SSH arguments of the connection (private key, user and host),
+    the connection is shared by all the commands
+    """
+    privkey, user, host = conn
+    makedirs(SSH_CONTROL_DIR)
+    return [
+        "ssh",
+        "-oStrictHostKeyChecking=no",
+        "-oControlMaster=auto",
+        "-oControlPath=%s/%%C" % SSH_CONTROL_DIR,
+        "-oControlPersist=%s" % SSH_CONTROL_PERSIST,
+        "-i",
+        "%s" % privkey,
+        "%s@%s" % (user, host)
+    ]
+
+
+def ssh_execute(conn, *cmd):
+    """Run the command on the host. Raises CommandException on error"""
+    return execute(*(ssh_args(conn) + list(cmd)))
+
+
+class LimitUsageRequest:  # noqa # pylint: disable=too-few-public-methods
+    """limit-usage of a PV directory waiting for its batch"""
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self.error = None
+        self.done = threading.Event()
+
+
+def limit_usage_script(gvolname, requests):
+    """
+    Shell command to run all the limit-usage requests. Exit status of
+    each request is printed, so that one failure doesn't fail the
+    other requests of the batch.
+    """
+    cmds = []
+    for idx, req in enumerate(requests):
+        quota_cmd = " ".join(shlex.quote(arg) for arg in [
+            "sudo", "gluster", "volume", "quota", gvolname,
+            "limit-usage", "/%s" % req.path, "%s" % req.size
+        ])
+        cmds.append("%s; echo %s %d $?" % (quota_cmd, STATUS_PREFIX, idx))
+
+    return "; ".join(cmds)
+
+
+def parse_batch_status(out, count):
+    """Exit status of each request of the batch, None if not run"""
+    status = [None] * count
+    for line in out.splitlines():
+        parts = line.split()
+        if len(parts) != 3 or parts[0] != STATUS_PREFIX:
+            continue
+
+        try:
+            idx = int(parts[1])
+            exit_code = int(parts[2])
+        except ValueError:
+            continue
+
+        if 0 <= idx < count:
+            status[idx] = exit_code
+
+    return status
+
+
+class LimitUsageBatcher:
+    """
+    Queues the limit-usage requests per volume. The first request
+    of a batch waits for BATCH_WAIT seconds, then runs all the queued
+    requests and wakes up the other waiting requests.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queues = {}
+
+    def limit_usage(self, conn, gvolname, path, size):
+        """Set the limit, returns error message on failure"""
+        req = LimitUsageRequest(path, size)
+        key = (conn, gvolname)
+        with self.lock:
+            leader = key not in self.queues
+            if leader:
+                self.queues[key] = []
+            self.queues[key].append(req)
+
+        if leader:
+            time.sleep(BATCH_WAIT)
+            with self.lock:
+                batch = self.queues.pop(key)
+            self.run_batch(key, batch)
+
+        if not req.done.wait(BATCH_TIMEOUT):
+            errmsg = "Timed out waiting for Gluster Quota batch"
+            logging.error(logf(errmsg, path=path, size=size,
+                               gvolname=gvolname, timeout=BATCH_TIMEOUT))
+            return errmsg
+
+        return req.error
+
+    @staticmethod
+    def run_batch(key, batch):
+        """
+        Run the batch in one SSH command and set the result of each.
+        All the waiting requests are woken up even if the batch
+        failed unexpectedly.
+        """
+        conn, gvolname = key
+
+        # Only the latest size is applied if the same PV is
+        # expanded again before the batch is run.
+        latest = {}
+        for req in batch:
+            latest[req.path] = req
+        requests = list(latest.values())
+
+        errors = {}
+        try:
+            errmsg = None
+            status = [None] * len(requests)
+            try:
+                out, _, _ = ssh_execute(conn,
+                                        limit_usage_script(gvolname, requests))
+                status = parse_batch_status(out, len(requests))
+            except (CommandException, OSError) as err:
+                errmsg = LIMIT_USAGE_ERROR
+                logging.error(logf(errmsg, error=err, host=conn[2],
+                                   gvolname=gvolname))
+
+            for idx, req in enumerate(requests):
+                errors[req.path] = errmsg
+                if errmsg is None and status[idx] != 0:
+                    errors[req.path] = LIMIT_USAGE_ERROR
+                    logging.error(logf(LIMIT_USAGE_ERROR, path=req.path,
+                                       size=req.size, status=status[idx],
+                                       gvolname=gvolname))
+            logging.debug(logf("Gluster Quota batch applied",
+                               gvolname=gvolname, requests=len(batch),
+                               commands=len(requests)))
+        finally:
+            for req in batch:
+                req.error = errors.get(req.path, LIMIT_USAGE_ERROR)
+                req.done.set()
+
+
+BATCHER = LimitUsageBatcher()
+
+DEEM_STATFS_ENABLED = set()
+DEEM_STATFS_LOCK = threading.Lock()
+
+
+def limit_usage(conn, gvolname, path, size):
+    """
+    Set Gluster Quota of the PV directory using the SSH connection
+    (private key, user and host), returns error on failure
+    """
+    return BATCHER.limit_usage(conn, gvolname, path, size)
+
+
+def deem_statfs_enabled(conn, gvolname):
+    """True if quota-deem-statfs is already enabled for the volume"""
+    out, _, _ = ssh_execute(conn, "sudo", "gluster",
+                            "volume", "get", gvolname, DEEM_STATFS_OPTION)
+    for line in out.splitlines():
+        parts = line.split()
+        if len(parts) >= 2 and parts[0] == DEEM_STATFS_OPTION:
+            return parts[1] == "on"
+
+    return False
+
+
+def set_quota_deem_statfs(conn, gvolname, hosts):
+    """
+    Enable quota-deem-statfs if not enabled. Checked only once per
+    volume (hosts and volume name) in the lifetime of the process.
+    Raises CommandException on error.
+    """
+    key = (hosts, gvolname)
+    with DEEM_STATFS_LOCK:
+        if key in DEEM_STATFS_ENABLED:
+            return
+
+    if not deem_statfs_enabled(conn, gvolname):
+        ssh_execute(conn, "sudo", "gluster", "volume", "set",
+                    gvolname, "quota-deem-statfs", "on")
+
+    with DEEM_STATFS_LOCK:
+        DEEM_STATFS_ENABLED.add(key)
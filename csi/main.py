@@ -12,11 +12,15 @@ from controllerserver import ControllerServer
 from identityserver import IdentityServer
 from kadalulib import CommandException, logf, logging_setup
 from nodeserver import NodeServer
+from poolinfo import start_watch, wait_for_pools
 from volumeutils import (HOSTVOL_MOUNTDIR, get_pv_hosting_volumes,
                          mount_glusterfs)
 
 _ONE_DAY_IN_SECONDS = 60 * 60 * 24
 
+# Maximum wait at startup for the Pool info to be available
+POOL_INFO_WAIT_SECONDS = 120
+
 def mount_storage():
     """
     Mount storage if any volumes exist after a pod reboot
@@ -25,6 +29,12 @@ def mount_storage():
         logging.debug("Volume need to be mounted on only provisioner pod")
         return
 
+    # If Pool info is not yet available, ConfigMap may not be ready
+    # or synced. Wait for some time before mounting.
+    if not wait_for_pools(POOL_INFO_WAIT_SECONDS):
+        logging.info("No Storage pools available to mount")
+        return
+
     host_volumes = get_pv_hosting_volumes({})
     for volume in host_volumes:
         if volume["single_pv_per_pool"]:
@@ -48,6 +58,10 @@ def main():
     """
     logging_setup()
 
+    # Both provisioner and nodeplugin read the Pool info of a storage
+    # from its own ConfigMap (See poolinfo.py)
+    start_watch()
+
     # If Provisioner pod reboots, mount volumes if they exist before reboot
     mount_storage()
 
@@ -0,0 +1,260 @@
+"""
+Pool (Storage) info catalog of the CSI provisioner and nodeplugin.
+
+If CSI_POOL_INFO_WATCH is set to "yes", the ConfigMaps of the Kadalu
+namespace are watched through the API and the catalog is updated as
+soon as the Operator writes them. Info of each storage is read from
+its own ConfigMap ("kadalu-info-<storage>").
+
+Files from the "kadalu-info" ConfigMap mounted at /var/lib/gluster are
+used if the watch is not enabled or not yet synced. These files have
+the storage info only if the Operator keeps the legacy keys in
+"kadalu-info" (KADALU_INFO_LEGACY_KEYS). Kubelet syncs the ConfigMap
+volume periodically, so a newly added Storage is visible in the files
+only after up to a minute.
+
+The CSI image doesn't ship the Kubernetes python client, so the API
+is accessed using the Service Account token with urllib.
+"""
+
+import json
+import logging
+import os
+import ssl
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from kadalulib import logf
+
+VOLINFO_DIR = "/var/lib/gluster"
+KADALU_CONFIG_MAP = "kadalu-info"
+NAMESPACE = os.environ.get("KADALU_NAMESPACE", "kadalu")
+POOL_INFO_WATCH = os.environ.get("CSI_POOL_INFO_WATCH", "no") == "yes"
+
+SA_DIR = "/var/run/secrets/kubernetes.io/serviceaccount"
+HTTP_STATUS_GONE = 410
+WATCH_TIMEOUT_SECONDS = 300
+WATCH_RETRY_INTERVAL_SECONDS = 5
+
+
+class PoolInfoWatcher:
+    """List and Watch the "kadalu-info*" ConfigMaps"""
+    def __init__(self):
+        self.configmaps = {}
+        self.lock = threading.Lock()
+        self.synced = threading.Event()
+        self.resource_version = ""
+        self.thread = None
+
+    def request(self, params, timeout):
+        """Open a request to the ConfigMaps API of the namespace"""
+        with open(os.path.join(SA_DIR, "token")) as token_file:
+            token = token_file.read().strip()
+
+        url = "https://%s:%s/api/v1/namespaces/%s/configmaps?%s" % (
+            os.environ["KUBERNETES_SERVICE_HOST"],
+            os.environ["KUBERNETES_SERVICE_PORT"],
+            NAMESPACE,
+            urllib.parse.urlencode(params)
+        )
+        req = urllib.request.Request(
+            url, headers={"Authorization": "Bearer %s" % token})
+        ctx = ssl.create_default_context(cafile=os.path.join(SA_DIR, "ca.crt"))
+        return urllib.request.urlopen(req, timeout=timeout, context=ctx)
+
+    def _update(self, event_type, configmap):
+        name = configmap["metadata"]["name"]
+        if not name.startswith(KADALU_CONFIG_MAP):
+            return
+
+        with self.lock:
+            if event_type == "DELETED":
+                self.configmaps.pop(name, None)
+            else:
+                self.configmaps[name] = configmap.get("data") or {}
+
+        logging.debug(logf("Pool info updated", configmap=name,
+                           event_type=event_type))
+
+    def relist(self):
+        """List all the ConfigMaps and replace the catalog"""
+        with self.request({}, 30) as resp:
+            data = json.load(resp)
+
+        configmaps = {}
+        for configmap in data.get("items", []):
+            name = configmap["metadata"]["name"]
+            if name.startswith(KADALU_CONFIG_MAP):
+                configmaps[name] = configmap.get("data") or {}
+
+        with self.lock:
+            self.configmaps = configmaps
+
+        self.resource_version = data["metadata"]["resourceVersion"]
+        self.synced.set()
+        logging.info(logf("Pool info synced from API",
+                          configmaps=len(configmaps)))
+
+    def watch(self):
+        """Watch from the last seen resourceVersion till the stream ends"""
+        params = {
+            "watch": "1",
+            "resourceVersion": self.resource_version,
+            "allowWatchBookmarks": "true",
+            "timeoutSeconds": WATCH_TIMEOUT_SECONDS
+        }
+        with self.request(params, WATCH_TIMEOUT_SECONDS + 30) as resp:
+            for line in resp:
+                if not line.strip():
+                    continue
+
+                event = json.loads(line)
+                obj = event["object"]
+                if event["type"] == "ERROR":
+                    if obj.get("code", 0) == HTTP_STATUS_GONE:
+                        self.resource_version = ""
+                        return
+                    raise urllib.error.URLError(obj.get("message", ""))
+
+                if event["type"] != "BOOKMARK":
+                    self._update(event["type"], obj)
+
+                self.resource_version = obj["metadata"]["resourceVersion"]
+
+    def run(self):
+        """List once and keep watching, relist only when expired"""
+        while True:
+            try:
+                if not self.resource_version:
+                    self.relist()
+                self.watch()
+                continue
+            except urllib.error.HTTPError as err:
+                if err.code == HTTP_STATUS_GONE:
+                    self.resource_version = ""
+                    continue
+                logging.error(logf("Pool info watch failed",
+                                   status=err.code, reason=err.reason))
+            except (OSError, ValueError, KeyError) as err:
+                logging.warning(logf("Pool info watch broken", error=err))
+
+            time.sleep(WATCH_RETRY_INTERVAL_SECONDS)
+
+    def start(self):
+        """Start watching in a background thread"""
+        self.thread = threading.Thread(target=self.run, daemon=True,
+                                       name="poolinfo-watch")
+        self.thread.start()
+
+    def get(self, key):
+        """
+        Value of the key from the storage's ConfigMap
+        ("kadalu-info-<storage>") or from "kadalu-info"
+        """
+        with self.lock:
+            if key.endswith(".info"):
+                name = "%s-%s" % (KADALU_CONFIG_MAP, key[:-len(".info")])
+                value = self.configmaps.get(name, {}).get(key, None)
+                if value is not None:
+                    return value
+
+            return self.configmaps.get(KADALU_CONFIG_MAP, {}).get(key, None)
+
+    def keys(self):
+        """All the keys from the ConfigMaps"""
+        with self.lock:
+            keys = set()
+            for data in self.configmaps.values():
+                keys.update(data.keys())
+
+            return keys
+
+
+WATCHER = None
+
+
+def start_watch():
+    """Start the API watch if enabled"""
+    global WATCHER    # noqa # pylint: disable=global-statement
+    if not POOL_INFO_WATCH or WATCHER is not None:
+        return
+
+    WATCHER = PoolInfoWatcher()
+    WATCHER.start()
+
+
+def get_watcher():
+    """Watcher if enabled and synced, else None"""
+    if WATCHER is not None and WATCHER.synced.is_set():
+        return WATCHER
+
+    return None
+
+
+def read_key(key):
+    """Value of the key from the API catalog or from the mounted file"""
+    watcher = get_watcher()
+    if watcher is not None:
+        return watcher.get(key)
+
+    try:
+        with open(os.path.join(VOLINFO_DIR, key)) as info_file:
+            return info_file.read()
+    except FileNotFoundError:
+        return None
+
+
+def get_pool_info(volname):
+    """Pool info of the storage, None if not yet available"""
+    value = read_key("%s.info" % volname)
+    if value is None:
+        return None
+
+    return json.loads(value)
+
+
+def list_pool_names():
+    """Names of all the storages from the API catalog or files"""
+    watcher = get_watcher()
+    if watcher is not None:
+        keys = watcher.keys()
+    else:
+        try:
+            keys = os.listdir(VOLINFO_DIR)
+        except FileNotFoundError:
+            keys = []
+
+    return sorted(key[:-len(".info")] for key in keys if key.endswith(".info"))
+
+
+def is_synced():
+    """
+    False if the Pool info is not yet available, that is the API watch
+    is enabled but not yet synced or no storage is known.
+    """
+    if WATCHER is not None and not WATCHER.synced.is_set():
+        return False
+
+    return len(list_pool_names()) > 0
+
+
+def get_uid():
+    """UID of the Kadalu installation"""
+    return read_key("uid")
+
+
+def wait_for_pools(timeout):
+    """
+    Wait till at least one storage is known. Used only at startup,
+    request handlers should not wait for the Pool info.
+    """
+    end_time = time.time() + timeout
+    while time.time() < end_time:
+        if list_pool_names():
+            return True
+        time.sleep(1)
+
+    return False
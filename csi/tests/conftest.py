@@ -0,0 +1,9 @@
+import os
+import sys
+
+# CSI modules import each other and kadalulib as top level modules,
+# as they are laid out in the container image.
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(ROOT_DIR, "lib"))
+sys.path.insert(0, os.path.join(ROOT_DIR, "csi"))
@@ -0,0 +1,79 @@
+import json
+
+import grpc
+import pytest
+
+import controllerserver
+import csi_pb2
+import poolinfo
+from controllerserver import ControllerServer
+
+POOL_1 = {"volname": "storage-pool-1", "type": "Replica1",
+          "bricks": [{"kube_hostname": "node-1"}]}
+
+
+class FakeContext:
+    """Records the status set by the handler"""
+    def __init__(self):
+        self.code = None
+        self.details = None
+
+    def set_code(self, code):
+        self.code = code
+
+    def set_details(self, details):
+        self.details = details
+
+
+def create_request(parameters):
+    return csi_pb2.CreateVolumeRequest(
+        name="pvc-1",
+        capacity_range=csi_pb2.CapacityRange(required_bytes=1073741824),
+        volume_capabilities=[csi_pb2.VolumeCapability(
+            mount=csi_pb2.VolumeCapability.MountVolume(),
+            access_mode=csi_pb2.VolumeCapability.AccessMode(
+                mode=csi_pb2.VolumeCapability.AccessMode.MULTI_NODE_MULTI_WRITER
+            ))],
+        parameters=parameters)
+
+
+@pytest.fixture(name="volinfo_dir")
+def fixture_volinfo_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(poolinfo, "WATCHER", None)
+    monkeypatch.setattr(poolinfo, "VOLINFO_DIR", str(tmp_path))
+    monkeypatch.setattr(controllerserver, "search_volume", lambda name: None)
+    # No storage has free space
+    monkeypatch.setattr(controllerserver, "mount_and_select_hosting_volume",
+                        lambda volumes, size: None)
+    return tmp_path
+
+
+def create_volume(parameters):
+    context = FakeContext()
+    ControllerServer().CreateVolume(create_request(parameters), context)
+    return context
+
+
+def test_not_synced_is_retryable(volinfo_dir):
+    context = create_volume({"storage_name": "storage-pool-1"})
+    assert context.code == grpc.StatusCode.UNAVAILABLE
+
+
+def test_watch_not_synced_is_retryable(volinfo_dir, monkeypatch):
+    (volinfo_dir / "storage-pool-1.info").write_text(json.dumps(POOL_1))
+    monkeypatch.setattr(poolinfo, "WATCHER", poolinfo.PoolInfoWatcher())
+
+    context = create_volume({"storage_name": "storage-pool-2"})
+    assert context.code == grpc.StatusCode.UNAVAILABLE
+
+
+@pytest.mark.parametrize("parameters", [
+    {"storage_name": "storage-pool-2"},
+    {"hostvol_type": "Replica3"},
+])
+def test_filter_mismatch_is_not_retried(volinfo_dir, parameters):
+    (volinfo_dir / "storage-pool-1.info").write_text(json.dumps(POOL_1))
+
+    context = create_volume(parameters)
+    assert context.code == grpc.StatusCode.RESOURCE_EXHAUSTED
+    assert context.details == "No Hosting Volumes available, add more storage"
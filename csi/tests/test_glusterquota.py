@@ -0,0 +1,189 @@
+import threading
+import time
+
+import pytest
+
+import glusterquota
+from glusterquota import (LIMIT_USAGE_ERROR, STATUS_PREFIX,
+                          LimitUsageBatcher, LimitUsageRequest,
+                          limit_usage_script, parse_batch_status)
+from kadalulib import CommandException
+
+CONN = ("/etc/secret-volume/ssh-privatekey", "root", "gluster1.kadalu.io")
+GVOLNAME = "kadalu"
+
+
+def test_limit_usage_script():
+    requests = [LimitUsageRequest("pvc-1", 1024),
+                LimitUsageRequest("pvc 2", 2048)]
+    assert limit_usage_script(GVOLNAME, requests) == (
+        "sudo gluster volume quota kadalu limit-usage /pvc-1 1024; "
+        "echo %s 0 $?; "
+        "sudo gluster volume quota kadalu limit-usage '/pvc 2' 2048; "
+        "echo %s 1 $?" % (STATUS_PREFIX, STATUS_PREFIX))
+
+
+def test_parse_batch_status():
+    out = "\n".join([
+        "volume quota : success",
+        "%s 0 0" % STATUS_PREFIX,
+        "quota command failed : Another transaction is in progress",
+        "%s 1 1" % STATUS_PREFIX,
+        # Not run, out of range and malformed lines are ignored
+        "%s 5 0" % STATUS_PREFIX,
+        "%s x 0" % STATUS_PREFIX,
+        "%s 2 -" % STATUS_PREFIX,
+    ])
+    assert parse_batch_status(out, 3) == [0, 1, None]
+
+
+class FakeSsh:
+    """Records the batches, holds the first one till released"""
+    def __init__(self, status=None, error=None):
+        self.status = status
+        self.error = error
+        self.scripts = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, conn, script):
+        assert conn == CONN
+        self.scripts.append(script)
+        self.started.set()
+        self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+
+        count = script.count(STATUS_PREFIX)
+        status = self.status or [0] * count
+        out = "\n".join("%s %d %d" % (STATUS_PREFIX, idx, status[idx])
+                        for idx in range(count))
+        return out, "", 0
+
+
+def run_requests(batcher, requests):
+    """Run each (path, size) request in its own thread, leader first"""
+    results = {}
+
+    def run(path, size):
+        results[path, size] = batcher.limit_usage(CONN, GVOLNAME, path, size)
+
+    threads = [threading.Thread(target=run, args=req) for req in requests]
+    threads[0].start()
+    wait_for_leader(batcher)
+    return threads, results
+
+
+def wait_for_leader(batcher):
+    """Wait till the first request starts collecting the batch"""
+    end_time = time.time() + 5
+    while (CONN, GVOLNAME) not in batcher.queues and time.time() < end_time:
+        time.sleep(0.01)
+
+
+@pytest.fixture(name="batch_wait")
+def fixture_batch_wait(monkeypatch):
+    monkeypatch.setattr(glusterquota, "BATCH_WAIT", 0.2)
+    monkeypatch.setattr(glusterquota, "BATCH_TIMEOUT", 5)
+
+
+def test_requests_are_batched(monkeypatch, batch_wait):
+    ssh = FakeSsh(status=[0, 1])
+    ssh.release.set()
+    monkeypatch.setattr(glusterquota, "ssh_execute", ssh)
+
+    threads, results = run_requests(LimitUsageBatcher(), [
+        ("pvc-1", 1024), ("pvc-2", 1024), ("pvc-1", 4096)])
+    for thread in threads[1:]:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    # One ssh command, only the latest size of pvc-1 is applied
+    assert len(ssh.scripts) == 1
+    assert "/pvc-1 4096" in ssh.scripts[0]
+    assert "/pvc-1 1024" not in ssh.scripts[0]
+    assert results == {
+        ("pvc-1", 1024): None,
+        ("pvc-1", 4096): None,
+        ("pvc-2", 1024): LIMIT_USAGE_ERROR
+    }
+
+
+def test_new_batch_while_running(monkeypatch, batch_wait):
+    ssh = FakeSsh()
+    monkeypatch.setattr(glusterquota, "ssh_execute", ssh)
+    batcher = LimitUsageBatcher()
+
+    threads, results = run_requests(batcher, [("pvc-1", 1024)])
+    assert ssh.started.wait(5)
+
+    # Queued as a new batch while the first one is running
+    more_threads, _ = run_requests(batcher, [("pvc-2", 1024)])
+    ssh.release.set()
+    for thread in threads + more_threads:
+        thread.join(5)
+
+    assert len(ssh.scripts) == 2
+    assert results == {("pvc-1", 1024): None}
+
+
+@pytest.mark.parametrize("error", [
+    CommandException(255, "", "ssh: connect to host failed"),
+    OSError(13, "Permission denied"),
+])
+def test_batch_failure_wakes_up_all_requests(monkeypatch, batch_wait, error):
+    ssh = FakeSsh(error=error)
+    ssh.release.set()
+    monkeypatch.setattr(glusterquota, "ssh_execute", ssh)
+
+    threads, results = run_requests(LimitUsageBatcher(), [
+        ("pvc-1", 1024), ("pvc-2", 1024)])
+    threads[1].start()
+    for thread in threads:
+        thread.join(5)
+        assert not thread.is_alive()
+
+    assert results == {
+        ("pvc-1", 1024): LIMIT_USAGE_ERROR,
+        ("pvc-2", 1024): LIMIT_USAGE_ERROR
+    }
+
+
+def test_unexpected_error_wakes_up_followers(monkeypatch, batch_wait):
+    ssh = FakeSsh()
+    ssh.release.set()
+    monkeypatch.setattr(glusterquota, "ssh_execute", ssh)
+    monkeypatch.setattr(glusterquota, "parse_batch_status",
+                        lambda out, count: [][0])
+    batcher = LimitUsageBatcher()
+
+    leader_errors = []
+
+    def leader():
+        try:
+            batcher.limit_usage(CONN, GVOLNAME, "pvc-1", 1024)
+        except IndexError as err:
+            leader_errors.append(err)
+
+    leader_thread = threading.Thread(target=leader)
+    leader_thread.start()
+    wait_for_leader(batcher)
+    threads, results = run_requests(batcher, [("pvc-2", 1024)])
+    for thread in [leader_thread] + threads:
+        thread.join(5)
+        assert not thread.is_alive()
+
+    assert len(leader_errors) == 1
+    assert results == {("pvc-2", 1024): LIMIT_USAGE_ERROR}
+
+
+def test_wait_timeout(monkeypatch):
+    monkeypatch.setattr(glusterquota, "BATCH_TIMEOUT", 0.1)
+    batcher = LimitUsageBatcher()
+    # Batch of this volume is already being collected by a leader
+    # which never completes.
+    batcher.queues[(CONN, GVOLNAME)] = []
+
+    assert batcher.limit_usage(CONN, GVOLNAME, "pvc-1", 1024) == \
+        "Timed out waiting for Gluster Quota batch"
@@ -0,0 +1,170 @@
+import io
+import json
+import urllib.error
+
+import pytest
+
+import poolinfo
+from poolinfo import PoolInfoWatcher
+
+POOL_1 = {"volname": "storage-pool-1", "type": "Replica1"}
+POOL_2 = {"volname": "storage-pool-2", "type": "Replica3"}
+
+
+def configmap(name, data, resource_version="1"):
+    return {
+        "metadata": {"name": name, "resourceVersion": resource_version},
+        "data": data
+    }
+
+
+def event(event_type, obj):
+    return json.dumps({"type": event_type, "object": obj}).encode() + b"\n"
+
+
+class StopWatch(Exception):
+    """Ends the run loop of the watcher"""
+
+
+class FakeApi:
+    """
+    Responses of the ConfigMaps API in order. A response is a list
+    response (dict), a list of watch events (bytes) or an error.
+    """
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def __call__(self, params, timeout):
+        self.requests.append(params)
+        if not self.responses:
+            raise StopWatch()
+
+        resp = self.responses.pop(0)
+        if isinstance(resp, Exception):
+            raise resp
+        if isinstance(resp, dict):
+            return io.BytesIO(json.dumps(resp).encode())
+        return io.BytesIO(b"".join(resp))
+
+
+def list_response(items, resource_version="10"):
+    return {"metadata": {"resourceVersion": resource_version}, "items": items}
+
+
+@pytest.fixture(name="watcher")
+def fixture_watcher(monkeypatch):
+    watcher = PoolInfoWatcher()
+    monkeypatch.setattr(poolinfo, "WATCHER", watcher)
+    monkeypatch.setattr(poolinfo, "WATCH_RETRY_INTERVAL_SECONDS", 0)
+    return watcher
+
+
+def run_watcher(watcher, responses):
+    api = FakeApi(responses)
+    watcher.request = api
+    with pytest.raises(StopWatch):
+        watcher.run()
+    return api
+
+
+def test_relist(watcher):
+    assert not watcher.synced.is_set()
+    run_watcher(watcher, [list_response([
+        configmap("kadalu-info", {"uid": "1234"}),
+        configmap("kadalu-info-storage-pool-1",
+                  {"storage-pool-1.info": json.dumps(POOL_1)}),
+        configmap("kube-root-ca.crt", {"ca.crt": "..."}),
+    ])])
+
+    assert watcher.synced.is_set()
+    assert watcher.resource_version == "10"
+    assert watcher.keys() == {"uid", "storage-pool-1.info"}
+    assert poolinfo.get_uid() == "1234"
+    assert poolinfo.get_pool_info("storage-pool-1") == POOL_1
+    assert poolinfo.list_pool_names() == ["storage-pool-1"]
+    assert poolinfo.is_synced()
+
+
+def test_watch_events(watcher):
+    pool_1_cm = "kadalu-info-storage-pool-1"
+    modified = dict(POOL_1, type="Replica2")
+    api = run_watcher(watcher, [
+        list_response([configmap("kadalu-info", {"uid": "1234"})]),
+        [
+            event("ADDED", configmap(
+                pool_1_cm, {"storage-pool-1.info": json.dumps(POOL_1)}, "11")),
+            event("ADDED", configmap(
+                "kadalu-info-storage-pool-2",
+                {"storage-pool-2.info": json.dumps(POOL_2)}, "12")),
+            b"\n",
+            event("MODIFIED", configmap(
+                pool_1_cm, {"storage-pool-1.info": json.dumps(modified)},
+                "13")),
+            event("DELETED", configmap(
+                "kadalu-info-storage-pool-2", {}, "14")),
+            event("ADDED", configmap("other", {"x.info": "{}"}, "15")),
+            event("BOOKMARK", {"metadata": {"resourceVersion": "16"}}),
+        ],
+    ])
+
+    assert poolinfo.list_pool_names() == ["storage-pool-1"]
+    assert poolinfo.get_pool_info("storage-pool-1") == modified
+    assert watcher.resource_version == "16"
+    # Watch is continued from the last seen resourceVersion
+    assert api.requests[1]["resourceVersion"] == "10"
+    assert api.requests[2]["resourceVersion"] == "16"
+
+
+def test_watch_expired_relists(watcher):
+    gone = {"kind": "Status", "code": 410, "message": "too old",
+            "metadata": {}}
+    api = run_watcher(watcher, [
+        list_response([configmap("kadalu-info-storage-pool-1", {
+            "storage-pool-1.info": json.dumps(POOL_1)})]),
+        [event("ERROR", gone)],
+        list_response([configmap("kadalu-info-storage-pool-2", {
+            "storage-pool-2.info": json.dumps(POOL_2)})], "20"),
+        urllib.error.HTTPError("https://kubernetes", 410, "Gone", {}, None),
+        list_response([configmap("kadalu-info-storage-pool-2", {
+            "storage-pool-2.info": json.dumps(POOL_2)})], "30"),
+    ])
+
+    # List, watch, relist (ERROR event), watch, relist (HTTP 410)
+    assert [req.get("watch") for req in api.requests] == \
+        [None, "1", None, "1", None, "1"]
+    assert poolinfo.list_pool_names() == ["storage-pool-2"]
+    assert watcher.resource_version == "30"
+
+
+def test_shard_preferred_over_combined_configmap(watcher):
+    old = dict(POOL_1, type="Replica3")
+    run_watcher(watcher, [list_response([
+        configmap("kadalu-info", {"storage-pool-1.info": json.dumps(old),
+                                  "storage-pool-2.info": json.dumps(POOL_2)}),
+        configmap("kadalu-info-storage-pool-1",
+                  {"storage-pool-1.info": json.dumps(POOL_1)}),
+    ])])
+
+    assert poolinfo.get_pool_info("storage-pool-1") == POOL_1
+    assert poolinfo.get_pool_info("storage-pool-2") == POOL_2
+
+
+def test_files_used_till_synced(tmp_path, watcher, monkeypatch):
+    monkeypatch.setattr(poolinfo, "VOLINFO_DIR", str(tmp_path))
+    (tmp_path / "storage-pool-1.info").write_text(json.dumps(POOL_1))
+
+    assert poolinfo.list_pool_names() == ["storage-pool-1"]
+    assert poolinfo.get_pool_info("storage-pool-1") == POOL_1
+    # Watch is enabled but not yet synced
+    assert not poolinfo.is_synced()
+
+    monkeypatch.setattr(poolinfo, "WATCHER", None)
+    assert poolinfo.is_synced()
+
+
+def test_not_synced_without_pools(tmp_path, monkeypatch):
+    monkeypatch.setattr(poolinfo, "WATCHER", None)
+    monkeypatch.setattr(poolinfo, "VOLINFO_DIR", str(tmp_path / "missing"))
+    assert poolinfo.list_pool_names() == []
+    assert not poolinfo.is_synced()
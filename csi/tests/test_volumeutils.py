@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+import poolinfo
+from volumeutils import get_pv_hosting_volumes
+
+POOLS = [
+    {"volname": "storage-pool-1", "type": "Replica1",
+     "bricks": [{"kube_hostname": "node-1"}]},
+    {"volname": "storage-pool-2", "type": "Replica1",
+     "bricks": [{"kube_hostname": "node-2"}],
+     "supported_pvtype": "virtblock"},
+    {"volname": "storage-pool-3", "type": "Replica3",
+     "bricks": [{"kube_hostname": "node-1"}, {"kube_hostname": "node-2"},
+                {"kube_hostname": "node-3"}]},
+    {"volname": "external-1", "type": "External",
+     "gluster_volname": "gvol1", "gluster_hosts": "gluster1.kadalu.io",
+     "gluster_options": "log-level=DEBUG", "single_pv_per_pool": True},
+]
+
+
+@pytest.fixture(name="pools", autouse=True)
+def fixture_pools(tmp_path, monkeypatch):
+    monkeypatch.setattr(poolinfo, "WATCHER", None)
+    monkeypatch.setattr(poolinfo, "VOLINFO_DIR", str(tmp_path))
+    for pool in POOLS:
+        (tmp_path / ("%s.info" % pool["volname"])).write_text(json.dumps(pool))
+    (tmp_path / "uid").write_text("1234")
+
+
+def names(volumes):
+    return [volume["name"] for volume in volumes]
+
+
+@pytest.mark.parametrize("filters, expected", [
+    ({}, ["external-1", "storage-pool-1", "storage-pool-2",
+          "storage-pool-3"]),
+    ({"storage_name": "storage-pool-3"}, ["storage-pool-3"]),
+    ({"storage_name": "storage-pool-9"}, []),
+    ({"hostvol_type": "Replica1"}, ["storage-pool-1", "storage-pool-2"]),
+    # storage_type takes precedence over hostvol_type
+    ({"storage_type": "Replica3", "hostvol_type": "Replica1"},
+     ["storage-pool-3"]),
+    # Node affinity is applicable only for Replica1
+    ({"node_affinity": "node-2"}, ["storage-pool-2"]),
+    ({"node_affinity": "node-3"}, []),
+    ({"supported_pvtype": "virtblock"},
+     ["external-1", "storage-pool-1", "storage-pool-2", "storage-pool-3"]),
+    ({"supported_pvtype": "subvol"},
+     ["external-1", "storage-pool-1", "storage-pool-3"]),
+    ({"storage_name": "storage-pool-1", "hostvol_type": "Replica3"}, []),
+])
+def test_filters(filters, expected):
+    assert names(get_pv_hosting_volumes(filters)) == expected
+
+
+def test_hosting_volume_fields():
+    assert get_pv_hosting_volumes({"hostvol_type": "External"}) == [{
+        "name": "external-1",
+        "type": "External",
+        "g_volname": "gvol1",
+        "g_host": "gluster1.kadalu.io",
+        "g_options": "log-level=DEBUG",
+        "single_pv_per_pool": True
+    }]
+
+
+def test_pool_removed_while_listing(tmp_path, monkeypatch):
+    monkeypatch.setattr("volumeutils.list_pool_names",
+                        lambda: ["storage-pool-1", "storage-pool-removed"])
+    assert names(get_pv_hosting_volumes({})) == ["storage-pool-1"]
+
+
+def test_pool_info_not_available(tmp_path, monkeypatch):
+    monkeypatch.setattr(poolinfo, "VOLINFO_DIR", str(tmp_path / "missing"))
+    assert get_pv_hosting_volumes({}) == []
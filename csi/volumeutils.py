@@ -12,12 +12,15 @@ import time
 from errno import ENOTCONN
 from pathlib import Path
 
+from glusterquota import set_quota_deem_statfs
 from kadalulib import (PV_TYPE_RAWBLOCK, PV_TYPE_SUBVOL, PV_TYPE_VIRTBLOCK,
                        CommandException, SizeAccounting, execute,
                        get_volname_hash, get_volume_path,
                        is_gluster_mount_proc_running, logf, makedirs,
                        reachable_host, retry_errors, get_single_pv_per_pool,
                        is_server_pod_reachable)
+from poolinfo import get_pool_info, list_pool_names
+from resourceutils import thread_counts
 
 GLUSTERFS_CMD = "/opt/sbin/glusterfs"
 MOUNT_CMD = "/bin/mount"
@@ -28,6 +31,9 @@ RESERVED_SIZE_PERCENTAGE = 10
 HOSTVOL_MOUNTDIR = "/mnt"
 VOLFILES_DIR = "/kadalu/volfiles"
 VOLINFO_DIR = "/var/lib/gluster"
+# Storage pool options to override the FUSE client thread counts
+CLIENT_EVENT_THREADS_OPTION = "client.event-threads"
+READER_THREADS_OPTION = "kadalu.reader-thread-count"
 
 statfile_lock = threading.Lock()    # noqa # pylint: disable=invalid-name
 mount_lock = threading.Lock()    # noqa # pylint: disable=invalid-name
@@ -129,68 +135,58 @@ def filter_supported_pvtype(volume, filters):
 # Disabled pylint here because filters argument is used as
 # readonly in all functions
 # noqa # pylint: disable=dangerous-default-value
-def get_pv_hosting_volumes(filters={}, iteration=40):
-    """Get list of pv hosting volumes"""
+def get_pv_hosting_volumes(filters={}):
+    """
+    Get list of pv hosting volumes. Returns an empty list if the
+    Pool info is not yet available, caller should not wait for it.
+    """
     volumes = []
-    total_volumes = 0
 
     filter_funcs = [
         filter_node_affinity, filter_storage_type, filter_supported_pvtype
     ]
 
-    for filename in os.listdir(VOLINFO_DIR):
-        if filename.endswith(".info"):
-            total_volumes += 1
-            volname = filename.replace(".info", "")
+    for volname in list_pool_names():
+        filtered = filter_storage_name({"volname": volname}, filters)
+        if filtered is None:
+            logging.debug(
+                logf("Volume doesn't match the filter",
+                     volname=volname,
+                     **filters))
+            continue
 
-            filtered = filter_storage_name({"volname": volname}, filters)
+        data = get_pool_info(volname)
+        if data is None:
+            continue
+
+        filtered_data = True
+        for filter_func in filter_funcs:
+            filtered = filter_func(data, filters)
+            # Node affinity is not matching for this Volume,
+            # Try other volumes
             if filtered is None:
+                filtered_data = False
                 logging.debug(
                     logf("Volume doesn't match the filter",
-                         volname=volname,
+                         volname=data["volname"],
                          **filters))
-                continue
-
-            data = {}
-            with open(os.path.join(VOLINFO_DIR, filename)) as info_file:
-                data = json.load(info_file)
-
-            filtered_data = True
-            for filter_func in filter_funcs:
-                filtered = filter_func(data, filters)
-                # Node affinity is not matching for this Volume,
-                # Try other volumes
-                if filtered is None:
-                    filtered_data = False
-                    logging.debug(
-                        logf("Volume doesn't match the filter",
-                             volname=data["volname"],
-                             **filters))
-                    break
-
-            if not filtered_data:
-                continue
-
-            volume = {
-                "name": volname,
-                "type": data["type"],
-                "g_volname": data.get("gluster_volname", None),
-                "g_host": data.get("gluster_hosts", None),
-                "g_options": data.get("gluster_options", ""),
-                "single_pv_per_pool": get_single_pv_per_pool(data)
-            }
-
-            volumes.append(volume)
+                break
 
-    # Need a different way to get external-kadalu volumes
+        if not filtered_data:
+            continue
+
+        volume = {
+            "name": volname,
+            "type": data["type"],
+            "g_volname": data.get("gluster_volname", None),
+            "g_host": data.get("gluster_hosts", None),
+            "g_options": data.get("gluster_options", ""),
+            "single_pv_per_pool": get_single_pv_per_pool(data)
+        }
 
-    # If volume file is not yet available, ConfigMap may not be ready
-    # or synced. Wait for some time and try again
-    # Lets just give maximum 2 minutes for the config map to come up!
-    if total_volumes == 0 and iteration > 0:
-        time.sleep(3)
-        iteration -= 1
-        return get_pv_hosting_volumes(filters, iteration)
+        volumes.append(volume)
+
+    # Need a different way to get external-kadalu volumes
 
     return volumes
 
@@ -603,6 +599,19 @@ def update_pv_metadata(hostvol_mnt, pvpath, expansion_requested_pvsize):
     ))
 
 
+def get_reclaim_policy(hostvol):
+    """
+    PV reclaim policy of the Pool. Don't assume the reclaim
+    policy if the Pool info is not available.
+    """
+    storage_data = get_pool_info(hostvol)
+    if storage_data is None:
+        raise CommandException(-1, "delete_volume",
+                               "Pool info not available for %s" % hostvol)
+
+    return storage_data.get("pvReclaimPolicy", "delete")
+
+
 # pylint: disable=too-many-locals,too-many-statements
 def delete_volume(volname):
     """Delete virtual/raw block, sub directory volume, or External"""
@@ -627,11 +636,7 @@ def delete_volume(volname):
     retry_errors(os.statvfs, [os.path.join(HOSTVOL_MOUNTDIR, vol.hostvol)],
                  [ENOTCONN])
 
-    storage_filename = vol.hostvol + ".info"
-    with open(os.path.join(VOLINFO_DIR, storage_filename)) as info_file:
-        storage_data = json.load(info_file)
-
-    pv_reclaim_policy = storage_data.get("pvReclaimPolicy", "delete")
+    pv_reclaim_policy = get_reclaim_policy(vol.hostvol)
 
     volpath = os.path.join(HOSTVOL_MOUNTDIR, vol.hostvol, vol.volpath)
 
@@ -915,6 +920,24 @@ def expand_mounted_volume(mountpoint):
         execute("xfs_growfs", "-d", mountpoint)
 
 
+def fuse_thread_args(options):
+    """
+    Reader threads and client event threads of the FUSE client sized
+    to the CPUs available to this pod, unless set in the Storage
+    pool options.
+    """
+    counts = thread_counts()
+    args = ["--reader-thread-count",
+            str(options.get(READER_THREADS_OPTION, counts["reader_threads"]))]
+
+    # Client volfile already has the value if set in the pool options
+    if CLIENT_EVENT_THREADS_OPTION not in options:
+        args.extend(["--xlator-option",
+                     "*-client-*.event-threads=%d" % counts["event_threads"]])
+
+    return args
+
+
 def mount_glusterfs(volume, mountpoint, is_client=False):
     """Mount Glusterfs Volume"""
 
@@ -925,8 +948,11 @@ def mount_glusterfs(volume, mountpoint, is_client=False):
     if volume['type'] == 'External':
         return handle_external_volume(volume, mountpoint, is_client, volume['g_host'])
 
-    with open(os.path.join(VOLINFO_DIR, "%s.info" % volname)) as info_file:
-        data = json.load(info_file)
+    data = get_pool_info(volname)
+    if data is None:
+        raise CommandException(-1, "mount_glusterfs",
+                               "Pool info not available for %s" % volname)
+
     for brick in data["bricks"]:
         hosts.append(brick["node"])
 
@@ -978,6 +1004,8 @@ def mount_glusterfs(volume, mountpoint, is_client=False):
         if not is_client:
             cmd.extend(["--client-pid", "-14"])
 
+        cmd.extend(fuse_thread_args(data.get("options", {})))
+
         # Use volfile server of bricks/storage_unit processes,
         # instead of volfile paths. Since now brick processes
         # supports serving of client volfiles.
@@ -1039,22 +1067,11 @@ def handle_external_volume(volume, mountpoint, is_client, hosts):
         logging.debug(logf("Do not set quota-deem-statfs"))
     else:
         logging.debug(logf("Set quota-deem-statfs for gluster directory Quota"))
-        quota_deem_cmd = [
-            "ssh",
-            "-oStrictHostKeyChecking=no",
-            "-i",
-            "%s" % secret_private_key,
-            "%s@%s" % (secret_username, g_host),
-            "sudo",
-            "gluster",
-            "volume",
-            "set",
-            "%s" % volume['g_volname'],
-            "quota-deem-statfs",
-            "on"
-        ]
         try:
-            execute(*quota_deem_cmd)
+            # Set only if not enabled already, checked once per volume
+            set_quota_deem_statfs(
+                (secret_private_key, secret_username, g_host),
+                volume['g_volname'], hosts)
         except CommandException as err:
             errmsg = "Unable to set quota-deem-statfs via ssh"
             logging.error(logf(errmsg, error=err))
@@ -5,18 +5,46 @@ and makes available these aggregated metrics in JSON as metrics.json
 and Prometheus as metrics at PORT=8050
 """
 
-import json
+import asyncio
 import logging
 import os
-import re
+import time
 
+import httpx
 import metrics as storage_metrics
-import requests
+import storageinfo
 import uvicorn
 from fastapi import FastAPI
+from informer import Informer
 from kadalulib import logf, logging_setup
-from prometheus_client import make_asgi_app
-from utils import CommandError, execute
+from kubernetes import client, config
+from kubernetes.client.rest import ApiException
+from monitorctl import monitored_processes
+from prometheus_client import REGISTRY, make_asgi_app
+from prometheus_client.parser import text_string_to_metric_families
+from resourceutils import pod_metrics
+
+# Maximum number of pods scraped concurrently and the time
+# to wait for each pod before reporting it as down.
+SCRAPE_CONCURRENCY = int(os.environ.get("METRICS_SCRAPE_CONCURRENCY", "32"))
+SCRAPE_TIMEOUT = float(os.environ.get("METRICS_SCRAPE_TIMEOUT", "5"))
+
+# Metrics are collected from all pods once in this interval, both
+# /metrics and /metrics.json are served from the latest snapshot.
+COLLECT_INTERVAL = float(os.environ.get("METRICS_COLLECT_INTERVAL", "30"))
+
+# Metrics exported by the operator process (main.py)
+OPERATOR_METRICS_PORT = int(os.environ.get("OPERATOR_METRICS_PORT", "8051"))
+
+NAMESPACE = os.environ.get("KADALU_NAMESPACE", "kadalu")
+
+HTTP_CLIENT = None
+SCRAPE_SEMAPHORE = None
+POD_INFORMER = None
+CORE_V1_CLIENT = None
+SNAPSHOT = None
+OPERATOR_METRICS_TEXT = ""
+REFRESH_TASK = None
 
 metrics_app = FastAPI()
 
@@ -27,66 +55,80 @@ class Metrics:
         self.storages = []
         self.provisioner = {}
         self.nodeplugins = []
+        self.scrapes = {}
+        self.timestamp = 0
 
 
-def get_pod_data():
-    """ Get pod and container info of all Pods in kadalu namespace """
+def start_pod_informer():
+    """
+    Start watching Kadalu pods, scrapes read the pod details
+    from this cache instead of listing the pods every time.
+    """
+    global POD_INFORMER, CORE_V1_CLIENT    # noqa # pylint: disable=global-statement
 
-    cmd = ["kubectl", "get", "pods", "-l", "app.kubernetes.io/part-of=kadalu",
-            "--field-selector=status.phase==Running", "-nkadalu", "-ojson"]
+    config.load_incluster_config()
+    CORE_V1_CLIENT = client.CoreV1Api()
 
-    try:
-        resp = execute(cmd)
-    except CommandError as err:
-        logging.error(logf(
-            "Failed to execute the command",
-            command=cmd,
-            error=err
-        ))
+    POD_INFORMER = Informer(
+        "pods",
+        CORE_V1_CLIENT.list_namespaced_pod,
+        NAMESPACE,
+        label_selector="app.kubernetes.io/part-of=kadalu",
+        field_selector="status.phase==Running"
+    )
+    POD_INFORMER.start()
 
-    data = json.loads(resp.stdout)
-    pod_data = {}
 
-    for item in data["items"]:
+def get_pod_details(pod):
+    """ Pod IP, phase and container readiness of a Pod object """
 
-        pod_name = item["metadata"]["name"]
-        pod_phase = item["status"]["phase"]
+    # Handle this as "Internal Server Err"
+    ip_addr = "0"
+    if pod.status.pod_ip is not None:
+        ip_addr = pod.status.pod_ip
 
-        # Handle this as "Internal Server Err"
-        ip_addr = "0"
-        if "podIP" in item["status"]:
-            ip_addr = item["status"]["podIP"]
+    pod_details = {
+        "ip_address": ip_addr,
+        "pod_phase": pod.status.phase
+    }
 
-        pod_data[pod_name] = {
-            "ip_address": ip_addr,
-            "pod_phase": pod_phase
-        }
+    # Container Information
+    containers = []
+    number_of_ready_containers = 0
+    for container in pod.status.container_statuses or []:
 
-        # Container Information
-        containers = []
-        number_of_ready_containers = 0
-        for container in item["status"]["containerStatuses"]:
+        is_ready = container.ready
+        is_started = bool(container.started)
+        start_time = 0
 
-            container_name = container["name"]
-            is_ready = container["ready"]
-            is_started = container["started"]
-            start_time = 0
+        if is_ready and is_started and container.state.running is not None:
+            number_of_ready_containers += 1
+            start_time = container.state.running.started_at.isoformat()
 
-            if is_ready and is_started:
-                number_of_ready_containers += 1
-                start_time = container["state"]["running"].get("startedAt")
+        containers.append({
+            "container_name": container.name,
+            "is_ready": is_ready,
+            "is_started": is_started,
+            "start_time": start_time
+        })
 
-            container = {
-                "container_name": container_name,
-                "is_ready": is_ready,
-                "is_started": is_started,
-                "start_time": start_time
-            }
-            containers.append(container)
+    pod_details["total_number_of_containers"] = len(containers)
+    pod_details["number_of_ready_containers"] = number_of_ready_containers
+    pod_details["containers"] = containers
 
-        pod_data[pod_name]["total_number_of_containers"] = len(containers)
-        pod_data[pod_name]["number_of_ready_containers"] = number_of_ready_containers
-        pod_data[pod_name]["containers"] = containers
+    return pod_details
+
+
+def get_pod_data():
+    """ Get pod and container info of all Pods in kadalu namespace """
+
+    pod_data = {}
+    if POD_INFORMER is None or not POD_INFORMER.has_synced():
+        logging.warning(logf("Pods cache is not synced yet"))
+        return pod_data
+
+    for pod in POD_INFORMER.list():
+        pod_data[pod.metadata.name] = get_pod_details(pod)
 
     return pod_data
 
@@ -97,39 +139,29 @@ def get_storage_config_data():
     related data from configmap for all volumes
     """
 
-    cmd = ["kubectl", "get", "configmap", "kadalu-info", "-nkadalu", "-ojson"]
-
     storage_config_data = {}
     try:
-        resp = execute(cmd)
-    except CommandError as err:
+        storage_infos = storageinfo.list_storage_info(CORE_V1_CLIENT)
+    except ApiException as err:
         logging.error(logf(
             "Failed to get brick data from configmap",
             error=err
         ))
         return None
 
-    config_data = json.loads(resp.stdout)
-
-    data = config_data['data']
-
     list_of_storages = []
     brick_data = {}
     storage_type_data = {}
 
-    for key, value in data.items():
-        if key.endswith('info'):
-            key = key.rstrip(".info")
-            value = json.loads(value)
+    for key, value in storage_infos.items():
+        list_of_storages.append(key)
+        storage_type_data[key] = value["type"]
 
-            list_of_storages.append(key)
-            storage_type_data[key] = value["type"]
-
-            # There'll be no metrics wrt Pool for external type
-            if value["type"] == "External":
-                continue
+        # There'll be no metrics wrt Pool for external type
+        if value["type"] == "External":
+            continue
 
-            brick_data[key] = value["bricks"]
+        brick_data[key] = value["bricks"]
 
     storage_config_data["list_of_storages"] = list_of_storages
     storage_config_data["brick_data"] = brick_data
@@ -201,56 +233,30 @@ def set_default_values(metrics):
 def set_operator_data(metrics):
     """Update operator related metrics"""
 
-    # Return -1 if unable to fetch 'cgroup' data,
-    # until new method is found to get CPU & Memory data in LXD containers.
-    memory_usage_in_bytes = -1
-    cpu_usage_in_nanoseconds = -1
-
-    # CPU (cgroup2)
-    if os.path.exists('/sys/fs/cgroup/cpu.stat'):
-        with open('/sys/fs/cgroup/cpu.stat', 'r') as cpu_fd:
-            for line in cpu_fd: # loop over all lines till we find usage_usec
-                if re.search('usage_usec', line):
-                    # Convert from usec (microseconds) to nanoseconds
-                    cpu_usage_in_nanoseconds = int(line.split(' ')[1]) * 1000
-
-    # CPU (cgroup)
-    elif os.path.exists('/sys/fs/cgroup/cpu/cpuacct.usage'):
-        with open('/sys/fs/cgroup/cpu/cpuacct.usage', 'r') as cpu_fd:
-            cpu_usage_in_nanoseconds = int(cpu_fd.read().strip())
-
-    # Memory (cgroup2)
-    if os.path.exists('/sys/fs/cgroup/system.slice/memory.current'):
-        with open('/sys/fs/cgroup/system.slice/memory.current', 'r') as memory_fd:
-            memory_usage_in_bytes = int(memory_fd.read().strip())
-
-    # Memory (cgroup)
-    elif os.path.exists('/sys/fs/cgroup/memory/memory.usage_in_bytes'):
-        with open('/sys/fs/cgroup/memory/memory.usage_in_bytes', 'r') as memory_fd:
-            memory_usage_in_bytes = int(memory_fd.read().strip())
-
-    metrics.operator = {
-        "memory_usage_in_bytes": memory_usage_in_bytes,
-        "cpu_usage_in_nanoseconds": cpu_usage_in_nanoseconds
-    }
+    # Stats which are not available are returned as -1
+    # (For example, in LXD containers)
+    metrics.operator = pod_metrics()
+    metrics.operator["monitor"] = monitored_processes()
 
 
-def set_nodeplugin_data(response, metrics, pod_name, pod_details):
+def set_nodeplugin_data(data, metrics, pod_name, pod_details):
     """ Update nodeplugin related metrics"""
 
     for nodeplugin in metrics.nodeplugins:
         if nodeplugin["pod_name"] in pod_name:
-            nodeplugin.update(response.json()["pod"])
+            nodeplugin.update(data["pod"])
+            nodeplugin["processes"] = data.get("processes", [])
+            nodeplugin["monitor"] = data.get("monitor", [])
             nodeplugin.update(pod_details)
 
 
-def set_provisioner_data(response, metrics, pod_name, pod_details):
+def set_provisioner_data(data, metrics, pod_name, pod_details):
     """ Update provisioner related metrics"""
 
     # Data from provisioner is the source of truth
     # Update only those metrics.storages data which is present in
     # provisioner, rest will remain with default values.
-    storage_data_from_csi = response.json()["storages"]
+    storage_data_from_csi = data["storages"]
 
     for index, storage in enumerate(metrics.storages):
         try:
@@ -267,11 +273,13 @@ def set_provisioner_data(response, metrics, pod_name, pod_details):
             break
 
     metrics.provisioner.update({"pod_name": pod_name})
-    metrics.provisioner.update(response.json()["pod"])
+    metrics.provisioner.update(data["pod"])
+    metrics.provisioner["processes"] = data.get("processes", [])
+    metrics.provisioner["monitor"] = data.get("monitor", [])
     metrics.provisioner.update(pod_details)
 
 
-def set_server_data(response, metrics, pod_name, pod_details):
+def set_server_data(data, metrics, pod_name, pod_details):
     """ Updates server[storage-pool(s) & its brick(s)] related metrics"""
 
     # Assumes CSI Pod is healthy and able to retrieve server data from its mount points,
@@ -283,19 +291,91 @@ def set_server_data(response, metrics, pod_name, pod_details):
                 brick_name = brick["node"].rstrip("."+storage["name"])
 
                 if brick_name in pod_name:
-                    brick.update(response.json()["pod"])
+                    brick.update(data["pod"])
+                    brick["processes"] = data.get("processes", [])
+                    brick["monitor"] = data.get("monitor", [])
+                    brick["fops"] = data.get("fops", {})
+                    brick["heal"] = data.get("heal", [])
                     brick.update(pod_details)
 
 
-def collect_all_metrics():
-    """ Collect all metrics data from different listening pods """
+def get_http_client():
+    """
+    Shared HTTP client, keeps the connections to pod exporters
+    alive across scrapes. Created on first use so that it
+    belongs to the event loop run by uvicorn.
+    """
+    global HTTP_CLIENT    # noqa # pylint: disable=global-statement
+    if HTTP_CLIENT is None:
+        HTTP_CLIENT = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=SCRAPE_CONCURRENCY,
+                max_keepalive_connections=SCRAPE_CONCURRENCY
+            ),
+            timeout=SCRAPE_TIMEOUT
+        )
+
+    return HTTP_CLIENT
+
+
+def get_scrape_semaphore():
+    """Caps the number of pods scraped concurrently"""
+    global SCRAPE_SEMAPHORE    # noqa # pylint: disable=global-statement
+    if SCRAPE_SEMAPHORE is None:
+        SCRAPE_SEMAPHORE = asyncio.Semaphore(SCRAPE_CONCURRENCY)
+
+    return SCRAPE_SEMAPHORE
+
+
+async def fetch_pod_metrics(pod_name, pod_details):
+    """
+    Fetch metrics from a pod's exporter. Returns the parsed
+    response or None if the pod did not respond within
+    the deadline, along with the time taken.
+    """
+    start_time = time.monotonic()
+    try:
+        async with get_scrape_semaphore():
+            response = await asyncio.wait_for(
+                get_http_client().get(
+                    'http://'+ pod_details["ip_address"] +':8050/_api/metrics'),
+                timeout=SCRAPE_TIMEOUT)
+
+        if response.status_code == 200:
+            return (response.json(), time.monotonic() - start_time)
+
+        logging.error(logf(
+            "Unexpected response from the pod, displaying only default values",
+            pod_name=pod_name,
+            status_code=response.status_code
+        ))
+    except (httpx.HTTPError, asyncio.TimeoutError, ValueError) as err:
+        logging.error(logf(
+            "Unable to reach the pod, displaying only default values",
+            pod_name=pod_name,
+            error=repr(err)
+        ))
+
+    return (None, time.monotonic() - start_time)
+
+
+async def collect_all_metrics():
+    """
+    Collect all metrics data from different listening pods.
+    Pods are scraped concurrently, pods which are not reachable
+    within the deadline are reported with default values.
+    """
 
     metrics = Metrics()
 
-    set_default_values(metrics)
-    set_operator_data(metrics)
+    # Reading the storage info from the API and the Monitor
+    # status over its socket are blocking, run them outside
+    # the event loop so that other requests are not stalled.
+    await asyncio.to_thread(set_default_values, metrics)
+    await asyncio.to_thread(set_operator_data, metrics)
 
-    pod_data =get_pod_data()
+    pod_data = get_pod_data()
+    scrape_pods = []
     for pod_name, pod_details in pod_data.items():
 
         # skip GET request to operator
@@ -304,55 +384,176 @@ def collect_all_metrics():
             metrics.operator.update(pod_details)
             continue
 
-        try:
-            response = requests.get(
-                'http://'+ pod_details["ip_address"] +':8050/_api/metrics',
-                timeout=10)
+        scrape_pods.append((pod_name, pod_details))
 
-            if response.status_code == 200:
-                if "nodeplugin" in pod_name:
-                    set_nodeplugin_data(response, metrics, pod_name, pod_details)
+    results = await asyncio.gather(*[
+        fetch_pod_metrics(pod_name, pod_details)
+        for pod_name, pod_details in scrape_pods
+    ])
 
-                if "provisioner" in pod_name:
-                    set_provisioner_data(response, metrics, pod_name, pod_details)
+    for (pod_name, pod_details), (data, duration) in zip(scrape_pods, results):
+        metrics.scrapes[pod_name] = {
+            "up": 0 if data is None else 1,
+            "duration_seconds": duration
+        }
 
-                if "server" in pod_name:
-                    set_server_data(response, metrics, pod_name, pod_details)
+        if data is None:
+            continue
 
+        if "nodeplugin" in pod_name:
+            set_nodeplugin_data(data, metrics, pod_name, pod_details)
 
-        except requests.exceptions.RequestException as err:
-            logging.error(logf(
-                "Unable to reach the pod, displaying only default values",
-                pod_name=pod_name,
-                error=err
-            ))
+        if "provisioner" in pod_name:
+            set_provisioner_data(data, metrics, pod_name, pod_details)
+
+        if "server" in pod_name:
+            set_server_data(data, metrics, pod_name, pod_details)
 
     return metrics
 
 
-def collect_and_set_prometheus_metrics():
-    """ Add all metrics data to prometheus labels """
+def set_resource_metrics(name, pod):
+    """
+    Set resource usage metrics of a Pod and its Gluster
+    processes. Pods which are not reachable will have only
+    memory and CPU usage set to -1.
+    """
+    storage_metrics.memory_usage.labels(name).set(pod["memory_usage_in_bytes"])
+    storage_metrics.cpu_usage.labels(name).set(pod["cpu_usage_in_nanoseconds"])
+
+    if "memory_limit_in_bytes" in pod:
+        storage_metrics.memory_limit.labels(name).set(pod["memory_limit_in_bytes"])
+
+    throttling = pod.get("cpu_throttling", {})
+    if "throttled_ns" in throttling:
+        storage_metrics.cpu_throttled.labels(name).set(throttling["throttled_ns"])
+
+    io_stats = pod.get("io", {})
+    if "read_bytes" in io_stats:
+        storage_metrics.io_read_bytes.labels(name).set(io_stats["read_bytes"])
+        storage_metrics.io_write_bytes.labels(name).set(io_stats["write_bytes"])
+
+    for resource, psi in pod.get("pressure", {}).items():
+        for kind in ["some", "full"]:
+            if kind in psi:
+                storage_metrics.pressure_avg10.labels(
+                    name, resource, kind).set(psi[kind].get("avg10", -1))
+
+    for proc in pod.get("processes", []):
+        storage_metrics.process_memory_usage.labels(
+            name, proc["process"], proc["storage"]).set(proc["memory_usage_in_bytes"])
+        storage_metrics.process_cpu_usage.labels(
+            name, proc["process"], proc["storage"]).set(proc["cpu_usage_in_nanoseconds"])
+
+    # Processes supervised by the Monitor of the Pod
+    for proc in pod.get("monitor", []):
+        storage_metrics.monitor_process_up.labels(
+            name, proc["name"]).set(1 if proc["running"] else 0)
+        storage_metrics.monitor_process_restarts.labels(
+            name, proc["name"]).set(proc["restarts"])
+        storage_metrics.monitor_process_crash_loop.labels(
+            name, proc["name"]).set(1 if proc.get("crash_loop") else 0)
+        storage_metrics.monitor_process_restart_backoff.labels(
+            name, proc["name"]).set(proc.get("next_restart_in_seconds", 0))
+
+
+FOP_GAUGES = {
+    "calls": storage_metrics.fop_calls,
+    "failures": storage_metrics.fop_failures,
+    "latency_min_usec": storage_metrics.fop_latency_min,
+    "latency_avg_usec": storage_metrics.fop_latency_avg,
+    "latency_max_usec": storage_metrics.fop_latency_max
+}
+
+
+def set_fop_metrics(fops):
+    """
+    Per FOP calls and latency, and bytes read/written of a Storage
+    unit from its io-stats dump (cumulative and last interval).
+    """
+    if not fops:
+        return
+
+    storage = fops["storage"]
+    storage_unit = fops["storage_unit"]
+    for interval in ["cumulative", "interval"]:
+        stats = fops.get(interval, {})
+        for fop, fop_stats in stats.get("fops", {}).items():
+            for stat, value in fop_stats.items():
+                if stat in FOP_GAUGES:
+                    FOP_GAUGES[stat].labels(
+                        storage, storage_unit, fop, interval).set(value)
+
+        if "read_bytes" in stats:
+            storage_metrics.storage_unit_read_bytes.labels(
+                storage, storage_unit, interval).set(stats["read_bytes"])
+        if "write_bytes" in stats:
+            storage_metrics.storage_unit_write_bytes.labels(
+                storage, storage_unit, interval).set(stats["write_bytes"])
+
+
+HEAL_GAUGES = {
+    "heal_pending": storage_metrics.heal_pending_entries,
+    "split_brain": storage_metrics.heal_split_brain_entries,
+    "possibly_healing": storage_metrics.heal_possibly_healing_entries,
+    "heal_rate": storage_metrics.heal_rate
+}
+
+
+def set_heal_metrics(heal):
+    """
+    Heal backlog of the Storage units, reported by the pod of the
+    first Storage unit. Counts are not available if the Storage unit
+    is not connected.
+    """
+    # Pods of the earlier version report only their own unit
+    if isinstance(heal, dict):
+        heal = [heal] if heal else []
+
+    for unit in heal:
+        storage = unit["storage"]
+        storage_unit = unit["storage_unit"]
+        storage_metrics.heal_connected.labels(storage, storage_unit).set(
+            1 if unit.get("status") == "Connected" else 0)
+
+        for key, gauge in HEAL_GAUGES.items():
+            if unit.get(key) is not None:
+                gauge.labels(storage, storage_unit).set(unit[key])
 
-    storage_metrics.clear_all_metrics()
 
-    metrics = collect_all_metrics()
+def set_prometheus_metrics(metrics):
+    """
+    Add all metrics data to prometheus labels. Only the label sets
+    which are not present in this collection are removed.
+    """
 
-    # Operator Metrics
-    storage_metrics.memory_usage.labels(
-        metrics.operator["pod_name"]).set(metrics.operator["memory_usage_in_bytes"])
-    storage_metrics.cpu_usage.labels(
-        metrics.operator["pod_name"]).set(metrics.operator["cpu_usage_in_nanoseconds"])
+    storage_metrics.start_update()
+    storage_metrics.snapshot_timestamp.set(metrics.timestamp)
 
-    storage_metrics.total_number_of_containers.labels(
-        metrics.operator["pod_name"]).set(metrics.operator["total_number_of_containers"])
-    storage_metrics.number_of_ready_containers.labels(
-        metrics.operator["pod_name"]).set(metrics.operator["number_of_ready_containers"])
+    # Freshness of the Pods cache
+    if POD_INFORMER is not None:
+        storage_metrics.informer_cache_age.labels(
+            POD_INFORMER.name).set(POD_INFORMER.cache_age())
+        storage_metrics.informer_watch_restarts.labels(
+            POD_INFORMER.name).set(POD_INFORMER.watch_restarts)
+
+    # Scrape status of each Pod
+    for pod_name, scrape in metrics.scrapes.items():
+        storage_metrics.pod_up.labels(pod_name).set(scrape["up"])
+        storage_metrics.scrape_duration.labels(pod_name).set(scrape["duration_seconds"])
+
+    # Operator Metrics, pod name is not known till the
+    # Pods cache is synced.
+    if "pod_name" in metrics.operator:
+        set_resource_metrics(metrics.operator["pod_name"], metrics.operator)
+
+        storage_metrics.total_number_of_containers.labels(
+            metrics.operator["pod_name"]).set(metrics.operator["total_number_of_containers"])
+        storage_metrics.number_of_ready_containers.labels(
+            metrics.operator["pod_name"]).set(metrics.operator["number_of_ready_containers"])
 
     # Provisioner Metrics
-    storage_metrics.memory_usage.labels(
-        metrics.provisioner["pod_name"]).set(metrics.provisioner["memory_usage_in_bytes"])
-    storage_metrics.cpu_usage.labels(
-        metrics.provisioner["pod_name"]).set(metrics.provisioner["cpu_usage_in_nanoseconds"])
+    set_resource_metrics(metrics.provisioner["pod_name"], metrics.provisioner)
 
     storage_metrics.total_number_of_containers.labels(
         metrics.provisioner["pod_name"]).set(metrics.provisioner["total_number_of_containers"])
@@ -361,10 +562,7 @@ def collect_and_set_prometheus_metrics():
 
     # Nodeplugin(s) Metrics
     for nodeplugin in metrics.nodeplugins:
-        storage_metrics.memory_usage.labels(
-            nodeplugin["pod_name"]).set(nodeplugin["memory_usage_in_bytes"])
-        storage_metrics.cpu_usage.labels(
-            nodeplugin["pod_name"]).set(nodeplugin["cpu_usage_in_nanoseconds"])
+        set_resource_metrics(nodeplugin["pod_name"], nodeplugin)
 
         storage_metrics.total_number_of_containers.labels(
             nodeplugin["pod_name"]).set(nodeplugin["total_number_of_containers"])
@@ -403,32 +601,124 @@ def collect_and_set_prometheus_metrics():
                 pvc["pvc_name"]).set(pvc["free_pvc_inodes"])
 
         for brick in storage.get("bricks", []):
-            storage_metrics.memory_usage.labels(
-                brick["node"].rstrip("."+storage["name"])).set(brick["memory_usage_in_bytes"])
-            storage_metrics.cpu_usage.labels(
-                brick["node"].rstrip("."+storage["name"])).set(brick["cpu_usage_in_nanoseconds"])
+            set_resource_metrics(brick["node"].rstrip("."+storage["name"]), brick)
+            set_fop_metrics(brick.get("fops", {}))
+            set_heal_metrics(brick.get("heal", []))
 
             storage_metrics.total_number_of_containers.labels(
                 brick["node"].rstrip("."+storage["name"])).set(brick["total_number_of_containers"])
             storage_metrics.number_of_ready_containers.labels(
                 brick["node"].rstrip("."+storage["name"])).set(brick["number_of_ready_containers"])
 
+    storage_metrics.remove_stale_metrics()
+
+
+class OperatorMetricsCollector:
+    """
+    Includes the Kadalu metrics exported by the operator process
+    (For example, number of manifests applied and skipped)
+    """
+    # pylint: disable=too-few-public-methods
+    def collect(self):
+        """ Metric families from the last fetched operator metrics """
+        for family in text_string_to_metric_families(OPERATOR_METRICS_TEXT):
+            # Skip process and python metrics of the operator process
+            if family.name.startswith("kadalu_"):
+                yield family
+
+
+async def fetch_operator_metrics():
+    """ Fetch the metrics exported by the operator process """
+    global OPERATOR_METRICS_TEXT    # noqa # pylint: disable=global-statement
+
+    try:
+        response = await get_http_client().get(
+            "http://127.0.0.1:%d/metrics" % OPERATOR_METRICS_PORT)
+        if response.status_code == 200:
+            OPERATOR_METRICS_TEXT = response.text
+    except httpx.HTTPError as err:
+        logging.error(logf(
+            "Unable to fetch operator metrics",
+            error=repr(err)
+        ))
+
+
+async def collect_snapshot():
+    """ Collect metrics from all pods and update the snapshot """
+    global SNAPSHOT    # noqa # pylint: disable=global-statement
+
+    metrics = await collect_all_metrics()
+    await fetch_operator_metrics()
+    metrics.timestamp = time.time()
+    set_prometheus_metrics(metrics)
+    SNAPSHOT = metrics
+
+    return metrics
+
+
+async def refresh_snapshot():
+    """
+    Refresh the snapshot. If a refresh is already in progress,
+    wait for it instead of starting one more fan-out.
+    """
+    global REFRESH_TASK    # noqa # pylint: disable=global-statement
+
+    if REFRESH_TASK is None or REFRESH_TASK.done():
+        REFRESH_TASK = asyncio.create_task(collect_snapshot())
+
+    # Shield so that a client disconnect doesn't cancel the
+    # refresh other requests are waiting for.
+    return await asyncio.shield(REFRESH_TASK)
+
+
+async def get_snapshot():
+    """
+    Latest snapshot, refreshed on demand if the collector
+    loop has not produced one within the interval.
+    """
+    if SNAPSHOT is None or time.time() - SNAPSHOT.timestamp > COLLECT_INTERVAL:
+        return await refresh_snapshot()
+
+    return SNAPSHOT
+
+
+async def collector_loop():
+    """ Refresh the snapshot every COLLECT_INTERVAL seconds """
+    while True:
+        try:
+            await refresh_snapshot()
+        except Exception as err:  # noqa # pylint: disable=broad-except
+            logging.error(logf(
+                "Failed to collect metrics",
+                error=err
+            ))
+
+        await asyncio.sleep(COLLECT_INTERVAL)
+
+
+@metrics_app.on_event("startup")
+async def startup():
+    """ Start the Pods cache and the collector once the server is started """
+    start_pod_informer()
+    asyncio.create_task(collector_loop())
+
 
 @metrics_app.middleware("http")
 async def collect_metrics(request, call_next):
-    """ Collect metrics and set data to prometheus at /metrics """
+    """ Make sure prometheus labels are from a recent snapshot at /metrics """
     if request.url.path == "/metrics":
-        collect_and_set_prometheus_metrics()
+        await get_snapshot()
 
     return await call_next(request)
 
 
 @metrics_app.get("/metrics.json")
 async def metrics_json():
-    """ Return collected metrics in JSON format at /metrics.json """
-    return collect_all_metrics()
+    """ Return latest snapshot of metrics in JSON format at /metrics.json """
+    return await get_snapshot()
 
 
+REGISTRY.register(OperatorMetricsCollector())
 metrics_app.mount("/metrics", make_asgi_app())
 
 if __name__ == "__main__":
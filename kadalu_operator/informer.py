@@ -0,0 +1,430 @@
+"""
+Informer: Keeps an in-memory cache of Kubernetes objects in sync
+using list and watch. Watch is resumed from the last seen
+resourceVersion and the objects are relisted only when the
+API server reports that the resourceVersion is too old (410 Gone).
+
+WorkQueue: Keyed queue of events, events of the same key which
+are not yet processed are coalesced into one.
+
+Usage:
+
+    pods = Informer("pods", core_v1_client.list_namespaced_pod,
+                    "kadalu", label_selector="app.kubernetes.io/part-of=kadalu")
+    pods.add_index("node", lambda pod: [pod.spec.node_name])
+    pods.set_transform(lambda pod: ...)   # Optional, to cache less
+    pods.add_event_handler(lambda event_type, obj, old_obj: ...)
+    pods.start()
+    pods.wait_for_sync()
+
+    for pod in pods.list():
+        ...
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+
+from kadalulib import logf
+from kubernetes import watch
+from kubernetes.client.rest import ApiException
+from urllib3.exceptions import HTTPError
+
+HTTP_STATUS_GONE = 410
+
+# Watch requests are closed by the server after this timeout and
+# resumed from the last resourceVersion. Keeps the connection
+# from silently hanging.
+WATCH_TIMEOUT_SECONDS = 300
+
+# Wait time before restarting a watch after an error
+WATCH_RETRY_INTERVAL_SECONDS = 5
+
+EVENT_ADDED = "ADDED"
+EVENT_MODIFIED = "MODIFIED"
+EVENT_DELETED = "DELETED"
+EVENT_BOOKMARK = "BOOKMARK"
+
+
+def get_metadata(obj):
+    """
+    Returns (namespace, name, resourceVersion) of the object. Supports
+    both the models returned by typed APIs (Like CoreV1Api) and
+    the dicts returned by CustomObjectsApi.
+    """
+    if isinstance(obj, dict):
+        metadata = obj.get("metadata", {})
+        return (metadata.get("namespace", ""), metadata.get("name", ""),
+                metadata.get("resourceVersion", ""))
+
+    return (obj.metadata.namespace or "", obj.metadata.name or "",
+            obj.metadata.resource_version or "")
+
+
+def get_list_resource_version(resp):
+    """resourceVersion of the List response"""
+    if isinstance(resp, dict):
+        return resp.get("metadata", {}).get("resourceVersion", "")
+
+    return resp.metadata.resource_version
+
+
+def get_list_items(resp):
+    """Items of the List response"""
+    if isinstance(resp, dict):
+        return resp.get("items", [])
+
+    return resp.items
+
+
+def default_key(obj):
+    """Cache key of the object, "<namespace>/<name>" or "<name>" """
+    namespace, name, _ = get_metadata(obj)
+    if namespace:
+        return "%s/%s" % (namespace, name)
+
+    return name
+
+
+class Informer:
+    """
+    List and Watch the objects returned by the given list function
+    and maintain an in-memory cache with optional indexes.
+    """
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, name, list_func, *args, **kwargs):
+        self.name = name
+        self.list_func = list_func
+        self.args = args
+        self.kwargs = kwargs
+        self.key_func = default_key
+        self.transform = None
+        self.cache = {}
+        self.indexers = {}
+        self.indices = {}
+        self.handlers = []
+        self.lock = threading.RLock()
+        self.synced = threading.Event()
+        self.resource_version = ""
+        self.last_sync_time = 0
+        self.watch_restarts = 0
+        self.relists = 0
+        self.thread = None
+        self.stopped = False
+
+    def add_index(self, index_name, index_func):
+        """
+        Index the cached objects by the values returned by
+        index_func(obj). Should be called before start.
+        """
+        self.indexers[index_name] = index_func
+        self.indices[index_name] = {}
+
+    def set_transform(self, transform):
+        """
+        Objects are cached as returned by transform(obj), useful to keep
+        only the required fields of large lists. The transformed object
+        should retain the metadata (namespace, name and resourceVersion).
+        """
+        self.transform = transform
+
+    def add_event_handler(self, handler):
+        """
+        handler(event_type, obj, old_obj) is called after the cache
+        is updated. Handlers are called from the Informer thread and
+        should not block.
+        """
+        self.handlers.append(handler)
+
+    def _index_add(self, key, obj):
+        for index_name, index_func in self.indexers.items():
+            for value in index_func(obj):
+                self.indices[index_name].setdefault(value, set()).add(key)
+
+    def _index_remove(self, key, obj):
+        for index_name, index_func in self.indexers.items():
+            for value in index_func(obj):
+                keys = self.indices[index_name].get(value, set())
+                keys.discard(key)
+                if not keys:
+                    self.indices[index_name].pop(value, None)
+
+    def _notify(self, event_type, obj, old_obj):
+        for handler in self.handlers:
+            try:
+                handler(event_type, obj, old_obj)
+            except Exception as err:  # noqa # pylint: disable=broad-except
+                logging.error(logf(
+                    "Informer event handler failed",
+                    informer=self.name,
+                    event_type=event_type,
+                    error=err
+                ))
+
+    def _update(self, event_type, obj):
+        """Apply a single watch event to the cache"""
+        if self.transform is not None:
+            obj = self.transform(obj)
+        key = self.key_func(obj)
+        with self.lock:
+            old_obj = self.cache.get(key, None)
+            if old_obj is not None:
+                self._index_remove(key, old_obj)
+
+            if event_type == EVENT_DELETED:
+                self.cache.pop(key, None)
+            else:
+                self.cache[key] = obj
+                self._index_add(key, obj)
+
+        self._notify(event_type, obj, old_obj)
+
+    def _replace(self, items):
+        """
+        Replace the cache with the listed objects. Only the
+        differences are notified to the handlers, objects with
+        unchanged resourceVersion are skipped.
+        """
+        new_cache = {}
+        for obj in items:
+            if self.transform is not None:
+                obj = self.transform(obj)
+            new_cache[self.key_func(obj)] = obj
+
+        events = []
+        with self.lock:
+            for key, old_obj in self.cache.items():
+                if key not in new_cache:
+                    events.append((EVENT_DELETED, old_obj, old_obj))
+
+            for key, obj in new_cache.items():
+                old_obj = self.cache.get(key, None)
+                if old_obj is None:
+                    events.append((EVENT_ADDED, obj, None))
+                elif get_metadata(old_obj)[2] != get_metadata(obj)[2]:
+                    events.append((EVENT_MODIFIED, obj, old_obj))
+
+            self.cache = new_cache
+            for index_name in self.indices:
+                self.indices[index_name] = {}
+            for key, obj in new_cache.items():
+                self._index_add(key, obj)
+
+        for event_type, obj, old_obj in events:
+            self._notify(event_type, obj, old_obj)
+
+    def relist(self):
+        """List all the objects and replace the cache"""
+        resp = self.list_func(*self.args, **self.kwargs)
+        self._replace(get_list_items(resp))
+        self.resource_version = get_list_resource_version(resp)
+        self.last_sync_time = time.time()
+        self.relists += 1
+        self.synced.set()
+        logging.info(logf(
+            "Informer cache synced",
+            informer=self.name,
+            objects=len(self.cache),
+            resource_version=self.resource_version
+        ))
+
+    def watch(self):
+        """Watch from the last seen resourceVersion till the stream ends"""
+        k8s_watch = watch.Watch()
+        for event in k8s_watch.stream(
+                self.list_func, *self.args,
+                resource_version=self.resource_version,
+                allow_watch_bookmarks=True,
+                timeout_seconds=WATCH_TIMEOUT_SECONDS,
+                **self.kwargs):
+            if self.stopped:
+                k8s_watch.stop()
+                return
+
+            obj = event["object"]
+            resource_version = get_metadata(obj)[2]
+            if event["type"] != EVENT_BOOKMARK:
+                self._update(event["type"], obj)
+
+            if resource_version:
+                self.resource_version = resource_version
+            self.last_sync_time = time.time()
+
+    def run(self):
+        """List once and keep watching, relist only on 410 Gone"""
+        while not self.stopped:
+            try:
+                if not self.resource_version:
+                    self.relist()
+                self.watch()
+                # Watch timed out normally, resume from last
+                # seen resourceVersion.
+                continue
+            except ApiException as err:
+                if err.status == HTTP_STATUS_GONE:
+                    logging.info(logf(
+                        "Informer resourceVersion expired, relisting",
+                        informer=self.name,
+                        resource_version=self.resource_version
+                    ))
+                    self.resource_version = ""
+                    continue
+
+                logging.error(logf(
+                    "Informer watch failed",
+                    informer=self.name,
+                    status=err.status,
+                    reason=err.reason
+                ))
+            except (HTTPError, OSError) as err:
+                logging.warning(logf(
+                    "Informer watch connection broken",
+                    informer=self.name,
+                    error=err
+                ))
+
+            self.watch_restarts += 1
+            time.sleep(WATCH_RETRY_INTERVAL_SECONDS)
+
+    def start(self):
+        """Start the Informer in a background thread"""
+        self.thread = threading.Thread(target=self.run, daemon=True,
+                                       name="informer-%s" % self.name)
+        self.thread.start()
+
+    def stop(self):
+        """Stop watching after the next event"""
+        self.stopped = True
+
+    def wait_for_sync(self, timeout=None):
+        """Wait till the first list is complete"""
+        return self.synced.wait(timeout)
+
+    def has_synced(self):
+        """True if the cache is populated at least once"""
+        return self.synced.is_set()
+
+    def cache_age(self):
+        """Seconds since the last list, watch event or bookmark"""
+        if self.last_sync_time == 0:
+            return -1
+
+        return time.time() - self.last_sync_time
+
+    def get(self, key):
+        """Cached object with the given key"""
+        with self.lock:
+            return self.cache.get(key, None)
+
+    def list(self):
+        """All the cached objects"""
+        with self.lock:
+            return list(self.cache.values())
+
+    def by_index(self, index_name, value):
+        """Cached objects matching the index value"""
+        with self.lock:
+            keys = self.indices[index_name].get(value, set())
+            return [self.cache[key] for key in keys if key in self.cache]
+
+    def index_count(self, index_name, value):
+        """Number of cached objects matching the index value"""
+        with self.lock:
+            return len(self.indices[index_name].get(value, set()))
+
+    def index_values(self, index_name):
+        """All values of an index along with number of objects"""
+        with self.lock:
+            return {value: len(keys)
+                    for value, keys in self.indices[index_name].items()}
+
+
+def coalesce_events(pending_type, new_type):
+    """
+    Event type to reconcile when a new event arrives for a key which
+    is not yet processed. Latest event wins except,
+
+    - ADDED followed by MODIFIED is still ADDED (Not yet deployed)
+    - DELETED followed by ADDED is MODIFIED (Not yet undeployed)
+    """
+    if pending_type == EVENT_ADDED and new_type == EVENT_MODIFIED:
+        return EVENT_ADDED
+
+    if pending_type == EVENT_DELETED and new_type == EVENT_ADDED:
+        return EVENT_MODIFIED
+
+    return new_type
+
+
+class WorkQueue:
+    """
+    FIFO queue of keys with the latest event and object of each key.
+    A burst of events of a key results in a single reconcile.
+
+    Multiple workers can get from the queue, a key is given to only
+    one worker at a time. Events received while a key is being
+    processed are queued again once the worker calls done(key).
+    """
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.keys = deque()
+        self.pending = {}
+        self.processing = set()
+
+    def add(self, key, event_type, obj, if_absent=False):
+        """
+        Add or coalesce the event. With if_absent=True, the event is
+        dropped if an event of the key is already pending (Used for
+        retries so that an old object doesn't replace a newer one).
+        """
+        with self.cond:
+            if key in self.pending:
+                if if_absent:
+                    return
+
+                pending_type, _ = self.pending[key]
+                self.pending[key] = (coalesce_events(pending_type, event_type), obj)
+                return
+
+            self.pending[key] = (event_type, obj)
+
+            # Will be queued when the worker processing it is done
+            if key in self.processing:
+                return
+
+            self.keys.append(key)
+            self.cond.notify()
+
+    def add_after(self, key, event_type, obj, delay):
+        """Add the event after the delay, unless a newer one is pending"""
+        timer = threading.Timer(delay, self.add, args=(key, event_type, obj),
+                                kwargs={"if_absent": True})
+        timer.daemon = True
+        timer.start()
+
+    def get(self):
+        """
+        Wait for the next key and return (key, event_type, obj).
+        done(key) should be called after processing.
+        """
+        with self.cond:
+            while not self.keys:
+                self.cond.wait()
+
+            key = self.keys.popleft()
+            event_type, obj = self.pending.pop(key)
+            self.processing.add(key)
+            return (key, event_type, obj)
+
+    def done(self, key):
+        """Mark the key as processed, requeue if new events arrived"""
+        with self.cond:
+            self.processing.discard(key)
+            if key in self.pending:
+                self.keys.append(key)
+                self.cond.notify()
+
+    def __len__(self):
+        with self.cond:
+            return len(self.keys)
@@ -0,0 +1,196 @@
+"""
+Apply Kubernetes manifests from the operator without forking kubectl.
+
+Templates are compiled once and rendered to objects in memory. A hash
+of each object is stored in the "kadalu.io/manifest-hash" annotation
+and the object is applied (Server-side apply) only if the hash of the
+deployed object is different.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import yaml
+from jinja2 import Template
+from kadalulib import logf
+from kubernetes import client
+from kubernetes.dynamic import DynamicClient
+from kubernetes.dynamic.exceptions import NotFoundError
+from prometheus_client import Counter
+
+NAMESPACE = os.environ.get("KADALU_NAMESPACE", "kadalu")
+FIELD_MANAGER = "kadalu-operator"
+HASH_ANNOTATION = "kadalu.io/manifest-hash"
+
+# Hash of the applied objects are remembered for this duration,
+# after that the deployed object is fetched to compare the hash.
+# Helps to recover if the object is modified or deleted outside
+# the operator.
+APPLIED_CACHE_TTL = int(os.environ.get("APPLIED_CACHE_TTL", "300"))
+
+apply_total = Counter('kadalu_operator_apply',
+                      'Kadalu Operator Number of Objects Applied', ['kind'])
+apply_skipped_total = Counter('kadalu_operator_apply_skipped',
+                              'Kadalu Operator Number of Objects Skipped since not changed',
+                              ['kind'])
+delete_total = Counter('kadalu_operator_delete',
+                       'Kadalu Operator Number of Objects Deleted', ['kind'])
+
+TEMPLATES = {}
+TEMPLATES_LOCK = threading.Lock()
+
+# (apiVersion, kind, namespace, name) => (hash, time of apply)
+APPLIED = {}
+APPLIED_LOCK = threading.Lock()
+
+DYNAMIC_CLIENT = None
+DYNAMIC_CLIENT_LOCK = threading.Lock()
+
+
+def get_template(filename):
+    """Compiled template of "<filename>.j2", compiled only once"""
+    with TEMPLATES_LOCK:
+        tmpl = TEMPLATES.get(filename, None)
+        if tmpl is None:
+            with open(filename + ".j2") as template_file:
+                tmpl = Template(template_file.read())
+            TEMPLATES[filename] = tmpl
+
+        return tmpl
+
+
+def render(filename, **kwargs):
+    """Render the template and return the list of objects"""
+    content = get_template(filename).render(**kwargs)
+    return [obj for obj in yaml.safe_load_all(content) if obj]
+
+
+def get_dynamic_client():
+    """Dynamic client is created once since it runs API discovery"""
+    global DYNAMIC_CLIENT    # noqa # pylint: disable=global-statement
+    with DYNAMIC_CLIENT_LOCK:
+        if DYNAMIC_CLIENT is None:
+            DYNAMIC_CLIENT = DynamicClient(client.ApiClient())
+
+        return DYNAMIC_CLIENT
+
+
+def manifest_hash(obj):
+    """Hash of the object content excluding the hash annotation"""
+    content = json.dumps(obj, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def object_key(resource, obj):
+    """Key to remember the applied hash"""
+    metadata = obj["metadata"]
+    namespace = ""
+    if resource.namespaced:
+        namespace = metadata.get("namespace", NAMESPACE)
+    return (obj["apiVersion"], obj["kind"], namespace, metadata["name"])
+
+
+def get_resource(obj):
+    """API resource of the object"""
+    return get_dynamic_client().resources.get(api_version=obj["apiVersion"],
+                                              kind=obj["kind"])
+
+
+def deployed_hash(resource, key):
+    """Hash annotation of the deployed object, None if not deployed"""
+    try:
+        if resource.namespaced:
+            deployed = resource.get(name=key[3], namespace=key[2])
+        else:
+            deployed = resource.get(name=key[3])
+    except NotFoundError:
+        return None
+
+    annotations = deployed.metadata.annotations or {}
+    return annotations.get(HASH_ANNOTATION, None)
+
+
+def is_changed(resource, key, obj_hash):
+    """Check with remembered or deployed hash"""
+    with APPLIED_LOCK:
+        applied = APPLIED.get(key, None)
+
+    if applied is not None and time.time() - applied[1] < APPLIED_CACHE_TTL:
+        return applied[0] != obj_hash
+
+    return deployed_hash(resource, key) != obj_hash
+
+
+def apply_object(obj):
+    """
+    Server-side apply the object if changed. Returns True
+    if applied and False if skipped.
+    """
+    obj_hash = manifest_hash(obj)
+    obj.setdefault("metadata", {}).setdefault("annotations", {})
+    obj["metadata"]["annotations"][HASH_ANNOTATION] = obj_hash
+
+    resource = get_resource(obj)
+    key = object_key(resource, obj)
+    if not is_changed(resource, key, obj_hash):
+        apply_skipped_total.labels(obj["kind"]).inc()
+        with APPLIED_LOCK:
+            APPLIED[key] = (obj_hash, time.time())
+        logging.debug(logf("Manifest not changed, skipping apply",
+                           kind=obj["kind"], name=key[3]))
+        return False
+
+    get_dynamic_client().server_side_apply(
+        resource,
+        body=obj,
+        name=key[3],
+        namespace=key[2] or None,
+        field_manager=FIELD_MANAGER,
+        force_conflicts=True
+    )
+    apply_total.labels(obj["kind"]).inc()
+    with APPLIED_LOCK:
+        APPLIED[key] = (obj_hash, time.time())
+
+    return True
+
+
+def apply_template(filename, **kwargs):
+    """
+    Render the template and apply all the objects from it.
+    Returns the number of objects applied.
+    """
+    applied = 0
+    for obj in render(filename, **kwargs):
+        if apply_object(obj):
+            applied += 1
+
+    return applied
+
+
+def delete_object(obj):
+    """Delete the object, ignore if already deleted"""
+    resource = get_resource(obj)
+    key = object_key(resource, obj)
+    with APPLIED_LOCK:
+        APPLIED.pop(key, None)
+
+    try:
+        if resource.namespaced:
+            resource.delete(name=key[3], namespace=key[2])
+        else:
+            resource.delete(name=key[3])
+    except NotFoundError:
+        return
+
+    delete_total.labels(obj["kind"]).inc()
+
+
+def delete_template(filename, **kwargs):
+    """Render the template and delete all the objects from it"""
+    for obj in render(filename, **kwargs):
+        delete_object(obj)
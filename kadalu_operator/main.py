@@ -3,22 +3,28 @@ KaDalu Operator: Once started, deploys required CSI drivers,
 bootstraps the ConfigMap and waits for the CRD update to create
 Server pods
 """
+import copy
 import json
 import logging
 import os
 import re
-import time
+import threading
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 
+import kubeapply
+import storageinfo
+import upgrade
 import urllib3
 from jinja2 import Template
 
+from informer import EVENT_ADDED, EVENT_DELETED, EVENT_MODIFIED, Informer, WorkQueue
 from kadalulib import CommandException
 from kadalulib import execute as lib_execute
 from kadalulib import (is_host_reachable, logf, logging_setup,
                        send_analytics_tracker, get_single_pv_per_pool)
-from kubernetes import client, config, watch
-from urllib3.exceptions import NewConnectionError, ProtocolError
+from kubernetes import client, config
+from prometheus_client import start_http_server
 from utils import CommandError
 from utils import execute as utils_execute
 
@@ -37,6 +43,23 @@ STORAGE_CLASS_NAME_PREFIX = "kadalu."
 VALID_HOSTING_VOLUME_TYPES = ["Replica1", "Replica2", "Replica3",
                               "Disperse", "External", "Arbiter"]
 VALID_PV_RECLAIM_POLICY_TYPES = ["delete", "archive", "retain"]
+# Tuning profiles (See PROFILES in server/serverutils.py)
+PROFILE_OPTION = "kadalu.profile"
+VALID_PROFILES = ["default", "small-file", "large-sequential",
+                  "database", "metadata-heavy"]
+# Allowed values of the Self-Heal-Daemon options. Same as the limits
+# of these options in GlusterFS (afr and ec xlators), the odd looking
+# maximum of shd-wait-qlength (655536, not 65536) is as defined there.
+SHD_MAX_THREADS_MAX = 64
+SHD_WAIT_QLENGTH_MAX = 655536
+SHD_OPTION_RANGES = {
+    "cluster.shd-max-threads": (1, SHD_MAX_THREADS_MAX),
+    "cluster.shd-wait-qlength": (1, SHD_WAIT_QLENGTH_MAX),
+    "disperse.shd-max-threads": (1, SHD_MAX_THREADS_MAX),
+    "disperse.shd-wait-qlength": (1, SHD_WAIT_QLENGTH_MAX)
+}
+# Brick filesystem profiles (See BRICKFS_PROFILES in server/brickfs.py)
+VALID_BRICK_FS_PROFILES = ["default", "small-file", "large-file", "none"]
 VOLUME_TYPE_REPLICA_1 = "Replica1"
 VOLUME_TYPE_REPLICA_2 = "Replica2"
 VOLUME_TYPE_REPLICA_3 = "Replica3"
@@ -51,6 +74,30 @@ PATCH_CMD = "patch"
 
 NODE_PLUGIN = "kadalu-csi-nodeplugin"
 
+# Wait time before reconciling again if handling an event failed
+RECONCILE_RETRY_INTERVAL = 30
+
+# Number of storages reconciled in parallel and the number of
+# server pods of a storage deployed in parallel.
+RECONCILE_WORKERS = int(os.environ.get("RECONCILE_WORKERS", "4"))
+BRICK_APPLY_CONCURRENCY = int(os.environ.get("BRICK_APPLY_CONCURRENCY", "8"))
+
+# Label of server pods with the storage name, pods deployed by
+# earlier versions are matched by the pod name.
+STORAGE_LABEL = "kadalu.io/storage"
+SERVER_POD_SELECTOR = "app.kubernetes.io/component=server"
+SERVER_POD_NAME_RE = re.compile(r"^(server-.+)-[0-9]+-0$")
+INFORMER_SYNC_TIMEOUT = 60
+
+# Caches of server pods (indexed by storage name) and PVs (indexed
+# by storageClassName), started by start_informers()
+SERVER_POD_INFORMER = None
+PV_INFORMER = None
+
+# Operator's own metrics (Manifests applied/skipped), these are
+# included in the metrics exported by exporter.py
+OPERATOR_METRICS_PORT = int(os.environ.get("OPERATOR_METRICS_PORT", "8051"))
+
 def template(filename, **kwargs):
     """Substitute the template with provided fields"""
     content = ""
@@ -73,6 +120,23 @@ def options_validation(options):
             logging.error(logf("Key/Value not specified for Storage Pool Options"))
             return False
 
+        if option.get("key") == PROFILE_OPTION and \
+           option.get("value") not in VALID_PROFILES:
+            logging.error(logf("Invalid tuning profile",
+                               profile=option.get("value"),
+                               valid_profiles=",".join(VALID_PROFILES)))
+            return False
+
+        if option.get("key") in SHD_OPTION_RANGES:
+            min_value, max_value = SHD_OPTION_RANGES[option["key"]]
+            value = str(option.get("value"))
+            if not value.isdigit() or \
+               not min_value <= int(value) <= max_value:
+                logging.error(logf("Invalid Self-Heal-Daemon option value",
+                                   key=option["key"], value=value,
+                                   min_value=min_value, max_value=max_value))
+                return False
+
     return True
 
 
@@ -171,6 +235,13 @@ def validate_volume_request(obj):
     if not options_validation(options):
         return False
 
+    brick_fs_profile = obj["spec"].get("brick_fs_profile", "default")
+    if brick_fs_profile not in VALID_BRICK_FS_PROFILES:
+        logging.error(logf("Invalid brick filesystem profile",
+                           valid_profiles=",".join(VALID_BRICK_FS_PROFILES),
+                           provided_profile=brick_fs_profile))
+        return False
+
     bricks = obj["spec"].get("storage", [])
     if not bricks_validation(bricks):
         return False
@@ -293,21 +364,14 @@ def get_brick_hostname(volname, idx, suffix=True):
     return hostname
 
 
-def upgrade_storage_pods(core_v1_client):
+def storages_to_upgrade(core_v1_client):
     """
-    Upgrade the Storage pods after operator pod upgrade
+    Storages whose pods are to be upgraded after operator pod
+    upgrade, as a list of (volname, voltype, disperse,
+    bricks_template_args). See upgrade.py.
     """
-    # Add new entry in the existing config map
-    configmap_data = core_v1_client.read_namespaced_config_map(
-        KADALU_CONFIG_MAP, NAMESPACE)
-
-    for key in configmap_data.data:
-        if ".info" not in key:
-            continue
-
-        volname = key.replace('.info', '')
-        data = json.loads(configmap_data.data[key])
-
+    storages = []
+    for volname, data in storageinfo.list_storage_info(core_v1_client).items():
         logging.info(logf("config map", volname=volname, data=data))
         if data['type'] == VOLUME_TYPE_EXTERNAL:
             # nothing to be done for upgrade, say we are good.
@@ -317,18 +381,6 @@ def upgrade_storage_pods(core_v1_client):
                 data=data))
             continue
 
-        if data['type'] == VOLUME_TYPE_REPLICA_1:
-            # No promise of high availability, upgrade
-            logging.debug(logf(
-                "volume type Replica1, calling upgrade",
-                volname=volname,
-                data=data))
-            # TODO: call upgrade
-
-        # Replica 2 and Replica 3 needs to check for self-heal
-        # count 0 before going ahead with upgrade.
-
-        # glfsheal volname --file-path=/template/file info-summary
         obj = {}
         obj["metadata"] = {}
         obj["spec"] = {}
@@ -336,6 +388,9 @@ def upgrade_storage_pods(core_v1_client):
         obj["spec"]["type"] = data['type']
         obj["spec"]["pvReclaimPolicy"] = data.get("pvReclaimPolicy", "delete")
         obj["spec"]["volume_id"] = data["volume_id"]
+        # Same profile as deployed, else the upgrade renders the
+        # default profile and the watch rolls the pods again.
+        obj["spec"]["brick_fs_profile"] = data.get("brick_fs_profile", "default")
         obj["spec"]["storage"] = []
 
         # Need this loop so below array can be constructed in the proper order
@@ -352,8 +407,10 @@ def upgrade_storage_pods(core_v1_client):
             obj["spec"]["storage"][idx]["device"] = val["brick_device"]
             obj["spec"]["storage"][idx]["pvc"] = val["pvc_name"]
 
-        # TODO: call upgrade_pods_with_heal_check() here
-        deploy_server_pods(obj)
+        storages.append((volname, data["type"], data.get("disperse", {}),
+                         get_server_pods_template_args(obj)))
+
+    return storages
 
 
 def update_config_map(core_v1_client, obj):
@@ -374,6 +431,7 @@ def update_config_map(core_v1_client, obj):
         "single_pv_per_pool": get_single_pv_per_pool(obj["spec"]),
         "type": voltype,
         "pvReclaimPolicy" : pv_reclaim_policy,
+        "brick_fs_profile": obj["spec"].get("brick_fs_profile", "default"),
         "bricks": [],
         "disperse": {
             "data": disperse_config.get("data", 0),
@@ -382,10 +440,6 @@ def update_config_map(core_v1_client, obj):
         "options": {}
     }
 
-    # Add new entry in the existing config map
-    configmap_data = core_v1_client.read_namespaced_config_map(
-        KADALU_CONFIG_MAP, NAMESPACE)
-
     # Add options entry as key:value
     if obj["spec"].get("options", None):
         options = obj["spec"]["options"]
@@ -420,21 +474,33 @@ def update_config_map(core_v1_client, obj):
 
             data["tiebreaker"] = tiebreaker
 
-    volinfo_file = "%s.info" % volname
-    configmap_data.data[volinfo_file] = json.dumps(data)
+    storageinfo.write_storage_info(core_v1_client, volname, data)
+
+
+def deploy_server_pod(template_args):
+    """
+    Deploy the StatefulSet of a single brick. Returns False
+    if the manifest is not changed.
+    """
+    filename = os.path.join(MANIFESTS_DIR, "server.yaml")
+    if kubeapply.apply_template(filename, **template_args) == 0:
+        logging.debug(logf("Server pod manifest is not changed",
+                           volname=template_args["volname"],
+                           node=template_args["kube_hostname"]))
+        return False
 
-    core_v1_client.patch_namespaced_config_map(
-        KADALU_CONFIG_MAP, NAMESPACE, configmap_data)
-    logging.info(logf("Updated configmap", name=KADALU_CONFIG_MAP,
-                      volname=volname))
+    logging.info(logf("Deployed Server pod",
+                      volname=template_args["volname"],
+                      manifest=filename,
+                      node=template_args["kube_hostname"]))
+    return True
 
 
-def deploy_server_pods(obj):
+def get_server_pods_template_args(obj):
     """
-    Deploy server pods depending on type of Hosting
-    Volume and other options specified
+    Template args of each server pod (One StatefulSet per Brick)
+    depending on type of Hosting Volume and other options specified
     """
-    # Deploy server pod
     volname = obj["metadata"]["name"]
     voltype = obj["spec"]["type"]
     pv_reclaim_policy = obj["spec"].get("pvReclaimPolicy", "delete")
@@ -455,36 +521,49 @@ def deploy_server_pods(obj):
         "voltype": voltype,
         "pvReclaimPolicy": pv_reclaim_policy,
         "volume_id": obj["spec"]["volume_id"],
-        "shd_required": shd_required
+        "shd_required": shd_required,
+        "brick_fs_profile": obj["spec"].get("brick_fs_profile", "default")
     }
 
     # One StatefulSet per Brick
+    bricks_template_args = []
     for idx, storage in enumerate(obj["spec"]["storage"]):
-        template_args["host_brick_path"] = storage.get("path", "")
-        template_args["kube_hostname"] = storage.get("node", "")
+        brick_template_args = dict(template_args)
+        brick_template_args["host_brick_path"] = storage.get("path", "")
+        brick_template_args["kube_hostname"] = storage.get("node", "")
         # TODO: Understand the need, and usage of suffix
-        template_args["serverpod_name"] = get_brick_hostname(
+        brick_template_args["serverpod_name"] = get_brick_hostname(
             volname,
             idx,
             suffix=False
         )
-        template_args["brick_path"] = "/bricks/%s/data/brick" % volname
-        template_args["brick_index"] = idx
-        template_args["brick_device"] = storage.get("device", "")
-        template_args["pvc_name"] = storage.get("pvc", "")
-        template_args["brick_device_dir"] = get_brick_device_dir(storage)
-        template_args["brick_node_id"] = storage["node_id"]
-        template_args["k8s_dist"] = K8S_DIST
-        template_args["verbose"] = VERBOSE
-        template_args["tolerations"] = tolerations
+        brick_template_args["brick_path"] = "/bricks/%s/data/brick" % volname
+        brick_template_args["brick_index"] = idx
+        brick_template_args["brick_device"] = storage.get("device", "")
+        brick_template_args["pvc_name"] = storage.get("pvc", "")
+        brick_template_args["brick_device_dir"] = get_brick_device_dir(storage)
+        brick_template_args["brick_node_id"] = storage["node_id"]
+        brick_template_args["k8s_dist"] = K8S_DIST
+        brick_template_args["verbose"] = VERBOSE
+        brick_template_args["tolerations"] = tolerations
+        bricks_template_args.append(brick_template_args)
+
+    return bricks_template_args
+
+
+def deploy_server_pods(obj):
+    """
+    Deploy server pods depending on type of Hosting
+    Volume and other options specified
+    """
+    bricks_template_args = get_server_pods_template_args(obj)
+    tolerations = obj["spec"].get("tolerations")
+
+    # Apply the StatefulSets in parallel, list() to raise the
+    # exception if any of the apply failed.
+    with ThreadPoolExecutor(max_workers=BRICK_APPLY_CONCURRENCY) as executor:
+        list(executor.map(deploy_server_pod, bricks_template_args))
 
-        filename = os.path.join(MANIFESTS_DIR, "server.yaml")
-        template(filename, **template_args)
-        lib_execute(KUBECTL_CMD, APPLY_CMD, "-f", filename)
-        logging.info(logf("Deployed Server pod",
-                          volname=volname,
-                          manifest=filename,
-                          node=storage.get("node", "")))
     add_tolerations("daemonset", NODE_PLUGIN, tolerations)
 
 
@@ -515,19 +594,9 @@ def handle_external_storage_addition(core_v1_client, obj):
         "gluster_options": details.get("gluster_options", ""),
     }
 
-    # Add new entry in the existing config map
-    configmap_data = core_v1_client.read_namespaced_config_map(
-        KADALU_CONFIG_MAP, NAMESPACE)
-    volinfo_file = "%s.info" % volname
-    configmap_data.data[volinfo_file] = json.dumps(data)
-
-    core_v1_client.patch_namespaced_config_map(
-        KADALU_CONFIG_MAP, NAMESPACE, configmap_data)
-    logging.info(logf("Updated configmap", name=KADALU_CONFIG_MAP,
-                      volname=volname))
+    storageinfo.write_storage_info(core_v1_client, volname, data)
     filename = os.path.join(MANIFESTS_DIR, "external-storageclass.yaml")
-    template(filename, **data)
-    lib_execute(KUBECTL_CMD, APPLY_CMD, "-f", filename)
+    kubeapply.apply_template(filename, **data)
     logging.info(logf("Deployed External StorageClass", volname=volname, manifest=filename))
     add_tolerations("daemonset", NODE_PLUGIN, tolerations)
 
@@ -547,20 +616,14 @@ def handle_added(core_v1_client, obj):
 
     # Ignore if already deployed
     volname = obj["metadata"]["name"]
-    pods = core_v1_client.list_namespaced_pod(NAMESPACE)
-    for pod in pods.items:
-        if pod.metadata.name.startswith("server-" + volname + "-"):
-            logging.debug(logf(
-                "Ignoring already deployed server statefulsets",
-                storagename=volname
-            ))
-            return
-
-    # Add new entry in the existing config map
-    configmap_data = core_v1_client.read_namespaced_config_map(
-        KADALU_CONFIG_MAP, NAMESPACE)
+    if is_storage_deployed(core_v1_client, volname):
+        logging.debug(logf(
+            "Ignoring already deployed server statefulsets",
+            storagename=volname
+        ))
+        return
 
-    if configmap_data.data.get("%s.info" % volname, None):
+    if storageinfo.read_storage_info(core_v1_client, volname) is not None:
         # Volume already exists
         logging.warning(logf(
             "Updating existing config map",
@@ -593,8 +656,7 @@ def handle_added(core_v1_client, obj):
     deploy_server_pods(obj)
 
     filename = os.path.join(MANIFESTS_DIR, "services.yaml")
-    template(filename, namespace=NAMESPACE, volname=volname)
-    lib_execute(KUBECTL_CMD, APPLY_CMD, "-f", filename)
+    kubeapply.apply_template(filename, namespace=NAMESPACE, volname=volname)
     logging.info(logf("Deployed Service", volname=volname, manifest=filename))
 
 
@@ -623,10 +685,9 @@ def handle_modified(core_v1_client, obj):
         ))
         return
 
-    configmap_data = core_v1_client.read_namespaced_config_map(
-        KADALU_CONFIG_MAP, NAMESPACE)
+    cfgmap = storageinfo.read_storage_info(core_v1_client, volname)
 
-    if not configmap_data.data.get("%s.info" % volname, None):
+    if cfgmap is None:
         logging.warning(logf(
             "Volume config not found",
             storagename=volname
@@ -636,7 +697,6 @@ def handle_modified(core_v1_client, obj):
         return
 
     # Volume ID (uuid) is already generated, re-use
-    cfgmap = json.loads(configmap_data.data[volname + ".info"])
     # Get volume-id from config map
     obj["spec"]["volume_id"] = cfgmap["volume_id"]
 
@@ -649,8 +709,7 @@ def handle_modified(core_v1_client, obj):
     deploy_server_pods(obj)
 
     filename = os.path.join(MANIFESTS_DIR, "services.yaml")
-    template(filename, namespace=NAMESPACE, volname=volname)
-    lib_execute(KUBECTL_CMD, APPLY_CMD, "-f", filename)
+    kubeapply.apply_template(filename, namespace=NAMESPACE, volname=volname)
     logging.info(logf("Deployed Service", volname=volname, manifest=filename))
 
 
@@ -664,10 +723,13 @@ def handle_deleted(core_v1_client, obj):
 
     volname = obj["metadata"]["name"]
 
-    storage_info_data = get_configmap_data(volname)
+    storage_info_data = get_configmap_data(core_v1_client, volname)
 
     logging.info(logf("Delete requested", volname=volname))
 
+    if storage_info_data is None:
+        return
+
     pv_count = get_num_pvs(storage_info_data)
 
     if pv_count == -1:
@@ -697,38 +759,26 @@ def handle_deleted(core_v1_client, obj):
 
             delete_server_pods(storage_info_data, obj)
             filename = os.path.join(MANIFESTS_DIR, "services.yaml")
-            template(filename, namespace=NAMESPACE, volname=volname)
-            lib_execute(KUBECTL_CMD, DELETE_CMD, "-f", filename)
+            kubeapply.delete_template(filename, namespace=NAMESPACE, volname=volname)
             logging.info(
                 logf("Deleted Service", volname=volname, manifest=filename))
 
     return
 
 
-def get_configmap_data(volname):
+def get_configmap_data(core_v1_client, volname):
     """
     Get storage info data from kadalu configmap
     """
 
-    cmd = ["kubectl", "get", "configmap", "kadalu-info", "-nkadalu", "-ojson"]
-
-    try:
-        resp = utils_execute(cmd)
-        config_data = json.loads(resp.stdout)
-
-        data = config_data['data']
-        storage_name = "%s.info" % volname
-        storage_info_data = data[storage_name]
-
-        # Return data in 'dict' format
-        return json.loads(storage_info_data)
-
-    except CommandError as err:
+    storage_info_data = storageinfo.read_storage_info(core_v1_client, volname)
+    if storage_info_data is None:
         logging.error(logf(
             "Failed to get details from configmap",
-            error=err
+            volname=volname
         ))
-        return None
+
+    return storage_info_data
 
 
 def get_num_pvs(storage_info_data):
@@ -740,6 +790,11 @@ def get_num_pvs(storage_info_data):
 
     volname = storage_info_data['volname']
     volname = "kadalu." + volname
+
+    if PV_INFORMER is not None and \
+       PV_INFORMER.wait_for_sync(INFORMER_SYNC_TIMEOUT):
+        return PV_INFORMER.index_count("storageclass", volname)
+
     jpath = ('jsonpath=\'{range .items[?(@.spec.storageClassName=="%s")]}'
                 '{.spec.storageClassName}{"\\n"}{end}\'' % volname)
     cmd = ["kubectl", "get", "pv", "-o", jpath]
@@ -807,8 +862,7 @@ def delete_server_pods(storage_info_data, obj):
         template_args["k8s_dist"] = K8S_DIST
 
         filename = os.path.join(MANIFESTS_DIR, "server.yaml")
-        template(filename, **template_args)
-        lib_execute(KUBECTL_CMD, DELETE_CMD, "-f", filename)
+        kubeapply.delete_template(filename, **template_args)
         logging.info(logf(
             "Deleted Server pod",
             volname=volname,
@@ -824,20 +878,7 @@ def delete_config_map(core_v1_client, obj):
 
     volname = obj["metadata"]["name"]
 
-    # Add new entry in the existing config map
-    configmap_data = core_v1_client.read_namespaced_config_map(
-        KADALU_CONFIG_MAP, NAMESPACE)
-
-    volinfo_file = "%s.info" % volname
-    configmap_data.data[volinfo_file] = None
-
-    core_v1_client.patch_namespaced_config_map(
-        KADALU_CONFIG_MAP, NAMESPACE, configmap_data)
-    logging.info(logf(
-        "Deleted configmap",
-        name=KADALU_CONFIG_MAP,
-        volname=volname
-    ))
+    storageinfo.delete_storage_info(core_v1_client, volname)
 
 
 def delete_storage_class(hostvol_name, _):
@@ -846,7 +887,11 @@ def delete_storage_class(hostvol_name, _):
     """
 
     sc_name = "kadalu." + hostvol_name
-    lib_execute(KUBECTL_CMD, DELETE_CMD, "sc", sc_name)
+    kubeapply.delete_object({
+        "apiVersion": "storage.k8s.io/v1",
+        "kind": "StorageClass",
+        "metadata": {"name": sc_name}
+    })
     logging.info(logf(
         "Deleted Storage class",
         volname=hostvol_name
@@ -874,49 +919,169 @@ def csi_driver_object_api_version():
         return None
 
 
-def watch_stream(core_v1_client, k8s_client):
+def server_pod_storage(pod):
     """
-    Watches kubernetes event stream for kadalustorages in Kadalu namespace
+    Storage name of the server pod from the label. If not labelled,
+    "server-<storage>" from the pod name "server-<storage>-<idx>-0"
     """
-    crds = client.CustomObjectsApi(k8s_client)
-    k8s_watch = watch.Watch()
-    resource_version = ""
-    for event in k8s_watch.stream(crds.list_cluster_custom_object,
-                                  "kadalu-operator.storage",
-                                  "v1alpha1",
-                                  "kadalustorages",
-                                  resource_version=resource_version):
-        obj = event["object"]
-        operation = event['type']
-        spec = obj.get("spec")
-        if not spec:
-            continue
-        metadata = obj.get("metadata")
-        resource_version = metadata['resourceVersion']
-        logging.debug(logf("Event", operation=operation, object=repr(obj)))
-        if operation == "ADDED":
-            handle_added(core_v1_client, obj)
-        elif operation == "MODIFIED":
-            handle_modified(core_v1_client, obj)
-        elif operation == "DELETED":
-            handle_deleted(core_v1_client, obj)
+    labels = pod.metadata.labels or {}
+    if labels.get(STORAGE_LABEL):
+        return [labels[STORAGE_LABEL]]
 
+    match = SERVER_POD_NAME_RE.match(pod.metadata.name)
+    if match:
+        return [match.group(1)]
 
-def crd_watch(core_v1_client, k8s_client):
+    return []
+
+
+def pv_summary(pv):
+    """Only the fields required to count PVs per storage class"""
+    return {
+        "metadata": {
+            "name": pv.metadata.name,
+            "resourceVersion": pv.metadata.resource_version
+        },
+        "spec": {"storageClassName": pv.spec.storage_class_name or ""}
+    }
+
+
+def start_informers(core_v1_client):
+    """
+    Start caches of server pods and PVs. Existing deployments
+    and number of PVs of a storage are looked up from these
+    instead of listing all the pods and PVs.
+    """
+    global SERVER_POD_INFORMER, PV_INFORMER    # noqa # pylint: disable=global-statement
+
+    SERVER_POD_INFORMER = Informer("server-pods",
+                                   core_v1_client.list_namespaced_pod,
+                                   NAMESPACE,
+                                   label_selector=SERVER_POD_SELECTOR)
+    SERVER_POD_INFORMER.add_index("storage", server_pod_storage)
+    SERVER_POD_INFORMER.start()
+
+    PV_INFORMER = Informer("pvs", core_v1_client.list_persistent_volume)
+    PV_INFORMER.set_transform(pv_summary)
+    PV_INFORMER.add_index("storageclass",
+                          lambda pv: [pv["spec"]["storageClassName"]])
+    PV_INFORMER.start()
+
+
+def is_storage_deployed(core_v1_client, volname):
+    """Check if any server pod of the storage exists"""
+    if SERVER_POD_INFORMER is not None and \
+       SERVER_POD_INFORMER.wait_for_sync(INFORMER_SYNC_TIMEOUT):
+        # Pod names have the DNS friendly storage name
+        name_prefix = get_brick_hostname(volname, 0, suffix=False)[:-len("-0")]
+        return bool(
+            SERVER_POD_INFORMER.index_count("storage", volname) or
+            SERVER_POD_INFORMER.index_count("storage", name_prefix)
+        )
+
+    pods = core_v1_client.list_namespaced_pod(
+        NAMESPACE, label_selector=SERVER_POD_SELECTOR)
+    for pod in pods.items:
+        if pod.metadata.name.startswith("server-" + volname + "-"):
+            return True
+
+    return False
+
+
+def reconcile(core_v1_client, event_type, obj):
+    """Run the handler of the event type"""
+    if event_type == EVENT_ADDED:
+        handle_added(core_v1_client, obj)
+    elif event_type == EVENT_MODIFIED:
+        handle_modified(core_v1_client, obj)
+    elif event_type == EVENT_DELETED:
+        handle_deleted(core_v1_client, obj)
+
+
+def reconcile_worker(core_v1_client, queue):
     """
-    Watches the CRD to provision new PV Hosting Volumes
+    Handle the events from work queue. Events of a storage are
+    handled by one worker at a time and in order, different
+    storages are handled in parallel by other workers.
     """
     while True:
+        volname, event_type, obj = queue.get()
         try:
-            watch_stream(core_v1_client, k8s_client)
-        except (ProtocolError, NewConnectionError):
-            # It might so happen that this'll be logged for every hit in k8s
-            # event stream in kadalu namespace and better to log at debug level
-            logging.debug(
-                logf(
-                    "Watch connection broken and restarting watch on the stream"
+            # Server pods are applied by the upgrade one unit at a
+            # time, reconcile once the upgrade is done.
+            if upgrade.is_upgrading(volname):
+                logging.info(logf(
+                    "Storage is being upgraded, reconcile deferred",
+                    storagename=volname,
+                    operation=event_type
                 ))
-            time.sleep(30)
+                queue.add_after(volname, event_type, obj,
+                                RECONCILE_RETRY_INTERVAL)
+                continue
+
+            # Handlers update the object, keep the cached one intact
+            reconcile(core_v1_client, event_type, copy.deepcopy(obj))
+        except Exception as err:  # noqa # pylint: disable=broad-except
+            logging.error(logf(
+                "Failed to handle the event, retrying later",
+                storagename=volname,
+                operation=event_type,
+                error=err
+            ))
+            queue.add_after(volname, event_type, obj, RECONCILE_RETRY_INTERVAL)
+        finally:
+            queue.done(volname)
+
+
+def start_crd_informer(k8s_client, queue):
+    """
+    Watches kubernetes event stream for kadalustorages and adds
+    the events to the work queue. Watch is resumed from the last
+    seen resourceVersion after a disconnect, so existing storages
+    are not replayed as ADDED.
+    """
+    crds = client.CustomObjectsApi(k8s_client)
+
+    def enqueue(event_type, obj, old_obj):
+        if not obj.get("spec"):
+            return
+        # Status updates (Upgrade progress) don't change the generation
+        if event_type == EVENT_MODIFIED and old_obj is not None and \
+           old_obj["metadata"].get("generation") == obj["metadata"].get("generation"):
+            return
+        logging.debug(logf("Event", operation=event_type, object=repr(obj)))
+        queue.add(obj["metadata"]["name"], event_type, obj)
+
+    informer = Informer("kadalustorages",
+                        crds.list_cluster_custom_object,
+                        "kadalu-operator.storage",
+                        "v1alpha1",
+                        "kadalustorages")
+    informer.add_event_handler(enqueue)
+    informer.start()
+
+    return informer
+
+
+def crd_watch(core_v1_client, k8s_client):
+    """
+    Watches the CRD to provision new PV Hosting Volumes. Events
+    of a storage received while it is being reconciled are
+    coalesced and handled once. Returns the reconcile workers.
+    """
+    queue = WorkQueue()
+    start_crd_informer(k8s_client, queue)
+
+    workers = []
+    for idx in range(RECONCILE_WORKERS):
+        worker = threading.Thread(target=reconcile_worker,
+                                  args=(core_v1_client, queue),
+                                  name="reconcile-%d" % idx,
+                                  daemon=True)
+        worker.start()
+        workers.append(worker)
+
+    return workers
 
 
 def deploy_csi_pods(core_v1_client):
@@ -946,23 +1111,19 @@ def deploy_csi_pods(core_v1_client):
             ))
 
         filename = os.path.join(MANIFESTS_DIR, "csi-driver-object-v1.yaml")
-        template(filename, namespace=NAMESPACE, kadalu_version=VERSION)
-        lib_execute(KUBECTL_CMD, APPLY_CMD, "-f", filename)
+        kubeapply.apply_template(filename, namespace=NAMESPACE, kadalu_version=VERSION)
 
     elif api_instance.major > "1" or api_instance.major == "1" and \
        api_instance.minor >= "14":
         filename = os.path.join(MANIFESTS_DIR, "csi-driver-object.yaml")
-        template(filename, namespace=NAMESPACE, kadalu_version=VERSION)
-        lib_execute(KUBECTL_CMD, APPLY_CMD, "-f", filename)
+        kubeapply.apply_template(filename, namespace=NAMESPACE, kadalu_version=VERSION)
 
     filename = os.path.join(MANIFESTS_DIR, "csi.yaml")
     docker_user = os.environ.get("DOCKER_USER", "kadalu")
-    template(filename, namespace=NAMESPACE, kadalu_version=VERSION,
-             docker_user=docker_user, k8s_dist=K8S_DIST,
-             images_hub=IMAGES_HUB,
-             kubelet_dir=KUBELET_DIR, verbose=VERBOSE,)
-
-    lib_execute(KUBECTL_CMD, APPLY_CMD, "-f", filename)
+    kubeapply.apply_template(filename, namespace=NAMESPACE, kadalu_version=VERSION,
+                             docker_user=docker_user, k8s_dist=K8S_DIST,
+                             images_hub=IMAGES_HUB,
+                             kubelet_dir=KUBELET_DIR, verbose=VERBOSE,)
     logging.info(logf("Deployed CSI Pods", manifest=filename))
 
 
@@ -972,7 +1133,7 @@ def deploy_config_map(core_v1_client):
     configmaps = core_v1_client.list_namespaced_config_map(
         NAMESPACE)
     uid = uuid.uuid4()
-    upgrade = False
+    is_upgrade = False
     for item in configmaps.items:
         if item.metadata.name == KADALU_CONFIG_MAP:
             logging.info(logf(
@@ -985,7 +1146,7 @@ def deploy_config_map(core_v1_client):
                 KADALU_CONFIG_MAP, NAMESPACE)
             if configmap_data.data.get("uid", None):
                 uid = configmap_data.data["uid"]
-                upgrade = True
+                is_upgrade = True
             # Keep the config details required to be preserved.
 
     # Deploy Config map
@@ -995,10 +1156,10 @@ def deploy_config_map(core_v1_client):
              kadalu_version=VERSION,
              uid=uid)
 
-    if not upgrade:
+    if not is_upgrade:
         lib_execute(KUBECTL_CMD, CREATE_CMD, "-f", filename)
-    logging.info(logf("ConfigMap Deployed", manifest=filename, uid=uid, upgrade=upgrade))
-    return uid, upgrade
+    logging.info(logf("ConfigMap Deployed", manifest=filename, uid=uid, upgrade=is_upgrade))
+    return uid, is_upgrade
 
 
 def deploy_storage_class(obj):
@@ -1021,10 +1182,9 @@ def deploy_storage_class(obj):
             logging.info(logf("StorageClass already present, continuing with Apply",
                               manifest=filename))
 
-        template(filename, namespace=NAMESPACE, kadalu_version=VERSION,
-                 hostvol_name=obj["metadata"]["name"],
-                 single_pv_per_pool=get_single_pv_per_pool(obj["spec"]))
-        lib_execute(KUBECTL_CMD, APPLY_CMD, "-f", filename)
+        kubeapply.apply_template(filename, namespace=NAMESPACE, kadalu_version=VERSION,
+                                 hostvol_name=obj["metadata"]["name"],
+                                 single_pv_per_pool=get_single_pv_per_pool(obj["spec"]))
         logging.info(logf("Deployed StorageClass", manifest=filename))
 
 def add_tolerations(resource, name, tolerations):
@@ -1049,24 +1209,44 @@ def main():
     core_v1_client = client.CoreV1Api()
     k8s_client = client.ApiClient()
 
+    start_http_server(OPERATOR_METRICS_PORT, addr="127.0.0.1")
+
     # ConfigMap
-    uid, upgrade = deploy_config_map(core_v1_client)
+    uid, is_upgrade = deploy_config_map(core_v1_client)
+
+    # Move storage info to per storage ConfigMaps
+    storageinfo.migrate_storage_info(core_v1_client)
+
+    # Server pods and PVs caches
+    start_informers(core_v1_client)
 
     # CSI Pods
     deploy_csi_pods(core_v1_client)
 
-    if upgrade:
-        logging.info(logf("Upgrading to ", version=VERSION))
-        upgrade_storage_pods(core_v1_client)
-
     # Send Analytics Tracker
     # The information from this analytics is available for
     # developers to understand and build project in a better
     # way
     send_analytics_tracker("operator", uid)
 
+    # Storages are marked before the watch is started so that
+    # they are not reconciled till their upgrade is done.
+    storages = []
+    if is_upgrade:
+        logging.info(logf("Upgrading to ", version=VERSION))
+        storages = storages_to_upgrade(core_v1_client)
+        upgrade.mark_upgrading([storage[0] for storage in storages])
+
     # Watch CRD
-    crd_watch(core_v1_client, k8s_client)
+    workers = crd_watch(core_v1_client, k8s_client)
+
+    # Upgrade runs in background, heal check between the waves
+    # can take long.
+    if storages:
+        upgrade.start_upgrade(storages, deploy_server_pod)
+
+    for worker in workers:
+        worker.join()
 
 
 if __name__ == "__main__":
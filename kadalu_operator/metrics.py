@@ -1,7 +1,57 @@
-from prometheus_client import Gauge
+from prometheus_client import Gauge as PrometheusGauge
+
+# Label sets set in the current and the previous collection. Used
+# to remove the metrics of Pods/PVCs which no longer exist instead
+# of clearing all the metrics on every collection.
+CURRENT_LABELS = {}
+PREVIOUS_LABELS = {}
+
+
+class Gauge(PrometheusGauge):
+    """ Gauge which remembers the label sets updated in a collection """
+    def labels(self, *labelvalues, **labelkwargs):
+        CURRENT_LABELS.setdefault(self, set()).add(
+            tuple(str(value) for value in labelvalues))
+        return super().labels(*labelvalues, **labelkwargs)
+
 
 memory_usage = Gauge('kadalu_memory_usage_in_bytes', 'Kadalu Memory Usage in Bytes', ['name'])
 cpu_usage = Gauge('kadalu_cpu_usage_in_ns', 'Kadalu Memory Usage in Nanoseconds', ['name'])
+memory_limit = Gauge('kadalu_memory_limit_in_bytes', 'Kadalu Memory Limit in Bytes', ['name'])
+cpu_throttled = Gauge('kadalu_cpu_throttled_in_ns', 'Kadalu CPU Throttled Time in Nanoseconds', ['name'])
+io_read_bytes = Gauge('kadalu_io_read_bytes', 'Kadalu Bytes Read from Block Devices', ['name'])
+io_write_bytes = Gauge('kadalu_io_write_bytes', 'Kadalu Bytes Written to Block Devices', ['name'])
+pressure_avg10 = Gauge('kadalu_pressure_avg10', 'Kadalu Pressure Stall Percentage (10s average)', ['name', 'resource', 'kind'])
+
+process_memory_usage = Gauge('kadalu_process_memory_usage_in_bytes', 'Kadalu Gluster Process Memory Usage in Bytes', ['name', 'process', 'storage'])
+process_cpu_usage = Gauge('kadalu_process_cpu_usage_in_ns', 'Kadalu Gluster Process CPU Usage in Nanoseconds', ['name', 'process', 'storage'])
+
+monitor_process_up = Gauge('kadalu_monitor_process_up', 'Kadalu Process Running(1) or Not(0) as reported by the Pod Monitor', ['name', 'process'])
+monitor_process_restarts = Gauge('kadalu_monitor_process_restarts', 'Kadalu Number of Process Restarts by the Pod Monitor', ['name', 'process'])
+monitor_process_crash_loop = Gauge('kadalu_monitor_process_crash_loop', 'Kadalu Process is in Crash Loop(1) or Not(0)', ['name', 'process'])
+monitor_process_restart_backoff = Gauge('kadalu_monitor_process_restart_backoff_seconds', 'Kadalu Seconds till the Next Restart of the Exited Process', ['name', 'process'])
+
+fop_calls = Gauge('kadalu_storage_unit_fop_calls', 'Kadalu Number of FOP Calls on the Storage Unit', ['storage', 'storage_unit', 'fop', 'interval'])
+fop_failures = Gauge('kadalu_storage_unit_fop_failures', 'Kadalu Number of Failed FOP Calls on the Storage Unit', ['storage', 'storage_unit', 'fop', 'interval'])
+fop_latency_min = Gauge('kadalu_storage_unit_fop_latency_min_usec', 'Kadalu Minimum FOP Latency on the Storage Unit in Microseconds', ['storage', 'storage_unit', 'fop', 'interval'])
+fop_latency_avg = Gauge('kadalu_storage_unit_fop_latency_avg_usec', 'Kadalu Average FOP Latency on the Storage Unit in Microseconds', ['storage', 'storage_unit', 'fop', 'interval'])
+fop_latency_max = Gauge('kadalu_storage_unit_fop_latency_max_usec', 'Kadalu Maximum FOP Latency on the Storage Unit in Microseconds', ['storage', 'storage_unit', 'fop', 'interval'])
+storage_unit_read_bytes = Gauge('kadalu_storage_unit_read_bytes', 'Kadalu Bytes Read by the Storage Unit', ['storage', 'storage_unit', 'interval'])
+storage_unit_write_bytes = Gauge('kadalu_storage_unit_write_bytes', 'Kadalu Bytes Written by the Storage Unit', ['storage', 'storage_unit', 'interval'])
+
+heal_pending_entries = Gauge('kadalu_storage_unit_heal_pending_entries', 'Kadalu Number of Entries Pending Heal on the Storage Unit', ['storage', 'storage_unit'])
+heal_split_brain_entries = Gauge('kadalu_storage_unit_heal_split_brain_entries', 'Kadalu Number of Entries in Split-brain on the Storage Unit', ['storage', 'storage_unit'])
+heal_possibly_healing_entries = Gauge('kadalu_storage_unit_heal_possibly_healing_entries', 'Kadalu Number of Entries Possibly Healing on the Storage Unit', ['storage', 'storage_unit'])
+heal_rate = Gauge('kadalu_storage_unit_heal_rate', 'Kadalu Number of Entries Healed per Second on the Storage Unit', ['storage', 'storage_unit'])
+heal_connected = Gauge('kadalu_storage_unit_heal_info_connected', 'Kadalu Storage Unit is Connected(1) or Not(0) as reported by Heal Info', ['storage', 'storage_unit'])
+
+snapshot_timestamp = PrometheusGauge('kadalu_operator_metrics_snapshot_timestamp_seconds', 'Kadalu Operator Time of the Last Metrics Collection')
+
+pod_up = Gauge('kadalu_pod_metrics_up', 'Kadalu Pod Metrics Scrape Success(1) or Failure(0)', ['name'])
+scrape_duration = Gauge('kadalu_pod_metrics_scrape_duration_seconds', 'Kadalu Pod Metrics Scrape Duration in Seconds', ['name'])
+
+informer_cache_age = Gauge('kadalu_operator_informer_cache_age_seconds', 'Kadalu Operator Seconds Since Last Informer Cache Update', ['name'])
+informer_watch_restarts = Gauge('kadalu_operator_informer_watch_restarts', 'Kadalu Operator Number of Informer Watch Restarts', ['name'])
 
 total_number_of_containers = Gauge('kadalu_total_number_of_containers', 'Kadalu Total Number Of Containers', ['name'])
 number_of_ready_containers = Gauge('kadalu_total_number_of_ready_containers', 'Kadalu Total Number Of Ready Containers', ['name'])
@@ -23,23 +73,25 @@ used_pvc_inodes = Gauge('kadalu_pvc_used_inodes', 'Kadalu Total Used PVC Inodes'
 free_pvc_inodes = Gauge('kadalu_pvc_free_inodes', 'Kadalu Total Free PVC Inodes', ['name'])
 
 
-def clear_all_metrics():
+def start_update():
+    """
+    Start a new collection, label sets which are not set
+    again before remove_stale_metrics() are removed.
+    """
+    CURRENT_LABELS.clear()
+
+
+def remove_stale_metrics():
     """
-    Clear all the exposed metrics before each export
+    Remove the label sets set in the previous collection but not
+    in the current one (For example, deleted PVCs or Pods).
     """
-    memory_usage.clear()
-    cpu_usage.clear()
-    total_number_of_containers.clear()
-    number_of_ready_containers.clear()
-    total_capacity_bytes.clear()
-    used_capacity_bytes.clear()
-    free_capacity_bytes.clear()
-    total_inodes.clear()
-    used_inodes.clear()
-    free_inodes.clear()
-    total_pvc_capacity_bytes.clear()
-    used_pvc_capacity_bytes.clear()
-    free_pvc_capacity_bytes.clear()
-    total_pvc_inodes.clear()
-    used_pvc_inodes.clear()
-    free_pvc_inodes.clear()
+    global PREVIOUS_LABELS    # noqa # pylint: disable=global-statement
+    for gauge, labels in PREVIOUS_LABELS.items():
+        for labelvalues in labels - CURRENT_LABELS.get(gauge, set()):
+            try:
+                gauge.remove(*labelvalues)
+            except KeyError:
+                pass
+
+    PREVIOUS_LABELS = {gauge: set(labels) for gauge, labels in CURRENT_LABELS.items()}
@@ -0,0 +1,244 @@
+"""
+Storage info (Pool configuration) stored in ConfigMaps.
+
+Each storage has its own ConfigMap "kadalu-info-<storage>" with the key
+"<storage>.info". The list of storages is maintained as an index in the
+"storages" key of "kadalu-info" ConfigMap.
+
+Earlier, all the "<storage>.info" keys were stored in "kadalu-info". These
+keys are migrated to the per storage ConfigMaps when the operator starts.
+Server pods mount the ConfigMap of their storage and CSI pods watch the
+per storage ConfigMaps (See csi/poolinfo.py).
+
+KADALU_INFO_LEGACY_KEYS is a temporary migration switch. While it is "yes"
+(default), the "<storage>.info" keys are kept updated in "kadalu-info" as
+well, for kubectl-kadalu and for the CSI nodeplugin of the earlier releases
+(its manifest is upgraded separately), which read only from it. The default
+changes to "no" in the next release, and the switch and the legacy keys are
+removed in the release after that.
+
+All updates use the resourceVersion of the last read, and are retried
+if the ConfigMap is modified by someone else in the meantime.
+"""
+
+import json
+import logging
+import os
+import time
+
+from kadalulib import logf
+from kubernetes import client
+from kubernetes.client.rest import ApiException
+
+NAMESPACE = os.environ.get("KADALU_NAMESPACE", "kadalu")
+KADALU_CONFIG_MAP = "kadalu-info"
+INDEX_KEY = "storages"
+LEGACY_KEYS = os.environ.get("KADALU_INFO_LEGACY_KEYS", "yes") == "yes"
+STORAGE_INFO_LABEL = "kadalu.io/storage"
+STORAGE_INFO_SELECTOR = "app.kubernetes.io/component=storage-info"
+
+HTTP_STATUS_NOT_FOUND = 404
+HTTP_STATUS_CONFLICT = 409
+
+UPDATE_RETRIES = 10
+UPDATE_RETRY_INTERVAL = 0.5
+
+
+def storage_configmap_name(volname):
+    """Name of the ConfigMap of the storage"""
+    return "%s-%s" % (KADALU_CONFIG_MAP, volname)
+
+
+def storage_info_key(volname):
+    """Key of the storage info, this is the file name when mounted"""
+    return "%s.info" % volname
+
+
+def retry_on_conflict(func):
+    """
+    Call func till it succeeds without a conflict. func should read
+    the ConfigMap and update it with the read resourceVersion.
+    """
+    for _ in range(UPDATE_RETRIES - 1):
+        try:
+            return func()
+        except ApiException as err:
+            if err.status != HTTP_STATUS_CONFLICT:
+                raise
+        time.sleep(UPDATE_RETRY_INTERVAL)
+
+    return func()
+
+
+def update_index_and_legacy(core_v1_client, volname, data):
+    """
+    Add/Remove the storage in the index of "kadalu-info" ConfigMap.
+    Storage info is also updated/removed as "<storage>.info" key if
+    legacy keys are enabled. data=None to remove.
+    """
+    def update():
+        configmap = core_v1_client.read_namespaced_config_map(
+            KADALU_CONFIG_MAP, NAMESPACE)
+        cm_data = dict(configmap.data or {})
+        storages = set(json.loads(cm_data.get(INDEX_KEY) or "[]"))
+        if data is None:
+            storages.discard(volname)
+            cm_data.pop(storage_info_key(volname), None)
+        else:
+            storages.add(volname)
+            if LEGACY_KEYS:
+                cm_data[storage_info_key(volname)] = json.dumps(data)
+
+        cm_data[INDEX_KEY] = json.dumps(sorted(storages))
+
+        # Avoid updating all the pods which mount this ConfigMap
+        if cm_data == (configmap.data or {}):
+            return
+
+        configmap.data = cm_data
+
+        # Replace fails with conflict if resourceVersion is changed
+        core_v1_client.replace_namespaced_config_map(
+            KADALU_CONFIG_MAP, NAMESPACE, configmap)
+
+    retry_on_conflict(update)
+
+
+def write_storage_info(core_v1_client, volname, data):
+    """Create or update the ConfigMap of the storage"""
+    name = storage_configmap_name(volname)
+    value = json.dumps(data)
+
+    def update():
+        try:
+            configmap = core_v1_client.read_namespaced_config_map(name, NAMESPACE)
+        except ApiException as err:
+            if err.status != HTTP_STATUS_NOT_FOUND:
+                raise
+
+            body = client.V1ConfigMap(
+                metadata=client.V1ObjectMeta(
+                    name=name,
+                    namespace=NAMESPACE,
+                    labels={
+                        "app.kubernetes.io/part-of": "kadalu",
+                        "app.kubernetes.io/component": "storage-info",
+                        STORAGE_INFO_LABEL: volname
+                    }
+                ),
+                data={storage_info_key(volname): value}
+            )
+            # Fails with conflict if someone else created it
+            core_v1_client.create_namespaced_config_map(NAMESPACE, body)
+            return
+
+        if (configmap.data or {}).get(storage_info_key(volname)) == value:
+            return
+
+        configmap.data = {storage_info_key(volname): value}
+        core_v1_client.replace_namespaced_config_map(name, NAMESPACE, configmap)
+
+    retry_on_conflict(update)
+    update_index_and_legacy(core_v1_client, volname, data)
+    logging.info(logf("Updated storage info", name=name, volname=volname))
+
+
+def delete_storage_info(core_v1_client, volname):
+    """Delete the ConfigMap of the storage and remove from index"""
+    name = storage_configmap_name(volname)
+    try:
+        core_v1_client.delete_namespaced_config_map(name, NAMESPACE)
+    except ApiException as err:
+        if err.status != HTTP_STATUS_NOT_FOUND:
+            raise
+
+    update_index_and_legacy(core_v1_client, volname, None)
+    logging.info(logf("Deleted storage info", name=name, volname=volname))
+
+
+def read_storage_info(core_v1_client, volname):
+    """
+    Storage info from the ConfigMap of the storage, or from the
+    "kadalu-info" ConfigMap if not yet migrated. None if not found.
+    """
+    try:
+        configmap = core_v1_client.read_namespaced_config_map(
+            storage_configmap_name(volname), NAMESPACE)
+        value = (configmap.data or {}).get(storage_info_key(volname))
+        if value:
+            return json.loads(value)
+    except ApiException as err:
+        if err.status != HTTP_STATUS_NOT_FOUND:
+            raise
+
+    configmap = core_v1_client.read_namespaced_config_map(
+        KADALU_CONFIG_MAP, NAMESPACE)
+    value = (configmap.data or {}).get(storage_info_key(volname))
+    if value:
+        return json.loads(value)
+
+    return None
+
+
+def list_storage_info(core_v1_client):
+    """
+    Returns {storage_name: storage_info} of all the storages from
+    both per storage ConfigMaps and "kadalu-info" ConfigMap.
+    """
+    infos = {}
+    configmaps = core_v1_client.list_namespaced_config_map(
+        NAMESPACE, label_selector=STORAGE_INFO_SELECTOR)
+    for configmap in configmaps.items:
+        for key, value in (configmap.data or {}).items():
+            if key.endswith(".info"):
+                infos[key[:-len(".info")]] = json.loads(value)
+
+    configmap = core_v1_client.read_namespaced_config_map(
+        KADALU_CONFIG_MAP, NAMESPACE)
+    for key, value in (configmap.data or {}).items():
+        volname = key[:-len(".info")]
+        if key.endswith(".info") and volname not in infos:
+            infos[volname] = json.loads(value)
+
+    return infos
+
+
+def migrate_storage_info(core_v1_client):
+    """
+    Create per storage ConfigMaps for the storages which are
+    available only in "kadalu-info" ConfigMap.
+    """
+    configmap = core_v1_client.read_namespaced_config_map(
+        KADALU_CONFIG_MAP, NAMESPACE)
+    for key, value in (configmap.data or {}).items():
+        if not key.endswith(".info"):
+            continue
+
+        volname = key[:-len(".info")]
+        try:
+            core_v1_client.read_namespaced_config_map(
+                storage_configmap_name(volname), NAMESPACE)
+            continue
+        except ApiException as err:
+            if err.status != HTTP_STATUS_NOT_FOUND:
+                raise
+
+        write_storage_info(core_v1_client, volname, json.loads(value))
+        logging.info(logf("Migrated storage info", volname=volname))
+
+    # Remove legacy keys if disabled
+    if not LEGACY_KEYS:
+        def remove_legacy_keys():
+            configmap = core_v1_client.read_namespaced_config_map(
+                KADALU_CONFIG_MAP, NAMESPACE)
+            cm_data = configmap.data or {}
+            keys = [key for key in cm_data if key.endswith(".info")]
+            if not keys:
+                return
+            for key in keys:
+                del cm_data[key]
+            configmap.data = cm_data
+            core_v1_client.replace_namespaced_config_map(
+                KADALU_CONFIG_MAP, NAMESPACE, configmap)
+
+        retry_on_conflict(remove_legacy_keys)
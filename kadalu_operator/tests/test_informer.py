@@ -0,0 +1,157 @@
+from kubernetes.client.rest import ApiException
+
+import informer
+from informer import (EVENT_ADDED, EVENT_DELETED, EVENT_MODIFIED, Informer,
+                      WorkQueue)
+
+NAMESPACE = "kadalu"
+
+
+def pod(name, resource_version):
+    return {
+        "metadata": {
+            "namespace": NAMESPACE,
+            "name": name,
+            "resourceVersion": resource_version
+        }
+    }
+
+
+def pod_list(resource_version, pods):
+    return {
+        "metadata": {"resourceVersion": resource_version},
+        "items": pods
+    }
+
+
+class FakeList:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def __call__(self, *args, **kwargs):
+        self.calls += 1
+        return self.responses.pop(0)
+
+
+def test_relist_notifies_only_the_changes():
+    list_func = FakeList([
+        pod_list("10", [pod("pod1", "1"), pod("pod2", "2")]),
+        pod_list("20", [pod("pod2", "2"), pod("pod3", "3"),
+                        pod("pod1", "5")]),
+    ])
+    pods = Informer("pods", list_func, NAMESPACE)
+    pods.add_index("name", lambda obj: [obj["metadata"]["name"]])
+    events = []
+    pods.add_event_handler(
+        lambda event_type, obj, old_obj: events.append(
+            (event_type, obj["metadata"]["name"])))
+
+    pods.relist()
+    assert pods.has_synced()
+    assert pods.resource_version == "10"
+    assert sorted(events) == [(EVENT_ADDED, "pod1"), (EVENT_ADDED, "pod2")]
+
+    events.clear()
+    pods.relist()
+    assert pods.resource_version == "20"
+    # pod2 is unchanged, pod1 is modified and pod3 is new
+    assert sorted(events) == [(EVENT_ADDED, "pod3"),
+                              (EVENT_MODIFIED, "pod1")]
+    assert pods.index_values("name") == {"pod1": 1, "pod2": 1, "pod3": 1}
+
+
+def test_relist_removes_deleted_objects():
+    list_func = FakeList([
+        pod_list("10", [pod("pod1", "1"), pod("pod2", "2")]),
+        pod_list("11", [pod("pod2", "2")]),
+    ])
+    pods = Informer("pods", list_func, NAMESPACE)
+    events = []
+    pods.add_event_handler(
+        lambda event_type, obj, old_obj: events.append(
+            (event_type, obj["metadata"]["name"])))
+
+    pods.relist()
+    events.clear()
+    pods.relist()
+    assert events == [(EVENT_DELETED, "pod1")]
+    assert pods.get("%s/pod1" % NAMESPACE) is None
+    assert pods.get("%s/pod2" % NAMESPACE) is not None
+
+
+def test_watch_resumes_and_relists_only_on_gone(monkeypatch):
+    list_func = FakeList([
+        pod_list("10", [pod("pod1", "1")]),
+        pod_list("30", [pod("pod1", "1")]),
+    ])
+    pods = Informer("pods", list_func, NAMESPACE)
+    watched_from = []
+
+    def fake_watch():
+        watched_from.append(pods.resource_version)
+        if len(watched_from) == 1:
+            # Watch timed out normally
+            pods.resource_version = "15"
+            return
+        if len(watched_from) == 2:
+            raise ApiException(status=informer.HTTP_STATUS_GONE)
+        pods.stop()
+
+    monkeypatch.setattr(pods, "watch", fake_watch)
+    pods.run()
+
+    # Resumed from the last seen resourceVersion after the timeout,
+    # relisted only after 410 Gone.
+    assert watched_from == ["10", "15", "30"]
+    assert list_func.calls == 2
+    assert pods.relists == 2
+    assert pods.watch_restarts == 0
+
+
+def test_coalesce_events():
+    assert informer.coalesce_events(EVENT_ADDED, EVENT_MODIFIED) == EVENT_ADDED
+    assert informer.coalesce_events(EVENT_DELETED, EVENT_ADDED) == EVENT_MODIFIED
+    assert informer.coalesce_events(EVENT_MODIFIED, EVENT_DELETED) == EVENT_DELETED
+    assert informer.coalesce_events(EVENT_ADDED, EVENT_DELETED) == EVENT_DELETED
+
+
+def test_work_queue_coalesces_pending_events():
+    queue = WorkQueue()
+    queue.add("storage1", EVENT_ADDED, {"version": 1})
+    queue.add("storage2", EVENT_ADDED, {"version": 1})
+    queue.add("storage1", EVENT_MODIFIED, {"version": 2})
+    assert len(queue) == 2
+
+    # Latest object, ADDED since it is not yet deployed
+    assert queue.get() == ("storage1", EVENT_ADDED, {"version": 2})
+    assert queue.get() == ("storage2", EVENT_ADDED, {"version": 1})
+    assert len(queue) == 0
+
+
+def test_work_queue_requeues_after_done():
+    queue = WorkQueue()
+    queue.add("storage1", EVENT_ADDED, {"version": 1})
+    assert queue.get() == ("storage1", EVENT_ADDED, {"version": 1})
+
+    # Not given to another worker while it is being processed
+    queue.add("storage1", EVENT_MODIFIED, {"version": 2})
+    queue.add("storage1", EVENT_MODIFIED, {"version": 3})
+    assert len(queue) == 0
+
+    queue.done("storage1")
+    assert len(queue) == 1
+    assert queue.get() == ("storage1", EVENT_MODIFIED, {"version": 3})
+    queue.done("storage1")
+    assert len(queue) == 0
+
+
+def test_work_queue_retry_does_not_replace_newer_event():
+    queue = WorkQueue()
+    queue.add("storage1", EVENT_MODIFIED, {"version": 2})
+    queue.add("storage1", EVENT_MODIFIED, {"version": 1}, if_absent=True)
+    assert queue.get() == ("storage1", EVENT_MODIFIED, {"version": 2})
+
+    queue.done("storage1")
+    queue.add("storage1", EVENT_MODIFIED, {"version": 1}, if_absent=True)
+    assert queue.get() == ("storage1", EVENT_MODIFIED, {"version": 1})
@@ -0,0 +1,156 @@
+import copy
+import time
+from types import SimpleNamespace
+
+import pytest
+from kubernetes.client.rest import ApiException
+from kubernetes.dynamic.exceptions import NotFoundError
+
+import kubeapply
+from kubeapply import HASH_ANNOTATION, apply_object, is_changed, manifest_hash
+
+CONFIGMAP = {
+    "apiVersion": "v1",
+    "kind": "ConfigMap",
+    "metadata": {"name": "kadalu-info", "namespace": "kadalu"},
+    "data": {"storage-pool-1.info": "{}"}
+}
+
+CLUSTER_ROLE = {
+    "apiVersion": "rbac.authorization.k8s.io/v1",
+    "kind": "ClusterRole",
+    "metadata": {"name": "kadalu-csi-provisioner"},
+    "rules": []
+}
+
+
+class FakeResource:
+    """Deployed objects of a kind, by (namespace, name)"""
+    def __init__(self, namespaced):
+        self.namespaced = namespaced
+        self.objects = {}
+        self.gets = 0
+
+    def get(self, name, namespace=None):
+        self.gets += 1
+        obj = self.objects.get((namespace, name), None)
+        if obj is None:
+            raise NotFoundError(ApiException(status=404, reason="Not Found"))
+
+        annotations = obj["metadata"].get("annotations", None)
+        return SimpleNamespace(
+            metadata=SimpleNamespace(annotations=annotations))
+
+
+class FakeDynamicClient:
+    """Server-side apply stores the object in the resource"""
+    def __init__(self):
+        self.kinds = {"ConfigMap": FakeResource(True),
+                      "ClusterRole": FakeResource(False)}
+        self.resources = SimpleNamespace(
+            get=lambda api_version, kind: self.kinds[kind])
+        self.applied = []
+
+    def server_side_apply(self, resource, body, name, namespace,
+                          field_manager, force_conflicts):
+        assert field_manager == kubeapply.FIELD_MANAGER
+        assert force_conflicts
+        self.applied.append(copy.deepcopy(body))
+        resource.objects[(namespace, name)] = copy.deepcopy(body)
+
+
+@pytest.fixture(name="dynamic_client")
+def fixture_dynamic_client(monkeypatch):
+    dynamic_client = FakeDynamicClient()
+    monkeypatch.setattr(kubeapply, "get_dynamic_client",
+                        lambda: dynamic_client)
+    monkeypatch.setattr(kubeapply, "APPLIED", {})
+    return dynamic_client
+
+
+def test_manifest_hash():
+    reordered = {
+        "data": {"storage-pool-1.info": "{}"},
+        "metadata": {"namespace": "kadalu", "name": "kadalu-info"},
+        "kind": "ConfigMap",
+        "apiVersion": "v1"
+    }
+    assert manifest_hash(CONFIGMAP) == manifest_hash(reordered)
+
+    changed = copy.deepcopy(CONFIGMAP)
+    changed["data"]["storage-pool-1.info"] = '{"type": "Replica3"}'
+    assert manifest_hash(CONFIGMAP) != manifest_hash(changed)
+
+
+def test_apply_writes_hash_annotation(dynamic_client):
+    assert apply_object(copy.deepcopy(CONFIGMAP))
+
+    applied = dynamic_client.applied[0]
+    assert applied["metadata"]["annotations"] == {
+        HASH_ANNOTATION: manifest_hash(CONFIGMAP)
+    }
+    assert ("kadalu", "kadalu-info") in \
+        dynamic_client.kinds["ConfigMap"].objects
+
+
+def test_unchanged_manifest_is_skipped(dynamic_client):
+    assert apply_object(copy.deepcopy(CONFIGMAP))
+    assert not apply_object(copy.deepcopy(CONFIGMAP))
+
+    assert len(dynamic_client.applied) == 1
+    # Remembered hash is used, deployed object is not fetched again
+    assert dynamic_client.kinds["ConfigMap"].gets == 1
+
+
+def test_changed_manifest_is_applied(dynamic_client):
+    assert apply_object(copy.deepcopy(CONFIGMAP))
+
+    changed = copy.deepcopy(CONFIGMAP)
+    changed["data"]["storage-pool-1.info"] = '{"type": "Replica3"}'
+    changed_hash = manifest_hash(changed)
+    assert apply_object(changed)
+
+    assert len(dynamic_client.applied) == 2
+    assert dynamic_client.applied[1]["metadata"]["annotations"] == {
+        HASH_ANNOTATION: changed_hash
+    }
+
+
+def test_cluster_scoped_object(dynamic_client):
+    assert apply_object(copy.deepcopy(CLUSTER_ROLE))
+    assert not apply_object(copy.deepcopy(CLUSTER_ROLE))
+
+    assert (None, "kadalu-csi-provisioner") in \
+        dynamic_client.kinds["ClusterRole"].objects
+    assert ("rbac.authorization.k8s.io/v1", "ClusterRole", "",
+            "kadalu-csi-provisioner") in kubeapply.APPLIED
+
+
+def test_cache_expiry_checks_deployed_object(dynamic_client, monkeypatch):
+    assert apply_object(copy.deepcopy(CONFIGMAP))
+    resource = dynamic_client.kinds["ConfigMap"]
+    key = ("v1", "ConfigMap", "kadalu", "kadalu-info")
+    obj_hash = manifest_hash(CONFIGMAP)
+
+    # Deleted outside the operator, not noticed till the cache expires
+    resource.objects.clear()
+    assert not is_changed(resource, key, obj_hash)
+
+    monkeypatch.setattr(kubeapply, "APPLIED_CACHE_TTL", 0)
+    assert is_changed(resource, key, obj_hash)
+    assert apply_object(copy.deepcopy(CONFIGMAP))
+    assert len(dynamic_client.applied) == 2
+
+
+def test_cache_expiry_skips_if_deployed_matches(dynamic_client):
+    assert apply_object(copy.deepcopy(CONFIGMAP))
+    key = ("v1", "ConfigMap", "kadalu", "kadalu-info")
+    obj_hash, applied_at = kubeapply.APPLIED[key]
+    kubeapply.APPLIED[key] = (obj_hash,
+                              applied_at - kubeapply.APPLIED_CACHE_TTL)
+
+    assert not apply_object(copy.deepcopy(CONFIGMAP))
+    assert len(dynamic_client.applied) == 1
+    # Deployed hash is fetched and the cache is refreshed
+    assert dynamic_client.kinds["ConfigMap"].gets == 2
+    assert time.time() - kubeapply.APPLIED[key][1] < 5
@@ -0,0 +1,205 @@
+import copy
+import json
+
+import pytest
+from kubernetes import client
+from kubernetes.client.rest import ApiException
+
+import storageinfo
+from storageinfo import (INDEX_KEY, KADALU_CONFIG_MAP, delete_storage_info,
+                         list_storage_info, migrate_storage_info,
+                         retry_on_conflict, write_storage_info)
+
+STORAGE_1 = "storage-pool-1"
+STORAGE_2 = "storage-pool-2"
+INFO_1 = {"volname": STORAGE_1, "type": "Replica1"}
+INFO_2 = {"volname": STORAGE_2, "type": "Replica3"}
+
+
+class FakeCoreV1:
+    """ConfigMaps in memory, replace fails if resourceVersion changed"""
+    def __init__(self):
+        self.configmaps = {}
+        # Called before a replace, to simulate a concurrent update
+        self.before_replace = None
+
+    def add(self, name, data, labels=None):
+        self.configmaps[name] = client.V1ConfigMap(
+            metadata=client.V1ObjectMeta(name=name, resource_version="1",
+                                         labels=labels),
+            data=data)
+
+    def read_namespaced_config_map(self, name, _namespace):
+        if name not in self.configmaps:
+            raise ApiException(status=404)
+        return copy.deepcopy(self.configmaps[name])
+
+    def create_namespaced_config_map(self, _namespace, body):
+        if body.metadata.name in self.configmaps:
+            raise ApiException(status=409)
+        body.metadata.resource_version = "1"
+        self.configmaps[body.metadata.name] = copy.deepcopy(body)
+
+    def replace_namespaced_config_map(self, name, _namespace, body):
+        if self.before_replace is not None:
+            before_replace, self.before_replace = self.before_replace, None
+            before_replace()
+
+        current = self.configmaps[name]
+        if current.metadata.resource_version != body.metadata.resource_version:
+            raise ApiException(status=409)
+        body = copy.deepcopy(body)
+        body.metadata.resource_version = str(
+            int(current.metadata.resource_version) + 1)
+        self.configmaps[name] = body
+
+    def delete_namespaced_config_map(self, name, _namespace):
+        if self.configmaps.pop(name, None) is None:
+            raise ApiException(status=404)
+
+    def list_namespaced_config_map(self, _namespace, label_selector):
+        return client.V1ConfigMapList(items=[
+            copy.deepcopy(configmap)
+            for configmap in self.configmaps.values()
+            if (configmap.metadata.labels or {}).get(
+                "app.kubernetes.io/component") == "storage-info"
+        ])
+
+    def index(self):
+        data = self.configmaps[KADALU_CONFIG_MAP].data
+        return json.loads(data[INDEX_KEY])
+
+
+@pytest.fixture(name="core_v1")
+def fixture_core_v1(monkeypatch):
+    monkeypatch.setattr(storageinfo, "UPDATE_RETRY_INTERVAL", 0)
+    monkeypatch.setattr(storageinfo, "LEGACY_KEYS", True)
+    core_v1 = FakeCoreV1()
+    core_v1.add(KADALU_CONFIG_MAP, {})
+    return core_v1
+
+
+def test_retry_on_conflict(monkeypatch):
+    monkeypatch.setattr(storageinfo, "UPDATE_RETRY_INTERVAL", 0)
+    calls = []
+
+    def update():
+        calls.append(1)
+        if len(calls) < 3:
+            raise ApiException(status=409)
+        return "updated"
+
+    assert retry_on_conflict(update) == "updated"
+    assert len(calls) == 3
+
+
+def test_retry_on_conflict_raises_other_errors(monkeypatch):
+    monkeypatch.setattr(storageinfo, "UPDATE_RETRY_INTERVAL", 0)
+    calls = []
+
+    def update():
+        calls.append(1)
+        raise ApiException(status=500)
+
+    with pytest.raises(ApiException):
+        retry_on_conflict(update)
+    assert len(calls) == 1
+
+
+def test_retry_on_conflict_gives_up(monkeypatch):
+    monkeypatch.setattr(storageinfo, "UPDATE_RETRY_INTERVAL", 0)
+    calls = []
+
+    def update():
+        calls.append(1)
+        raise ApiException(status=409)
+
+    with pytest.raises(ApiException):
+        retry_on_conflict(update)
+    assert len(calls) == storageinfo.UPDATE_RETRIES
+
+
+def test_write_storage_info(core_v1):
+    write_storage_info(core_v1, STORAGE_1, INFO_1)
+
+    configmap = core_v1.configmaps["%s-%s" % (KADALU_CONFIG_MAP, STORAGE_1)]
+    assert json.loads(configmap.data["%s.info" % STORAGE_1]) == INFO_1
+    assert core_v1.index() == [STORAGE_1]
+    # Legacy key for CSI pods and CLI
+    legacy = core_v1.configmaps[KADALU_CONFIG_MAP].data
+    assert json.loads(legacy["%s.info" % STORAGE_1]) == INFO_1
+
+
+def test_index_merge_on_concurrent_update(core_v1):
+    write_storage_info(core_v1, STORAGE_1, INFO_1)
+
+    # Another storage is added to the index after this update
+    # read the ConfigMap, so the first replace conflicts.
+    def add_other_storage():
+        configmap = core_v1.configmaps[KADALU_CONFIG_MAP]
+        configmap.data[INDEX_KEY] = json.dumps([STORAGE_1, "storage-pool-3"])
+        configmap.metadata.resource_version = "100"
+
+    core_v1.before_replace = add_other_storage
+    write_storage_info(core_v1, STORAGE_2, INFO_2)
+
+    assert core_v1.index() == [STORAGE_1, STORAGE_2, "storage-pool-3"]
+
+
+def test_delete_storage_info(core_v1):
+    write_storage_info(core_v1, STORAGE_1, INFO_1)
+    write_storage_info(core_v1, STORAGE_2, INFO_2)
+    delete_storage_info(core_v1, STORAGE_1)
+
+    assert "%s-%s" % (KADALU_CONFIG_MAP, STORAGE_1) not in core_v1.configmaps
+    assert core_v1.index() == [STORAGE_2]
+    assert "%s.info" % STORAGE_1 not in core_v1.configmaps[KADALU_CONFIG_MAP].data
+
+
+def test_list_storage_info_prefers_per_storage_configmap(core_v1):
+    write_storage_info(core_v1, STORAGE_1, INFO_1)
+    # Not yet migrated, only in "kadalu-info"
+    legacy = core_v1.configmaps[KADALU_CONFIG_MAP].data
+    legacy["%s.info" % STORAGE_2] = json.dumps(INFO_2)
+    legacy["%s.info" % STORAGE_1] = json.dumps({"volname": "stale"})
+
+    assert list_storage_info(core_v1) == {STORAGE_1: INFO_1,
+                                          STORAGE_2: INFO_2}
+
+
+def test_write_without_legacy_keys(core_v1, monkeypatch):
+    monkeypatch.setattr(storageinfo, "LEGACY_KEYS", False)
+    write_storage_info(core_v1, STORAGE_1, INFO_1)
+
+    # Only the index is updated in "kadalu-info"
+    assert core_v1.configmaps[KADALU_CONFIG_MAP].data == {
+        INDEX_KEY: json.dumps([STORAGE_1])
+    }
+    assert list_storage_info(core_v1) == {STORAGE_1: INFO_1}
+
+
+def test_migrate_removes_legacy_keys(core_v1, monkeypatch):
+    monkeypatch.setattr(storageinfo, "LEGACY_KEYS", False)
+    core_v1.add(KADALU_CONFIG_MAP, {
+        "uid": "1234",
+        "%s.info" % STORAGE_1: json.dumps(INFO_1),
+        "%s.info" % STORAGE_2: json.dumps(INFO_2),
+    })
+    migrate_storage_info(core_v1)
+
+    assert core_v1.configmaps[KADALU_CONFIG_MAP].data == {
+        "uid": "1234",
+        INDEX_KEY: json.dumps([STORAGE_1, STORAGE_2])
+    }
+    assert list_storage_info(core_v1) == {STORAGE_1: INFO_1,
+                                          STORAGE_2: INFO_2}
+
+
+def test_migrate_keeps_legacy_keys(core_v1):
+    core_v1.add(KADALU_CONFIG_MAP, {"%s.info" % STORAGE_1: json.dumps(INFO_1)})
+    migrate_storage_info(core_v1)
+
+    configmap = core_v1.configmaps["%s-%s" % (KADALU_CONFIG_MAP, STORAGE_1)]
+    assert json.loads(configmap.data["%s.info" % STORAGE_1]) == INFO_1
+    assert json.loads(core_v1.configmaps[KADALU_CONFIG_MAP].data[
+        "%s.info" % STORAGE_1]) == INFO_1
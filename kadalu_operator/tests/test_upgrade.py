@@ -0,0 +1,165 @@
+import pytest
+
+import upgrade
+from upgrade import (UpgradeError, UpgradeStatus, parse_heal_info_summary,
+                     replica_groups, upgrade_waves)
+
+VOLNAME = "storage-pool"
+
+HEAL_INFO_SUMMARY = """Brick server-storage-pool-0-0.storage-pool:/bricks/storage-pool/data/brick
+Status: Connected
+Total Number of entries: 7
+Number of entries in heal pending: 4
+Number of entries in split-brain: 3
+Number of entries possibly healing: 0
+
+Brick server-storage-pool-1-0.storage-pool:/bricks/storage-pool/data/brick
+Status: Connected
+Total Number of entries: 2
+Number of entries in heal pending: 2
+Number of entries in split-brain: 0
+Number of entries possibly healing: 0
+"""
+
+HEAL_INFO_SUMMARY_NOT_CONNECTED = """Brick server-storage-pool-0-0.storage-pool:/bricks/storage-pool/data/brick
+Status: Transport endpoint is not connected
+Total Number of entries: -
+Number of entries in heal pending: -
+Number of entries in split-brain: -
+Number of entries possibly healing: -
+"""
+
+
+def test_parse_heal_info_summary():
+    # Split-brain entries are not counted as heal pending
+    assert parse_heal_info_summary(HEAL_INFO_SUMMARY) == {
+        "heal_pending": 6,
+        "split_brain": 3
+    }
+
+
+def test_parse_heal_info_summary_not_connected():
+    assert parse_heal_info_summary(HEAL_INFO_SUMMARY_NOT_CONNECTED) == {
+        "heal_pending": None,
+        "split_brain": None
+    }
+    assert parse_heal_info_summary("") == {
+        "heal_pending": None,
+        "split_brain": None
+    }
+
+
+def test_replica_groups():
+    assert replica_groups("Replica1", 3) == [[0], [1], [2]]
+    assert replica_groups("Replica2", 4) == [[0, 1], [2, 3]]
+    assert replica_groups("Replica3", 6) == [[0, 1, 2], [3, 4, 5]]
+    assert replica_groups("Arbiter", 3) == [[0, 1, 2]]
+    assert replica_groups("Disperse", 6, {"data": 4, "redundancy": 2}) == \
+        [[0, 1, 2, 3, 4, 5]]
+
+
+def test_upgrade_waves():
+    # One unit of each replica group per wave
+    assert upgrade_waves("Replica3", [[0, 1, 2], [3, 4, 5]]) == \
+        [[0, 3], [1, 4], [2, 5]]
+    assert upgrade_waves("Replica2", [[0, 1], [2]]) == [[0, 2], [1]]
+    # No redundancy, all units together
+    assert upgrade_waves("Replica1", [[0], [1], [2]]) == [[0, 1, 2]]
+
+
+def test_wait_for_heal_ignores_split_brain(monkeypatch):
+    counts = [
+        {"heal_pending": None, "split_brain": None},
+        {"heal_pending": 5, "split_brain": 1},
+        {"heal_pending": 0, "split_brain": 1},
+    ]
+    monkeypatch.setattr(upgrade, "CHECK_INTERVAL", 0)
+    monkeypatch.setattr(upgrade, "heal_pending",
+                        lambda *args: counts.pop(0))
+
+    upgrade.wait_for_heal(None, "server-storage-pool-0-0", VOLNAME)
+    assert not counts
+
+
+def test_wait_for_heal_timeout(monkeypatch):
+    monkeypatch.setattr(upgrade, "CHECK_INTERVAL", 0)
+    monkeypatch.setattr(upgrade, "heal_pending",
+                        lambda *args: {"heal_pending": 1, "split_brain": 0})
+
+    with pytest.raises(UpgradeError):
+        upgrade.wait_for_heal(None, "server-storage-pool-0-0", VOLNAME,
+                              timeout=0.01)
+
+
+@pytest.fixture(name="actions")
+def fixture_actions(monkeypatch):
+    actions = []
+    monkeypatch.setattr(upgrade.client, "CoreV1Api", lambda: None)
+    monkeypatch.setattr(upgrade.client, "AppsV1Api", lambda: None)
+    monkeypatch.setattr(
+        upgrade, "wait_for_statefulset",
+        lambda _client, name: actions.append(("ready", name)))
+    monkeypatch.setattr(
+        upgrade, "wait_for_heal",
+        lambda _client, pod_name, volname: actions.append(("heal", pod_name)))
+    return actions
+
+
+def storage_units(count):
+    return [{"serverpod_name": "server-%s-%d" % (VOLNAME, idx)}
+            for idx in range(count)]
+
+
+def test_upgrade_storage_waits_for_heal(actions):
+    units = storage_units(2)
+    status = UpgradeStatus(None, VOLNAME, None,
+                           ["%s-0" % args["serverpod_name"] for args in units])
+
+    def apply_unit(args):
+        actions.append(("apply", args["serverpod_name"]))
+        return True
+
+    upgrade.upgrade_storage((VOLNAME, "Replica2", None, units),
+                            apply_unit, status)
+
+    assert actions == [
+        # Heal is checked before the first wave too
+        ("heal", "server-storage-pool-0-0"),
+        ("apply", "server-storage-pool-0"),
+        ("ready", "server-storage-pool-0"),
+        ("heal", "server-storage-pool-0-0"),
+        ("apply", "server-storage-pool-1"),
+        ("ready", "server-storage-pool-1"),
+        ("heal", "server-storage-pool-1-0"),
+    ]
+    assert [unit["state"] for unit in status.status["units"]] == \
+        [upgrade.UNIT_DONE, upgrade.UNIT_DONE]
+
+
+def test_upgrade_storage_replica1_skips_heal(actions):
+    units = storage_units(2)
+    status = UpgradeStatus(None, VOLNAME, None,
+                           ["%s-0" % args["serverpod_name"] for args in units])
+
+    upgrade.upgrade_storage((VOLNAME, "Replica1", None, units),
+                            lambda args: True, status)
+
+    assert actions == [("ready", "server-storage-pool-0"),
+                       ("ready", "server-storage-pool-1")]
+
+
+def test_upgrading_storages_are_unmarked(monkeypatch):
+    upgraded = []
+
+    def run_upgrades(storages, _apply_unit):
+        upgraded.extend(upgrade.is_upgrading(storage[0])
+                        for storage in storages)
+        raise UpgradeError("failed")
+
+    monkeypatch.setattr(upgrade, "run_upgrades", run_upgrades)
+    storages = [(VOLNAME, "Replica3", None, storage_units(3))]
+    with pytest.raises(UpgradeError):
+        upgrade.upgrade_storages(storages, lambda args: True)
+
+    assert upgraded == [True]
+    assert not upgrade.is_upgrading(VOLNAME)
@@ -0,0 +1,417 @@
+"""
+Rolling upgrade of the Storage (server) pods after the operator
+is upgraded.
+
+Storages are upgraded in parallel (UPGRADE_CONCURRENCY). Within a
+storage, the storage units (bricks) are upgraded in waves, each wave
+upgrades at most one unit of every replica/disperse group. Heal pending
+count reported by glfsheal should be zero before the first wave, and
+before the next wave the upgraded pods should be Ready and the heal
+pending count should reach zero again. Entries in split-brain need
+manual resolution, they are reported but don't block the upgrade.
+Replica1 storages have no redundancy, so all units are upgraded at
+once without heal check.
+
+Upgrade runs in background, the operator doesn't reconcile a storage
+while it is being upgraded (See is_upgrading).
+
+Progress and timings of each unit are recorded in the status of the
+KadaluStorage.
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from itertools import zip_longest
+
+from kadalulib import logf
+from kubernetes import client
+from kubernetes.client.rest import ApiException
+from kubernetes.stream import stream
+
+NAMESPACE = os.environ.get("KADALU_NAMESPACE", "kadalu")
+VERSION = os.environ.get("KADALU_VERSION", "latest")
+
+# Number of storages upgraded in parallel
+UPGRADE_CONCURRENCY = int(os.environ.get("UPGRADE_CONCURRENCY", "2"))
+POD_READY_TIMEOUT = int(os.environ.get("UPGRADE_POD_READY_TIMEOUT", "600"))
+HEAL_WAIT_TIMEOUT = int(os.environ.get("UPGRADE_HEAL_WAIT_TIMEOUT", "3600"))
+CHECK_INTERVAL = 10
+
+GLFSHEAL_CMD = "/opt/libexec/glusterfs/glfsheal"
+VOLFILES_DIR = "/var/lib/kadalu/volfiles"
+
+CRD_GROUP = "kadalu-operator.storage"
+CRD_VERSION = "v1alpha1"
+CRD_PLURAL = "kadalustorages"
+
+PHASE_IN_PROGRESS = "InProgress"
+PHASE_COMPLETED = "Completed"
+PHASE_FAILED = "Failed"
+
+UNIT_PENDING = "Pending"
+UNIT_UPGRADING = "Upgrading"
+UNIT_WAITING_FOR_HEAL = "WaitingForHeal"
+UNIT_DONE = "Done"
+UNIT_FAILED = "Failed"
+
+
+# Storages being upgraded
+UPGRADING = set()
+UPGRADING_LOCK = threading.Lock()
+
+
+class UpgradeError(Exception):
+    """Upgrade of a storage can't proceed"""
+
+
+def mark_upgrading(volnames):
+    """Mark the storages as being upgraded"""
+    with UPGRADING_LOCK:
+        UPGRADING.update(volnames)
+
+
+def unmark_upgrading(volname):
+    """Upgrade of the storage is complete or failed"""
+    with UPGRADING_LOCK:
+        UPGRADING.discard(volname)
+
+
+def is_upgrading(volname):
+    """True if the storage is being upgraded"""
+    with UPGRADING_LOCK:
+        return volname in UPGRADING
+
+
+def now():
+    """Current time in RFC 3339 format"""
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def replica_groups(voltype, num_units, disperse=None):
+    """
+    List of groups of unit indexes which replicate each other.
+    Every unit is its own group for Replica1.
+    """
+    if voltype in ("Replica3", "Arbiter"):
+        size = 3
+    elif voltype == "Replica2":
+        size = 2
+    elif voltype == "Disperse":
+        disperse = disperse or {}
+        size = disperse.get("data", 0) + disperse.get("redundancy", 0)
+    else:
+        size = 1
+
+    size = max(size, 1)
+    return [list(range(idx, min(idx + size, num_units)))
+            for idx in range(0, num_units, size)]
+
+
+def upgrade_waves(voltype, groups):
+    """
+    Units to upgrade together. One unit of each group per wave, all
+    the units in one wave if the storage has no redundancy.
+    """
+    if voltype == "Replica1":
+        return [[idx for group in groups for idx in group]]
+
+    return [[idx for idx in wave if idx is not None]
+            for wave in zip_longest(*groups)]
+
+
+def is_statefulset_updated(sts):
+    """All the replicas are updated to the latest revision and Ready"""
+    status = sts.status
+    replicas = sts.spec.replicas or 0
+    return (
+        (status.observed_generation or 0) >= sts.metadata.generation and
+        status.update_revision == status.current_revision and
+        (status.updated_replicas or 0) == replicas and
+        (status.ready_replicas or 0) == replicas
+    )
+
+
+def wait_for_statefulset(apps_v1_client, name, timeout=POD_READY_TIMEOUT):
+    """Wait till the StatefulSet is rolled out and pod is Ready"""
+    end_time = time.time() + timeout
+    while time.time() < end_time:
+        sts = apps_v1_client.read_namespaced_stateful_set(name, NAMESPACE)
+        if is_statefulset_updated(sts):
+            return
+        time.sleep(CHECK_INTERVAL)
+
+    raise UpgradeError("Pod %s-0 is not Ready after upgrade" % name)
+
+
+def sum_counts(output, field):
+    """
+    Sum of the field of all bricks from the info-summary output.
+    None if any brick is not connected ("-" in place of count) or
+    nothing is reported.
+    """
+    counts = re.findall(r"^%s:\s*(\S+)\s*$" % re.escape(field),
+                        output, re.MULTILINE)
+    if not counts:
+        return None
+
+    total = 0
+    for count in counts:
+        if not count.isdigit():
+            return None
+        total += int(count)
+
+    return total
+
+
+def parse_heal_info_summary(output):
+    """
+    Heal pending and split-brain counts of the Storage from the
+    output of "glfsheal <volname> info-summary". Counts are None if
+    any brick is not connected or nothing is reported.
+    """
+    return {
+        "heal_pending": sum_counts(output, "Number of entries in heal pending"),
+        "split_brain": sum_counts(output, "Number of entries in split-brain")
+    }
+
+
+def heal_pending(core_v1_client, pod_name, volname):
+    """Heal counts of the Storage, run from the given server pod"""
+    output = stream(core_v1_client.connect_get_namespaced_pod_exec,
+                    pod_name, NAMESPACE,
+                    container="server",
+                    command=[GLFSHEAL_CMD, volname, "info-summary",
+                             "volfile-path",
+                             os.path.join(VOLFILES_DIR, "%s.vol" % volname)],
+                    stderr=True, stdin=False, stdout=True, tty=False)
+    return parse_heal_info_summary(output)
+
+
+def wait_for_heal(core_v1_client, pod_name, volname, timeout=HEAL_WAIT_TIMEOUT):
+    """
+    Wait till the heal pending count is zero. Split-brain entries
+    are not healed without manual resolution, so they are only
+    reported.
+    """
+    end_time = time.time() + timeout
+    while time.time() < end_time:
+        try:
+            counts = heal_pending(core_v1_client, pod_name, volname)
+        except ApiException as err:
+            logging.warning(logf("Failed to get heal info",
+                                 volname=volname, pod=pod_name, error=err))
+            counts = {"heal_pending": None, "split_brain": None}
+
+        if counts["heal_pending"] == 0:
+            if counts["split_brain"]:
+                logging.warning(logf("Entries in split-brain, resolve "
+                                     "them manually",
+                                     volname=volname,
+                                     split_brain=counts["split_brain"]))
+            return
+
+        logging.info(logf("Waiting for heal to complete",
+                          volname=volname,
+                          heal_pending=counts["heal_pending"]))
+        time.sleep(CHECK_INTERVAL)
+
+    raise UpgradeError("Heal is not complete in %d seconds" % timeout)
+
+
+class UpgradeStatus:
+    """Upgrade progress of a storage, saved in KadaluStorage status"""
+    def __init__(self, crds_client, volname, namespace, units):
+        self.crds_client = crds_client
+        self.volname = volname
+        self.namespace = namespace
+        self.status = {
+            "version": VERSION,
+            "phase": PHASE_IN_PROGRESS,
+            "concurrency": UPGRADE_CONCURRENCY,
+            "started_at": now(),
+            "units": [{"unit": idx, "pod": pod, "state": UNIT_PENDING}
+                      for idx, pod in enumerate(units)]
+        }
+
+    def unit(self, idx, **kwargs):
+        """Update the unit status"""
+        self.status["units"][idx].update(kwargs)
+        self.save()
+
+    def finish(self, phase, message=""):
+        """Mark the upgrade as complete or failed"""
+        self.status["phase"] = phase
+        self.status["completed_at"] = now()
+        if message:
+            self.status["message"] = message
+        self.save()
+
+    def save(self):
+        """Patch the status, upgrade continues even if it fails"""
+        if self.namespace is None:
+            return
+
+        try:
+            self.crds_client.patch_namespaced_custom_object_status(
+                CRD_GROUP, CRD_VERSION, self.namespace, CRD_PLURAL,
+                self.volname, {"status": {"upgrade": self.status}})
+        except ApiException as err:
+            logging.warning(logf("Failed to update upgrade status",
+                                 volname=self.volname, status=err.status,
+                                 reason=err.reason))
+
+
+def upgrade_wave(wave, bricks_template_args, apply_unit, status):
+    """
+    Apply the StatefulSets of the units of the wave and wait till
+    they are Ready. Returns the list of (unit, start time) of the
+    units which are upgraded.
+    """
+    apps_v1_client = client.AppsV1Api()
+    upgraded = []
+    for idx in wave:
+        start_time = time.time()
+        status.unit(idx, state=UNIT_UPGRADING, started_at=now())
+        if apply_unit(bricks_template_args[idx]):
+            upgraded.append((idx, start_time))
+        else:
+            status.unit(idx, state=UNIT_DONE, duration_seconds=0)
+
+    for idx, start_time in upgraded:
+        name = bricks_template_args[idx]["serverpod_name"]
+        try:
+            wait_for_statefulset(apps_v1_client, name)
+        except UpgradeError:
+            status.unit(idx, state=UNIT_FAILED)
+            raise
+        status.unit(idx, rollout_seconds=int(time.time() - start_time))
+
+    return upgraded
+
+
+def upgrade_storage(storage, apply_unit, status):
+    """
+    Upgrade the units of a storage in waves. storage is a tuple of
+    (volname, voltype, disperse, bricks_template_args).
+    apply_unit(template_args) applies the StatefulSet of a unit and
+    returns False if the manifest is not changed (Already upgraded).
+    """
+    volname, voltype, disperse, bricks_template_args = storage
+    core_v1_client = client.CoreV1Api()
+
+    # Don't take down a unit while its replica peers have
+    # entries pending heal. Heal info is for the whole Storage,
+    # check from any one of the pods.
+    if voltype != "Replica1":
+        wait_for_heal(core_v1_client,
+                      "%s-0" % bricks_template_args[0]["serverpod_name"],
+                      volname)
+
+    groups = replica_groups(voltype, len(bricks_template_args), disperse)
+    for wave in upgrade_waves(voltype, groups):
+        upgraded = upgrade_wave(wave, bricks_template_args, apply_unit, status)
+
+        if not upgraded or voltype == "Replica1":
+            for idx, start_time in upgraded:
+                status.unit(idx, state=UNIT_DONE,
+                            duration_seconds=int(time.time() - start_time))
+            continue
+
+        heal_start_time = time.time()
+        for idx, _ in upgraded:
+            status.unit(idx, state=UNIT_WAITING_FOR_HEAL)
+
+        pod_name = "%s-0" % bricks_template_args[upgraded[0][0]]["serverpod_name"]
+        try:
+            wait_for_heal(core_v1_client, pod_name, volname)
+        except UpgradeError:
+            for idx, _ in upgraded:
+                status.unit(idx, state=UNIT_FAILED)
+            raise
+
+        for idx, start_time in upgraded:
+            status.unit(idx, state=UNIT_DONE,
+                        heal_wait_seconds=int(time.time() - heal_start_time),
+                        duration_seconds=int(time.time() - start_time))
+
+        logging.info(logf("Upgraded storage units",
+                          volname=volname,
+                          units=",".join(str(idx) for idx, _ in upgraded)))
+
+
+def get_storage_namespaces(crds_client):
+    """Namespace of each KadaluStorage, required to update status"""
+    namespaces = {}
+    try:
+        resp = crds_client.list_cluster_custom_object(
+            CRD_GROUP, CRD_VERSION, CRD_PLURAL)
+    except ApiException as err:
+        logging.warning(logf("Failed to list KadaluStorages",
+                             status=err.status, reason=err.reason))
+        return namespaces
+
+    for item in resp.get("items", []):
+        metadata = item["metadata"]
+        namespaces[metadata["name"]] = metadata.get("namespace")
+
+    return namespaces
+
+
+def upgrade_storages(storages, apply_unit):
+    """
+    Upgrade the storages in parallel. storages is a list of
+    (volname, voltype, disperse, bricks_template_args).
+    Failure of one storage doesn't stop the upgrade of others.
+    """
+    mark_upgrading([storage[0] for storage in storages])
+    try:
+        run_upgrades(storages, apply_unit)
+    finally:
+        for storage in storages:
+            unmark_upgrading(storage[0])
+
+
+def run_upgrades(storages, apply_unit):
+    """Upgrade the storages in parallel (UPGRADE_CONCURRENCY)"""
+    crds_client = client.CustomObjectsApi()
+    namespaces = get_storage_namespaces(crds_client)
+
+    def upgrade_one(storage):
+        volname = storage[0]
+        status = UpgradeStatus(
+            crds_client, volname, namespaces.get(volname),
+            ["%s-0" % args["serverpod_name"] for args in storage[3]])
+        status.save()
+        start_time = time.time()
+        try:
+            upgrade_storage(storage, apply_unit, status)
+        except Exception as err:  # noqa # pylint: disable=broad-except
+            logging.error(logf("Storage upgrade failed",
+                               volname=volname, error=err))
+            status.finish(PHASE_FAILED, str(err))
+            return
+        finally:
+            # Reconcile of the storage can continue now
+            unmark_upgrading(volname)
+
+        status.finish(PHASE_COMPLETED)
+        logging.info(logf("Storage upgraded",
+                          volname=volname,
+                          duration_seconds=time.time() - start_time))
+
+    with ThreadPoolExecutor(max_workers=UPGRADE_CONCURRENCY) as executor:
+        list(executor.map(upgrade_one, storages))
+
+
+def start_upgrade(storages, apply_unit):
+    """Upgrade the storages in a background thread"""
+    thread = threading.Thread(target=upgrade_storages,
+                              args=(storages, apply_unit),
+                              name="upgrade", daemon=True)
+    thread.start()
+    return thread
@@ -1,12 +1,21 @@
 """Utility functions"""
 
+import ctypes
+import ctypes.util
+import json
 import logging
 import os
+import queue
+import random
+import select
 import signal
 import socket
+import socketserver
 import sqlite3
+import struct
 import subprocess
 import sys
+import threading
 import time
 
 import xxhash
@@ -33,6 +42,46 @@ PV_TYPE_RAWBLOCK = "rawblock"
 
 KADALU_VERSION = os.environ.get("KADALU_VERSION", "latest")
 
+# PID file of each process started by Monitor ("<name>.pid")
+PROC_PID_DIR = "/var/run/kadalu"
+
+# Control socket of the Monitor (See lib/monitorctl.py)
+MONITOR_SOCKET = os.environ.get("KADALU_MONITOR_SOCKET",
+                                os.path.join(PROC_PID_DIR, "monitor.sock"))
+MONITOR_EVENTS_QUEUE_SIZE = 1000
+
+# Restart of a crashed process is delayed exponentially from
+# RESTART_BACKOFF_BASE till RESTART_BACKOFF_MAX seconds (with jitter).
+# Failures are reset once the process runs for RESTART_RESET_SECONDS.
+# Processes failing CRASH_LOOP_THRESHOLD times in a row are reported
+# as in crash loop.
+RESTART_BACKOFF_BASE = float(os.environ.get("MONITOR_RESTART_BACKOFF_BASE", "1"))
+RESTART_BACKOFF_MAX = float(os.environ.get("MONITOR_RESTART_BACKOFF_MAX", "300"))
+RESTART_RESET_SECONDS = 60
+CRASH_LOOP_THRESHOLD = 5
+
+# Processes are stopped with SIGTERM, and killed if not exited
+# within this grace period.
+STOP_GRACE_SECONDS = float(os.environ.get("MONITOR_STOP_GRACE_SECONDS", "20"))
+
+# Monitor wakes up on SIGCHLD, this is the maximum sleep if
+# no signals are received.
+MONITOR_MAX_WAIT_SECONDS = 30
+
+# inotify events, see inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+INOTIFY_EVENT_HEADER = struct.Struct("iIII")
+
+# ConfigMap volume is updated by atomically renaming the "..data"
+# symlink to point to the new content dir.
+CONFIGMAP_DATA_LINK = "..data"
+
 
 class TimeoutOSError(OSError):
     """Timeout after retries"""
@@ -346,12 +395,63 @@ class Proc:
         return [self.command] + self.args
 
 
+def proc_pid_file(name):
+    """PID file of the process started by Monitor"""
+    return os.path.join(PROC_PID_DIR, "%s.pid" % name)
+
+
+def get_proc_pid(name):
+    """
+    PID of the process started by Monitor, None if the
+    process is not running
+    """
+    try:
+        with open(proc_pid_file(name), encoding="utf-8") as pid_file:
+            pid = int(pid_file.read().strip())
+    except (FileNotFoundError, ValueError):
+        return None
+
+    if not os.path.exists("/proc/%d" % pid):
+        return None
+
+    return pid
+
+
+def restart_delay(failures):
+    """Exponential backoff with jitter based on consecutive failures"""
+    if failures <= 0:
+        return 0
+
+    delay = min(RESTART_BACKOFF_MAX, RESTART_BACKOFF_BASE * 2 ** (failures - 1))
+    return min(RESTART_BACKOFF_MAX, delay * random.uniform(0.8, 1.2))
+
+
+def wait_process(subproc, deadline, name):
+    """Wait till the deadline for the process to exit, else SIGKILL"""
+    try:
+        subproc.wait(max(0, deadline - time.time()))
+    except subprocess.TimeoutExpired:
+        logging.warning(logf("Process not stopped in time, killing",
+                             name=name))
+        subproc.kill()
+        subproc.wait()
+
+
 class ProcState:
     """Handle Process states"""
+    # noqa # pylint: disable=too-many-instance-attributes
     def __init__(self, proc):
         self.proc = proc
         self.enabled = True
         self.subproc = None
+        self.start_time = 0
+        self.restarts = 0
+        self.last_exit_code = None
+        self.failures = 0
+        self.restart_at = None
+        # Set while the process is being restarted by a control
+        # request, the monitor loop doesn't handle its exit.
+        self.restarting = False
 
     def start(self):
         """Start a Process"""
@@ -362,18 +462,185 @@ class ProcState:
                                         stderr=sys.stderr,
                                         universal_newlines=True,
                                         env=os.environ)
+        self.start_time = time.time()
+        self.restart_at = None
+        # Other processes can signal this process using the PID
+        makedirs(PROC_PID_DIR)
+        with open(proc_pid_file(self.proc.name), "w",
+                  encoding="utf-8") as pid_file:
+            pid_file.write("%d" % self.subproc.pid)
+
+    def remove_pid_file(self):
+        """Remove the PID file once the process is exited"""
+        try:
+            os.remove(proc_pid_file(self.proc.name))
+        except FileNotFoundError:
+            pass
+
+    def terminate(self):
+        """Send SIGTERM, the process is expected to exit gracefully"""
+        if self.is_running():
+            self.subproc.terminate()
+
+    def wait(self, deadline):
+        """Wait till the deadline for the process to exit, else SIGKILL"""
+        if self.subproc is None:
+            return
+
+        wait_process(self.subproc, deadline, self.proc.name)
+        self.subproc = None
+        self.remove_pid_file()
 
-    def stop(self):
-        """Stop a Process"""
-        if self.subproc is not None:
-            self.subproc.kill()
-            self.subproc.communicate()
-            self.subproc = None
+    def stop(self, grace=STOP_GRACE_SECONDS):
+        """Stop a Process, SIGTERM and then SIGKILL after grace period"""
+        self.restart_at = None
+        self.terminate()
+        self.wait(time.time() + grace)
 
     def restart(self):
         """Restart a Process"""
         self.stop()
         self.start()
+        self.restarts += 1
+
+    def exited(self, ret):
+        """
+        Process exited, schedule the restart with a delay based on
+        the number of consecutive failures. Returns the delay.
+        """
+        self.last_exit_code = ret
+        self.subproc = None
+        self.remove_pid_file()
+
+        if time.time() - self.start_time >= RESTART_RESET_SECONDS:
+            self.failures = 0
+        self.failures += 1
+
+        delay = restart_delay(self.failures)
+        self.restart_at = time.time() + delay
+        return delay
+
+    def is_running(self):
+        """True if the process is started and not yet exited"""
+        return self.subproc is not None and self.subproc.poll() is None
+
+    def is_crash_loop(self):
+        """True if the process is failing repeatedly"""
+        return self.failures >= CRASH_LOOP_THRESHOLD
+
+    def info(self):
+        """Process details returned by the control API"""
+        running = self.is_running()
+        next_restart = 0
+        if self.restart_at is not None:
+            next_restart = max(0, int(self.restart_at - time.time()))
+
+        return {
+            "name": self.proc.name,
+            "pid": self.subproc.pid if running else None,
+            "running": running,
+            "enabled": self.enabled,
+            "uptime_seconds": int(time.time() - self.start_time) if running else 0,
+            "restarts": self.restarts,
+            "last_exit_code": self.last_exit_code,
+            "consecutive_failures": self.failures,
+            "crash_loop": self.is_crash_loop(),
+            "next_restart_in_seconds": next_restart
+        }
+
+
+def control_list(monitor, _name, _req):
+    """Control request: Status of all the processes"""
+    return {"ok": True, "processes": monitor.list_processes()}
+
+
+def control_health(monitor, _name, _req):
+    """Control request: Health and status of all the processes"""
+    return {"ok": monitor.is_healthy(),
+            "processes": monitor.list_processes()}
+
+
+def control_signal(monitor, name, req):
+    """Control request: Send the signal (SIGHUP by default)"""
+    signame = req.get("signal", "SIGHUP")
+    if not signame.startswith("SIG"):
+        signame = "SIG" + signame
+    monitor.signal_process(name, signal.Signals[signame])
+    return {"ok": True}
+
+
+def control_restart(monitor, name, _req):
+    """Control request: Restart the process"""
+    monitor.restart_process(name)
+    return {"ok": True}
+
+
+# Control command => (handler, True if the command is for a process)
+CONTROL_HANDLERS = {
+    "list": (control_list, False),
+    "health": (control_health, False),
+    "reload": (control_signal, True),
+    "signal": (control_signal, True),
+    "restart": (control_restart, True)
+}
+
+
+class MonitorControlHandler(socketserver.StreamRequestHandler):
+    """
+    Handle a request to the Monitor control socket. Request is a
+    JSON line, for example {"cmd": "reload", "name": "glusterfsd"}.
+    Response is a JSON line with "ok" and other details. The "events"
+    request keeps the connection open and streams the events as
+    JSON lines.
+    """
+    def reply(self, resp):
+        """Send a JSON line"""
+        self.wfile.write((json.dumps(resp) + "\n").encode())
+        self.wfile.flush()
+
+    def handle(self):
+        monitor = self.server.monitor
+        try:
+            req = json.loads(self.rfile.readline())
+            cmd = req.get("cmd", "")
+            if cmd == "events":
+                self.stream_events(monitor)
+                return
+
+            self.reply(monitor.handle_control_request(cmd, req))
+        except (ValueError, AttributeError) as err:
+            self.reply({"ok": False, "error": "Invalid request: %s" % err})
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def stream_events(self, monitor):
+        """Send events till the client disconnects"""
+        events = monitor.subscribe()
+        try:
+            self.reply({"ok": True})
+            while True:
+                self.reply(events.get())
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            monitor.unsubscribe(events)
+
+
+class MonitorControlServer(socketserver.ThreadingMixIn,
+                           socketserver.UnixStreamServer):
+    """Unix socket server of the Monitor control API"""
+    daemon_threads = True
+
+    def __init__(self, path, monitor):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+        makedirs(os.path.dirname(path))
+        super().__init__(path, MonitorControlHandler)
+        os.chmod(path, 0o600)
+        self.monitor = monitor
 
 
 class Monitor:
@@ -381,8 +648,19 @@ class Monitor:
     def __init__(self, procs=None):
         self.procs = {}
         self.terminating = False
+        self.lock = threading.RLock()
+        self.subscribers = []
+        self.control_server = None
         signal.signal(signal.SIGINT, self.exit_gracefully)
         signal.signal(signal.SIGTERM, self.exit_gracefully)
+        signal.signal(signal.SIGCHLD, self.child_exited)
+
+        # Signal handlers write to this pipe and wake up the monitor
+        # loop, so exited processes are handled immediately.
+        self.wakeup_rfd, self.wakeup_wfd = os.pipe()
+        os.set_blocking(self.wakeup_rfd, False)
+        os.set_blocking(self.wakeup_wfd, False)
+        signal.set_wakeup_fd(self.wakeup_wfd)
         if procs is not None:
             for proc in procs:
                 self.procs[proc.name] = ProcState(proc)
@@ -393,66 +671,282 @@ class Monitor:
 
     def start_all(self):
         """Start all Managed Processes"""
-        for name, state in self.procs.items():
-            state.start()
-            logging.info(logf("Started Process", name=name))
+        with self.lock:
+            for name, state in self.procs.items():
+                state.start()
+                self.emit("started", name, pid=state.subproc.pid)
+                logging.info(logf("Started Process", name=name))
+
+        self.start_control_server()
+
+    def stop_all(self, grace=STOP_GRACE_SECONDS):
+        """
+        Stop all Managed Processes. SIGTERM is sent to all the processes
+        first and then waits for all of them till the grace period.
+        """
+        with self.lock:
+            deadline = time.time() + grace
+            for state in self.procs.values():
+                state.restart_at = None
+                state.terminate()
 
-    def stop_all(self):
-        """Stop all Managed Processes"""
-        for name, state in self.procs.items():
-            state.stop()
-            logging.info(logf("Stopped Process", name=name))
+            for name, state in self.procs.items():
+                state.wait(deadline)
+                self.emit("stopped", name)
+                logging.info(logf("Stopped Process", name=name))
 
     def restart_all(self):
         """Restart all managed Processes"""
-        for name, state in self.procs.items():
-            state.restart()
-            logging.info(logf("Restarted Process", name=name))
+        with self.lock:
+            for name, state in self.procs.items():
+                state.restart()
+                self.emit("restarted", name, pid=state.subproc.pid)
+                logging.info(logf("Restarted Process", name=name))
+
+    def start_control_server(self, path=MONITOR_SOCKET):
+        """Serve the control API in a background thread"""
+        try:
+            self.control_server = MonitorControlServer(path, self)
+        except OSError as err:
+            logging.warning(logf("Failed to start Monitor control socket",
+                                 path=path, error=err))
+            return
+
+        thread = threading.Thread(target=self.control_server.serve_forever,
+                                  name="monitor-control", daemon=True)
+        thread.start()
+        logging.info(logf("Monitor control socket started", path=path))
+
+    def subscribe(self):
+        """Queue to receive the lifecycle events"""
+        events = queue.Queue(MONITOR_EVENTS_QUEUE_SIZE)
+        with self.lock:
+            self.subscribers.append(events)
+        return events
+
+    def unsubscribe(self, events):
+        """Stop sending events to the queue"""
+        with self.lock:
+            if events in self.subscribers:
+                self.subscribers.remove(events)
+
+    def emit(self, event, name, **kwargs):
+        """Send the lifecycle event to all subscribers"""
+        data = {"event": event, "name": name, "time": time.time()}
+        data.update(kwargs)
+        with self.lock:
+            for events in self.subscribers:
+                try:
+                    events.put_nowait(data)
+                except queue.Full:
+                    # Slow subscriber, drop the event
+                    pass
+
+    def list_processes(self):
+        """Details of all managed processes"""
+        with self.lock:
+            return [state.info() for state in self.procs.values()]
+
+    def signal_process(self, name, signum):
+        """Send a signal to the managed process"""
+        with self.lock:
+            state = self.procs[name]
+            if not state.is_running():
+                raise ProcessLookupError("Process %s is not running" % name)
+            state.subproc.send_signal(signum)
+            self.emit("signalled", name, pid=state.subproc.pid,
+                      signal=signal.Signals(signum).name)
+
+    def restart_process(self, name):
+        """
+        Restart the managed process. The lock is not held while
+        waiting for the old process to stop, so the monitor loop and
+        the other control requests are not blocked.
+        """
+        with self.lock:
+            state = self.procs[name]
+            if state.restarting:
+                raise ProcessLookupError("Process %s is already restarting"
+                                         % name)
+            state.restarting = True
+            state.restart_at = None
+            subproc = state.subproc
+            state.terminate()
+
+        try:
+            if subproc is not None:
+                wait_process(subproc, time.time() + STOP_GRACE_SECONDS, name)
+
+            with self.lock:
+                state.subproc = None
+                state.remove_pid_file()
+                state.start()
+                state.restarts += 1
+                self.emit("restarted", name, pid=state.subproc.pid)
+        finally:
+            with self.lock:
+                state.restarting = False
+
+        logging.info(logf("Restarted Process", name=name))
+
+    def is_healthy(self):
+        """True if all the enabled processes are running"""
+        with self.lock:
+            return all(state.is_running() for state in self.procs.values()
+                       if state.enabled)
+
+    def handle_control_request(self, cmd, req):
+        """Handle the request received on the control socket"""
+        if cmd not in CONTROL_HANDLERS:
+            return {"ok": False, "error": "Unknown command %s" % cmd}
+
+        handler, for_process = CONTROL_HANDLERS[cmd]
+        name = req.get("name", "")
+        if for_process and name not in self.procs:
+            return {"ok": False, "error": "Unknown process %s" % name}
+
+        try:
+            return handler(self, name, req)
+        except (KeyError, ProcessLookupError) as err:
+            return {"ok": False, "error": str(err)}
 
     def exit_gracefully(self, _signum, _frame):
         """When SIGTERM/SIGINT received"""
         self.terminating = True
 
-    def monitor_proc(self, state, terminating):
-        """Monitor single process"""
-        if not state.enabled:
-            return
-
-        if terminating:
-            state.stop()
-            logging.info(logf("Terminated Process", name=state.proc.name))
-            return
+    def child_exited(self, _signum, _frame):
+        """
+        SIGCHLD handler, nothing to do here. Wakeup fd makes the
+        monitor loop to handle the exited process.
+        """
 
-        ret = state.subproc.poll()
-        if ret is None:
-            return
+    def wait_for_signal(self, timeout):
+        """Sleep till a signal is received or till the timeout"""
+        ready, _, _ = select.select([self.wakeup_rfd], [], [], timeout)
+        if ready:
+            try:
+                while os.read(self.wakeup_rfd, 512):
+                    pass
+            except BlockingIOError:
+                pass
 
-        if not terminating:
-            state.restart()
-            logging.info(logf("Restarted Process", name=state.proc.name))
+    def monitor_proc(self, state):
+        """
+        Monitor single process. Returns the seconds till the next
+        scheduled restart, or None.
+        """
+        if not state.enabled or state.restarting:
+            return None
+
+        if state.subproc is not None:
+            ret = state.subproc.poll()
+            if ret is None:
+                return None
+
+            delay = state.exited(ret)
+            self.emit("exited", state.proc.name, exit_code=ret,
+                      restart_in_seconds=delay,
+                      crash_loop=state.is_crash_loop())
+            log_func = logging.error if state.is_crash_loop() else logging.info
+            log_func(logf("Process exited",
+                          name=state.proc.name,
+                          exit_code=ret,
+                          consecutive_failures=state.failures,
+                          restart_in_seconds=round(delay, 1)))
+
+        if state.restart_at is None:
+            return None
+
+        remaining = state.restart_at - time.time()
+        if remaining > 0:
+            return remaining
+
+        state.start()
+        state.restarts += 1
+        self.emit("restarted", state.proc.name, pid=state.subproc.pid)
+        logging.info(logf("Restarted Process", name=state.proc.name))
+        return None
 
     def monitor(self):
         """
-        Start monitoring all the started processes.
-        Restart processes on failure
+        Start monitoring all the started processes. Restart
+        processes on failure with exponential backoff. Stop all
+        processes gracefully when SIGTERM/SIGINT is received.
         """
         try:
-            while True:
-                terminating = self.terminating
-
-                for _, state in self.procs.items():
-                    self.monitor_proc(state, terminating)
-
-                if terminating:
-                    logging.info("Terminating Monitor process")
-                    sys.exit(0)
-
-                time.sleep(1)
+            while not self.terminating:
+                timeout = MONITOR_MAX_WAIT_SECONDS
+                with self.lock:
+                    for state in self.procs.values():
+                        remaining = self.monitor_proc(state)
+                        if remaining is not None:
+                            timeout = min(timeout, remaining)
+
+                self.wait_for_signal(timeout)
+
+            logging.info("Terminating Monitor process")
+            self.stop_all()
+            sys.exit(0)
         except KeyboardInterrupt:
             self.terminating = True
+            self.stop_all()
             sys.exit(1)
 
 
+class Inotify:
+    """Minimal inotify(7) wrapper using ctypes"""
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6",
+                                use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+    def add_watch(self, path, mask):
+        """Watch the path for the events in mask"""
+        wdesc = self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wdesc < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+
+        return wdesc
+
+    def read_events(self, timeout=None):
+        """
+        Wait for the events and return the list of (wd, mask, name).
+        Empty list if no events till the timeout.
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+
+        buf = os.read(self.fd, 64 * 1024)
+        events = []
+        offset = 0
+        while offset < len(buf):
+            wdesc, mask, _, length = INOTIFY_EVENT_HEADER.unpack_from(buf, offset)
+            offset += INOTIFY_EVENT_HEADER.size
+            name = buf[offset:offset + length].rstrip(b"\0").decode()
+            offset += length
+            events.append((wdesc, mask, name))
+
+        return events
+
+    def close(self):
+        """Close the inotify instance"""
+        os.close(self.fd)
+
+
+def is_configmap_updated(events):
+    """Check if ConfigMap volume is updated from the inotify events"""
+    for _, mask, name in events:
+        if mask & IN_MOVED_TO and name == CONFIGMAP_DATA_LINK:
+            return True
+
+    return False
+
+
 def get_single_pv_per_pool(data):
     """
     Extract single PV per pool backward compatible way. Both
@@ -0,0 +1,124 @@
+"""
+Client of the Monitor control socket (See kadalulib.Monitor).
+
+Usage:
+
+    python3 monitorctl.py list
+    python3 monitorctl.py health          # Exit code 0 if healthy
+    python3 monitorctl.py reload <name> [<signal>]
+    python3 monitorctl.py restart <name>
+    python3 monitorctl.py events
+"""
+
+import json
+import os
+import socket
+import sys
+
+MONITOR_SOCKET = os.environ.get("KADALU_MONITOR_SOCKET",
+                                "/var/run/kadalu/monitor.sock")
+REQUEST_TIMEOUT = 10
+
+
+class MonitorCtlError(Exception):
+    """Control request failed"""
+
+
+def connect(path=MONITOR_SOCKET, timeout=REQUEST_TIMEOUT):
+    """Connect to the control socket"""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    sock.connect(path)
+    return sock
+
+
+def request(cmd, path=MONITOR_SOCKET, **kwargs):
+    """Send the request and return the response"""
+    req = {"cmd": cmd}
+    req.update(kwargs)
+    with connect(path) as sock:
+        sock.sendall((json.dumps(req) + "\n").encode())
+        with sock.makefile("r") as resp_file:
+            resp = json.loads(resp_file.readline())
+
+    if not resp.get("ok", False) and "error" in resp:
+        raise MonitorCtlError(resp["error"])
+
+    return resp
+
+
+def list_processes(path=MONITOR_SOCKET):
+    """List of managed processes with pid, uptime and restarts"""
+    return request("list", path)["processes"]
+
+
+def monitored_processes(path=MONITOR_SOCKET):
+    """
+    List of managed processes, empty list if the Monitor
+    control socket is not available. Used by the exporters.
+    """
+    try:
+        return list_processes(path)
+    except (OSError, ValueError, MonitorCtlError):
+        return []
+
+
+def is_healthy(path=MONITOR_SOCKET):
+    """True if all the managed processes are running"""
+    return request("health", path)["ok"]
+
+
+def reload(name, signame="SIGHUP", path=MONITOR_SOCKET):
+    """Send the reload signal to the named process"""
+    request("reload", path, name=name, signal=signame)
+
+
+def restart(name, path=MONITOR_SOCKET):
+    """Restart the named process"""
+    request("restart", path, name=name)
+
+
+def events(path=MONITOR_SOCKET):
+    """Generator of the lifecycle events"""
+    with connect(path, timeout=None) as sock:
+        sock.sendall((json.dumps({"cmd": "events"}) + "\n").encode())
+        with sock.makefile("r") as resp_file:
+            # First line is the acknowledgement
+            resp_file.readline()
+            for line in resp_file:
+                yield json.loads(line)
+
+
+def main():
+    """CLI"""
+    args = sys.argv[1:]
+    if not args:
+        print(__doc__)
+        return 1
+
+    try:
+        if args[0] == "list":
+            print(json.dumps(list_processes(), indent=4))
+        elif args[0] == "health":
+            return 0 if is_healthy() else 1
+        elif args[0] == "reload" and len(args) in (2, 3):
+            reload(*args[1:])
+        elif args[0] == "restart" and len(args) == 2:
+            restart(args[1])
+        elif args[0] == "events":
+            for event in events():
+                print(json.dumps(event), flush=True)
+        else:
+            print(__doc__)
+            return 1
+    except (OSError, MonitorCtlError) as err:
+        print("Error: %s" % err, file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        pass
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
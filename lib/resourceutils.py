@@ -0,0 +1,606 @@
+"""
+Resource usage sampling for Kadalu components
+
+Detects the cgroup layout (v1 or v2) of the current container and
+reads CPU, memory, pressure (PSI) and I/O usage from it. Usage of
+individual processes (glusterfs FUSE clients, glusterfsd and shd) is
+read from /proc/<pid>.
+"""
+
+import logging
+import math
+import os
+
+from kadalulib import logf
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+PROC_DIR = "/proc"
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+# Value reported when a stat is not available (For example, PSI
+# is not enabled in the kernel or LXD containers without cgroup)
+UNAVAILABLE = -1
+
+# Bounds of the thread counts derived from the available CPUs
+# (See thread_counts)
+MAX_EVENT_THREADS = 16
+MIN_IO_THREADS = 4
+MAX_IO_THREADS = 64
+IO_THREADS_PER_CPU = 4
+MAX_READER_THREADS = 8
+
+# v1 controllers of interest and the name used in /proc/self/cgroup
+V1_CONTROLLERS = ["cpu", "cpuacct", "memory", "blkio"]
+
+
+def read_file(path):
+    """Read a small stat file, return None if not available"""
+    try:
+        with open(path) as stat_file:
+            return stat_file.read().strip()
+    except (OSError, IOError):
+        return None
+
+
+def read_int(path):
+    """Read a file containing a single integer"""
+    content = read_file(path)
+    if content is None:
+        return UNAVAILABLE
+
+    try:
+        return int(content)
+    except ValueError:
+        # memory.max can be "max"
+        return UNAVAILABLE
+
+
+def read_keyed(path):
+    """Read "key value" per line stat files like cpu.stat"""
+    data = {}
+    content = read_file(path)
+    if content is None:
+        return data
+
+    for line in content.splitlines():
+        parts = line.split()
+        if len(parts) != 2:
+            continue
+        try:
+            data[parts[0]] = int(parts[1])
+        except ValueError:
+            continue
+
+    return data
+
+
+def parse_mountinfo(mountinfo_path=os.path.join(PROC_DIR, "self", "mountinfo")):
+    """
+    Returns list of cgroup mounts as tuples of
+    (fstype, root, mountpoint, super options)
+    """
+    mounts = []
+    content = read_file(mountinfo_path)
+    if content is None:
+        return mounts
+
+    for line in content.splitlines():
+        # Format: id parent major:minor root mountpoint options
+        # [optional fields] - fstype source superoptions
+        pre, _, post = line.partition(" - ")
+        pre_fields = pre.split()
+        post_fields = post.split()
+        if len(pre_fields) < 5 or len(post_fields) < 3:
+            continue
+
+        fstype = post_fields[0]
+        if fstype not in ("cgroup", "cgroup2"):
+            continue
+
+        mounts.append((fstype, pre_fields[3], pre_fields[4], post_fields[2]))
+
+    return mounts
+
+
+def parse_proc_cgroup(cgroup_path=os.path.join(PROC_DIR, "self", "cgroup")):
+    """
+    Returns mapping of controller name to cgroup path. cgroup v2
+    unified hierarchy is returned with empty controller name.
+    """
+    paths = {}
+    content = read_file(cgroup_path)
+    if content is None:
+        return paths
+
+    for line in content.splitlines():
+        parts = line.split(":", 2)
+        if len(parts) != 3:
+            continue
+
+        if parts[1] == "":
+            paths[""] = parts[2]
+            continue
+
+        for controller in parts[1].split(","):
+            paths[controller] = parts[2]
+
+    return paths
+
+
+def resolve_cgroup_dir(mountpoint, mount_root, path):
+    """
+    Join the cgroup path from /proc/self/cgroup with the mountpoint.
+    Inside a cgroup namespace the path is "/" and mount root is the
+    container's cgroup. If the host cgroupfs is mounted inside the
+    container (server pods), the path is the full host path.
+    """
+    if mount_root != "/" and path.startswith(mount_root):
+        path = path[len(mount_root):]
+
+    candidate = os.path.join(mountpoint, path.lstrip("/"))
+    if os.path.isdir(candidate):
+        return candidate
+
+    return mountpoint
+
+
+class CgroupInfo:
+    """Detected cgroup layout of the current process"""
+    # noqa # pylint: disable=too-few-public-methods
+    def __init__(self, version, dirs):
+        self.version = version
+        self.dirs = dirs
+
+    def path(self, controller, filename):
+        """Path of the stat file in the given controller"""
+        if self.version == 2:
+            return os.path.join(self.dirs.get("", CGROUP_ROOT), filename)
+
+        cgdir = self.dirs.get(controller, None)
+        if cgdir is None:
+            return None
+
+        return os.path.join(cgdir, filename)
+
+
+def detect_cgroup():
+    """Detect cgroup version and the directories of this container"""
+    mounts = parse_mountinfo()
+    proc_paths = parse_proc_cgroup()
+
+    v1_dirs = {}
+    v2_dir = None
+    for fstype, root, mountpoint, superopts in mounts:
+        if fstype == "cgroup2":
+            if v2_dir is None:
+                v2_dir = resolve_cgroup_dir(mountpoint, root,
+                                            proc_paths.get("", "/"))
+            continue
+
+        for controller in V1_CONTROLLERS:
+            if controller in superopts.split(",") and controller not in v1_dirs:
+                v1_dirs[controller] = resolve_cgroup_dir(
+                    mountpoint, root, proc_paths.get(controller, "/"))
+
+    # Hybrid setups mount cgroup2 as well, but controllers are still
+    # available only in v1 hierarchy.
+    if v1_dirs.get("memory", None) is not None:
+        return CgroupInfo(1, v1_dirs)
+
+    if v2_dir is not None:
+        return CgroupInfo(2, {"": v2_dir})
+
+    # Fallback when mountinfo is not readable
+    if os.path.exists(os.path.join(CGROUP_ROOT, "cgroup.controllers")):
+        return CgroupInfo(2, {"": CGROUP_ROOT})
+
+    return CgroupInfo(1, {
+        "cpu": os.path.join(CGROUP_ROOT, "cpu"),
+        "cpuacct": os.path.join(CGROUP_ROOT, "cpuacct"),
+        "memory": os.path.join(CGROUP_ROOT, "memory"),
+        "blkio": os.path.join(CGROUP_ROOT, "blkio"),
+    })
+
+
+def parse_psi(path):
+    """
+    Parse pressure stall information file. Returns
+    {"some": {"avg10": .., "avg60": .., "avg300": .., "total": ..},
+     "full": {...}}
+    """
+    psi = {}
+    content = read_file(path)
+    if content is None:
+        return psi
+
+    for line in content.splitlines():
+        parts = line.split()
+        if not parts:
+            continue
+        values = {}
+        for field in parts[1:]:
+            key, _, value = field.partition("=")
+            try:
+                values[key] = float(value) if key != "total" else int(value)
+            except ValueError:
+                continue
+        psi[parts[0]] = values
+
+    return psi
+
+
+def parse_io_stat_v2(path):
+    """Sum rbytes/wbytes/rios/wios of all devices from io.stat"""
+    totals = {"read_bytes": 0, "write_bytes": 0, "read_ios": 0, "write_ios": 0}
+    content = read_file(path)
+    if content is None:
+        return None
+
+    keys = {"rbytes": "read_bytes", "wbytes": "write_bytes",
+            "rios": "read_ios", "wios": "write_ios"}
+    for line in content.splitlines():
+        for field in line.split()[1:]:
+            key, _, value = field.partition("=")
+            if key in keys:
+                totals[keys[key]] += int(value)
+
+    return totals
+
+
+def parse_blkio_v1(bytes_path, ios_path):
+    """Sum Read/Write of all devices from blkio throttle stats"""
+    totals = {"read_bytes": 0, "write_bytes": 0, "read_ios": 0, "write_ios": 0}
+    found = False
+    for path, suffix in [(bytes_path, "bytes"), (ios_path, "ios")]:
+        content = read_file(path) if path is not None else None
+        if content is None:
+            continue
+
+        found = True
+        for line in content.splitlines():
+            parts = line.split()
+            if len(parts) != 3:
+                continue
+            if parts[1] == "Read":
+                totals["read_" + suffix] += int(parts[2])
+            elif parts[1] == "Write":
+                totals["write_" + suffix] += int(parts[2])
+
+    return totals if found else None
+
+
+class CgroupSampler:
+    """
+    Samples resource usage of the container's cgroup
+
+    Usage:
+
+    sampler = CgroupSampler()
+    data = sampler.sample()
+    """
+    def __init__(self, cgroup=None):
+        self.cgroup = cgroup if cgroup is not None else detect_cgroup()
+
+    def cpu_usage_ns(self):
+        """Total CPU time consumed in nanoseconds"""
+        if self.cgroup.version == 2:
+            stat = read_keyed(self.cgroup.path("cpu", "cpu.stat"))
+            if "usage_usec" in stat:
+                return stat["usage_usec"] * 1000
+            return UNAVAILABLE
+
+        path = self.cgroup.path("cpuacct", "cpuacct.usage")
+        if path is None:
+            return UNAVAILABLE
+        return read_int(path)
+
+    def cpu_throttling(self):
+        """Number of throttled periods and throttled time(ns)"""
+        if self.cgroup.version == 2:
+            stat = read_keyed(self.cgroup.path("cpu", "cpu.stat"))
+            return {
+                "nr_periods": stat.get("nr_periods", UNAVAILABLE),
+                "nr_throttled": stat.get("nr_throttled", UNAVAILABLE),
+                "throttled_ns": stat["throttled_usec"] * 1000
+                                if "throttled_usec" in stat else UNAVAILABLE
+            }
+
+        path = self.cgroup.path("cpu", "cpu.stat")
+        stat = read_keyed(path) if path is not None else {}
+        return {
+            "nr_periods": stat.get("nr_periods", UNAVAILABLE),
+            "nr_throttled": stat.get("nr_throttled", UNAVAILABLE),
+            "throttled_ns": stat.get("throttled_time", UNAVAILABLE)
+        }
+
+    def cpu_limit(self):
+        """
+        Number of CPUs available as per CFS quota. Returns None if
+        no quota is set.
+        """
+        quota = UNAVAILABLE
+        period = UNAVAILABLE
+        if self.cgroup.version == 2:
+            content = read_file(self.cgroup.path("cpu", "cpu.max"))
+            if content is not None:
+                parts = content.split()
+                if len(parts) == 2 and parts[0] != "max":
+                    quota = int(parts[0])
+                    period = int(parts[1])
+        else:
+            quota_path = self.cgroup.path("cpu", "cpu.cfs_quota_us")
+            period_path = self.cgroup.path("cpu", "cpu.cfs_period_us")
+            if quota_path is not None and period_path is not None:
+                quota = read_int(quota_path)
+                period = read_int(period_path)
+
+        if quota <= 0 or period <= 0:
+            return None
+
+        return quota / period
+
+    def memory_usage_bytes(self):
+        """Current memory usage"""
+        if self.cgroup.version == 2:
+            return read_int(self.cgroup.path("memory", "memory.current"))
+
+        path = self.cgroup.path("memory", "memory.usage_in_bytes")
+        if path is None:
+            return UNAVAILABLE
+        return read_int(path)
+
+    def memory_limit_bytes(self):
+        """Memory limit, -1 if unlimited or not available"""
+        if self.cgroup.version == 2:
+            return read_int(self.cgroup.path("memory", "memory.max"))
+
+        path = self.cgroup.path("memory", "memory.limit_in_bytes")
+        if path is None:
+            return UNAVAILABLE
+
+        limit = read_int(path)
+        # Unlimited in v1 is reported as a huge page aligned number
+        if limit >= (1 << 62):
+            return UNAVAILABLE
+        return limit
+
+    def memory_stat(self):
+        """Selected fields from memory.stat"""
+        path = self.cgroup.path("memory", "memory.stat")
+        stat = read_keyed(path) if path is not None else {}
+        if self.cgroup.version == 2:
+            return {
+                "rss_bytes": stat.get("anon", UNAVAILABLE),
+                "cache_bytes": stat.get("file", UNAVAILABLE),
+            }
+
+        return {
+            "rss_bytes": stat.get("total_rss", stat.get("rss", UNAVAILABLE)),
+            "cache_bytes": stat.get("total_cache", stat.get("cache", UNAVAILABLE)),
+        }
+
+    def pressure(self):
+        """PSI of cpu, memory and io. Only available with cgroup v2"""
+        if self.cgroup.version != 2:
+            return {}
+
+        data = {}
+        for resource in ["cpu", "memory", "io"]:
+            psi = parse_psi(self.cgroup.path(resource, "%s.pressure" % resource))
+            if psi:
+                data[resource] = psi
+
+        return data
+
+    def io(self):
+        """Total read/write bytes and IOs of the cgroup"""
+        if self.cgroup.version == 2:
+            totals = parse_io_stat_v2(self.cgroup.path("io", "io.stat"))
+        else:
+            totals = parse_blkio_v1(
+                self.cgroup.path("blkio", "blkio.throttle.io_service_bytes"),
+                self.cgroup.path("blkio", "blkio.throttle.io_serviced"))
+
+        if totals is None:
+            return {"read_bytes": UNAVAILABLE, "write_bytes": UNAVAILABLE,
+                    "read_ios": UNAVAILABLE, "write_ios": UNAVAILABLE}
+
+        return totals
+
+    def sample(self):
+        """Collect all the stats of the cgroup"""
+        cpu_limit = self.cpu_limit()
+        data = {
+            "cgroup_version": self.cgroup.version,
+            "cpu_usage_in_nanoseconds": self.cpu_usage_ns(),
+            "cpu_limit_cores": cpu_limit if cpu_limit is not None else UNAVAILABLE,
+            "cpu_throttling": self.cpu_throttling(),
+            "memory_usage_in_bytes": self.memory_usage_bytes(),
+            "memory_limit_in_bytes": self.memory_limit_bytes(),
+            "io": self.io(),
+            "pressure": self.pressure()
+        }
+        data.update(self.memory_stat())
+        return data
+
+
+def read_cmdline(pid):
+    """Command line args of a process"""
+    content = None
+    try:
+        with open(os.path.join(PROC_DIR, str(pid), "cmdline"), "rb") as cmd_file:
+            content = cmd_file.read()
+    except (OSError, IOError):
+        return []
+
+    return [arg.decode("utf-8", "replace")
+            for arg in content.split(b"\0") if arg]
+
+
+def get_arg_value(args, name):
+    """
+    Value of an argument from cmdline list, supports both
+    "--name value" and "--name=value" forms
+    """
+    for idx, arg in enumerate(args):
+        if arg == name and idx + 1 < len(args):
+            return args[idx + 1]
+        if arg.startswith(name + "="):
+            return arg[len(name) + 1:]
+
+    return None
+
+
+def sample_process(pid):
+    """
+    CPU, memory and I/O usage of a single process from /proc/<pid>.
+    Returns None if the process exited.
+    """
+    pid_dir = os.path.join(PROC_DIR, str(pid))
+    stat = read_file(os.path.join(pid_dir, "stat"))
+    if stat is None:
+        return None
+
+    # Process name can contain spaces, fields start after ")"
+    fields = stat[stat.rfind(")") + 2:].split()
+    if len(fields) < 22:
+        return None
+
+    utime = int(fields[11])
+    stime = int(fields[12])
+    num_threads = int(fields[17])
+    rss_pages = int(fields[21])
+
+    data = {
+        "pid": pid,
+        "cpu_usage_in_nanoseconds": (utime + stime) * (10 ** 9) // CLOCK_TICKS,
+        "memory_usage_in_bytes": rss_pages * PAGE_SIZE,
+        "threads": num_threads,
+        "read_bytes": UNAVAILABLE,
+        "write_bytes": UNAVAILABLE,
+    }
+
+    # /proc/<pid>/io is readable only with same uid or CAP_SYS_PTRACE
+    io_stat = read_file(os.path.join(pid_dir, "io"))
+    if io_stat is not None:
+        for line in io_stat.splitlines():
+            key, _, value = line.partition(":")
+            if key in ("read_bytes", "write_bytes"):
+                data[key] = int(value.strip())
+
+    return data
+
+
+def classify_gluster_process(args):
+    """
+    Identify Gluster processes managed by Kadalu from command line.
+    Returns tuple of (process type, storage name) or None.
+    """
+    if not args:
+        return None
+
+    exe = os.path.basename(args[0])
+    if exe == "glusterfsd":
+        volfile_id = get_arg_value(args, "--volfile-id") or ""
+        return ("glusterfsd", volfile_id.split(".")[0])
+
+    if exe != "glusterfs":
+        return None
+
+    volfile_id = get_arg_value(args, "--volfile-id") or ""
+    if volfile_id == "gluster/glustershd":
+        display_name = get_arg_value(args, "--fs-display-name") or ""
+        return ("shd", display_name.replace("kadalu:", "", 1))
+
+    if get_arg_value(args, "--process-name") == "fuse":
+        return ("fuse", volfile_id)
+
+    return None
+
+
+def list_gluster_processes():
+    """List of Gluster processes running in this container"""
+    procs = []
+    try:
+        pids = [int(name) for name in os.listdir(PROC_DIR) if name.isdigit()]
+    except OSError as err:
+        logging.error(logf("Failed to list processes", error=err))
+        return procs
+
+    for pid in pids:
+        proc_type = classify_gluster_process(read_cmdline(pid))
+        if proc_type is not None:
+            procs.append((pid, proc_type[0], proc_type[1]))
+
+    return procs
+
+
+def sample_gluster_processes():
+    """Resource usage of every Gluster process in this container"""
+    samples = []
+    for pid, proc_type, storage in list_gluster_processes():
+        data = sample_process(pid)
+        if data is None:
+            continue
+
+        data["process"] = proc_type
+        data["storage"] = storage
+        samples.append(data)
+
+    return samples
+
+
+# Detection needs parsing mountinfo, do it once per process
+_SAMPLER = None
+
+
+def get_sampler():
+    """Shared CgroupSampler instance"""
+    global _SAMPLER    # noqa # pylint: disable=global-statement
+    if _SAMPLER is None:
+        _SAMPLER = CgroupSampler()
+    return _SAMPLER
+
+
+def pod_metrics():
+    """
+    Pod level metrics returned by exporters. Keeps the
+    keys used by operator's metrics aggregator.
+    """
+    return get_sampler().sample()
+
+
+def available_cpus():
+    """
+    Number of CPUs the container can use. CFS quota if set,
+    else the CPUs in the affinity mask of the process.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        cpus = os.cpu_count() or 1
+
+    limit = get_sampler().cpu_limit()
+    if limit is not None:
+        return min(limit, cpus)
+
+    return cpus
+
+
+def thread_counts(cpus=None):
+    """
+    Event threads, io-threads and FUSE reader threads sized to the
+    available CPUs. Fractional CPU limits are rounded up, so a pod
+    with 0.5 CPU gets one event thread.
+    """
+    if cpus is None:
+        cpus = available_cpus()
+
+    cpus = max(int(math.ceil(cpus)), 1)
+    return {
+        "event_threads": min(cpus, MAX_EVENT_THREADS),
+        "io_threads": min(max(cpus * IO_THREADS_PER_CPU, MIN_IO_THREADS),
+                          MAX_IO_THREADS),
+        "reader_threads": min(max(cpus // 2, 1), MAX_READER_THREADS)
+    }
@@ -0,0 +1,179 @@
+"""
+Filesystem profiles of the brick devices.
+
+A profile decides the mkfs.xfs arguments and the mount options of the
+brick filesystem. Stripe unit and width are detected from the
+minimum_io_size and optimal_io_size of the block device (RAID/LVM),
+so the allocations are aligned to the stripe.
+
+Parameters used are recorded in BRICKFS_RECORD at the root of the
+brick filesystem, and the recorded mount options are used for the
+later mounts even if the profile of the Storage is changed.
+"""
+
+import json
+import logging
+import os
+import stat
+
+from kadalulib import logf
+
+DEFAULT_BRICKFS_PROFILE = "default"
+BRICKFS_RECORD = ".kadalu_brickfs.json"
+SYSFS_BLOCK_DIR = "/sys/dev/block"
+SECTOR_SIZE = 512
+
+# Minimum size of an allocation group, agcount of the profile is
+# used only if the device is large enough.
+MIN_AG_SIZE = 1024 * 1024 * 1024
+
+BRICKFS_PROFILES = {
+    # Bare mkfs and mount as done by the earlier releases
+    "none": {
+        "mkfs_args": [],
+        "mount_options": []
+    },
+    DEFAULT_BRICKFS_PROFILE: {
+        "mkfs_args": ["-i", "size=512"],
+        "mount_options": ["noatime", "inode64"]
+    },
+    "small-file": {
+        "mkfs_args": ["-i", "size=512", "-n", "size=8192"],
+        "agcount": 32,
+        "mount_options": ["noatime", "inode64", "logbsize=256k"]
+    },
+    "large-file": {
+        "mkfs_args": ["-i", "size=512"],
+        "mount_options": ["noatime", "inode64", "logbsize=256k",
+                          "allocsize=64m"]
+    }
+}
+
+
+def get_profile(name):
+    """Profile by name, default profile if not known"""
+    if name not in BRICKFS_PROFILES:
+        logging.warning(logf("Unknown brick filesystem profile, using default",
+                             profile=name))
+        name = DEFAULT_BRICKFS_PROFILE
+
+    return name, BRICKFS_PROFILES[name]
+
+
+def read_sysfs_int(path):
+    """Integer value from sysfs, 0 if not available"""
+    try:
+        with open(path) as sysfs_file:
+            return int(sysfs_file.read().strip())
+    except (OSError, ValueError):
+        return 0
+
+
+def block_device_sysfs_dir(device):
+    """
+    Sysfs directory of the block device, None if not a block device
+    (For example, a file used as brick device)
+    """
+    try:
+        device_stat = os.stat(device)
+    except OSError:
+        return None
+
+    if not stat.S_ISBLK(device_stat.st_mode):
+        return None
+
+    return os.path.join(SYSFS_BLOCK_DIR, "%d:%d" % (
+        os.major(device_stat.st_rdev), os.minor(device_stat.st_rdev)))
+
+
+def device_geometry(device):
+    """
+    Size, minimum and optimal IO size of the block device. Queue
+    limits of a partition are of its parent disk.
+    """
+    geometry = {"size_bytes": 0, "minimum_io_size": 0, "optimal_io_size": 0}
+    sysfs_dir = block_device_sysfs_dir(device)
+    if sysfs_dir is None:
+        return geometry
+
+    geometry["size_bytes"] = read_sysfs_int(
+        os.path.join(sysfs_dir, "size")) * SECTOR_SIZE
+
+    queue_dir = os.path.join(sysfs_dir, "queue")
+    if not os.path.exists(queue_dir):
+        queue_dir = os.path.join(sysfs_dir, "..", "queue")
+
+    for key in ["minimum_io_size", "optimal_io_size"]:
+        geometry[key] = read_sysfs_int(os.path.join(queue_dir, key))
+
+    return geometry
+
+
+def stripe_options(geometry):
+    """
+    mkfs.xfs stripe unit and width if the device reports an optimal
+    IO size which is a multiple of the minimum IO size (RAID chunk)
+    """
+    minimum = geometry["minimum_io_size"]
+    optimal = geometry["optimal_io_size"]
+    if minimum <= SECTOR_SIZE or optimal <= minimum or optimal % minimum != 0:
+        return []
+
+    return ["su=%d" % minimum, "sw=%d" % (optimal // minimum)]
+
+
+def mkfs_args(profile_name, device):
+    """mkfs.xfs arguments of the profile for the device"""
+    profile_name, profile = get_profile(profile_name)
+    args = list(profile["mkfs_args"])
+    if profile_name == "none":
+        return args
+
+    geometry = device_geometry(device)
+    data_options = stripe_options(geometry)
+
+    agcount = profile.get("agcount", 0)
+    if agcount and geometry["size_bytes"] >= agcount * MIN_AG_SIZE:
+        data_options.append("agcount=%d" % agcount)
+
+    if data_options:
+        args.extend(["-d", ",".join(data_options)])
+
+    return args
+
+
+def mount_args(mount_options):
+    """Arguments to pass to mount command"""
+    if not mount_options:
+        return []
+
+    return ["-o", ",".join(mount_options)]
+
+
+def read_record(mountdir):
+    """Recorded brick filesystem parameters, None if not recorded"""
+    try:
+        with open(os.path.join(mountdir, BRICKFS_RECORD)) as record_file:
+            return json.load(record_file)
+    except (OSError, ValueError):
+        return None
+
+
+def save_record(mountdir, profile_name, mkfs_arguments):
+    """
+    Record the parameters used to create and mount the brick.
+    mkfs_arguments is None if the filesystem was created by an
+    earlier release.
+    """
+    profile_name, profile = get_profile(profile_name)
+    record = {
+        "profile": profile_name,
+        "mkfs_args": mkfs_arguments,
+        "mount_options": profile["mount_options"]
+    }
+    record_path = os.path.join(mountdir, BRICKFS_RECORD)
+    with open(record_path + ".tmp", "w") as record_file:
+        json.dump(record, record_file)
+    os.replace(record_path + ".tmp", record_path)
+
+    return record
@@ -1,13 +1,22 @@
 import logging
-import os
-import re
 
 import uvicorn
 from fastapi import FastAPI
+from healinfo import heal_info, start_heal_info_collector
+from iostats import brick_io_stats
 from kadalulib import logf, logging_setup
+from monitorctl import monitored_processes
+from resourceutils import pod_metrics, sample_gluster_processes
 
 metrics_app = FastAPI()
 
+
+@metrics_app.on_event("startup")
+def startup():
+    """Heal info is collected in background"""
+    start_heal_info_collector()
+
+
 @metrics_app.get("/_api/metrics")
 def metrics():
     """
@@ -15,42 +24,18 @@ def metrics():
     Starts process by exposing the data collected in port 8050 at '/_api/metrics'.
     """
 
+    # Resource usage of the Pod and of glusterfsd and
+    # shd processes. Stats which are not available are
+    # returned as -1 (For example, in LXD containers).
+    # Per FOP stats of the brick from the io-stats dump and
+    # the heal backlog of all the bricks of the Storage (Only
+    # from the pod of the first brick).
     data = {
-        "pod": {}
-    }
-
-    memory_usage_in_bytes = 0
-    # Return -1 if unable to fetch 'cgroup' data,
-    # until new method is found to get CPU & Memory data in LXD containers.
-    memory_usage_in_bytes = -1
-    cpu_usage_in_nanoseconds = -1
-
-    # CPU (cgroup2)
-    if os.path.exists('/sys/fs/cgroup/cpu.stat'):
-        with open('/sys/fs/cgroup/cpu.stat', 'r') as cpu_fd:
-            for line in cpu_fd: # loop over all lines till we find usage_usec
-                if re.search('usage_usec', line):
-                    # Convert from usec (microseconds) to nanoseconds
-                    cpu_usage_in_nanoseconds = int(line.split(' ')[1]) * 1000
-
-    # CPU (cgroup)
-    elif os.path.exists('/sys/fs/cgroup/cpu/cpuacct.usage'):
-        with open('/sys/fs/cgroup/cpu/cpuacct.usage', 'r') as cpu_fd:
-            cpu_usage_in_nanoseconds = int(cpu_fd.read().strip())
-
-    # Memory (cgroup2)
-    if os.path.exists('/sys/fs/cgroup/system.slice/memory.current'):
-        with open('/sys/fs/cgroup/system.slice/memory.current', 'r') as memory_fd:
-            memory_usage_in_bytes = int(memory_fd.read().strip())
-
-    # Memory (cgroup)
-    elif os.path.exists('/sys/fs/cgroup/memory/memory.usage_in_bytes'):
-        with open('/sys/fs/cgroup/memory/memory.usage_in_bytes', 'r') as memory_fd:
-            memory_usage_in_bytes = int(memory_fd.read().strip())
-
-    data["pod"] = {
-        "memory_usage_in_bytes": memory_usage_in_bytes,
-        "cpu_usage_in_nanoseconds": cpu_usage_in_nanoseconds
+        "pod": pod_metrics(),
+        "processes": sample_gluster_processes(),
+        "monitor": monitored_processes(),
+        "fops": brick_io_stats(),
+        "heal": heal_info()
     }
 
     return data
@@ -11,6 +11,9 @@ import xattr
 from kadalulib import (CommandException, Proc, execute, logf,
                        send_analytics_tracker)
 
+from brickfs import (DEFAULT_BRICKFS_PROFILE, mkfs_args, mount_args,
+                     read_record, save_record)
+from iostats import IOSTATS_DIR
 from serverutils import (generate_brick_volfile,
                          generate_client_volfile)
 
@@ -99,11 +102,57 @@ def create_client_volfile(client_volfile_path, data):
     generate_client_volfile(data, client_volfile_path)
 
 
+def apply_brickfs_record(brick_device, mountdir, profile_name,
+                         mkfs_arguments=None):
+    """
+    Remount the brick with the recorded mount options. Record the
+    options of the profile if the brick is not recorded yet.
+    """
+    record = read_record(mountdir)
+    if record is None:
+        record = save_record(mountdir, profile_name, mkfs_arguments)
+        logging.info(logf(
+            "Recorded brick filesystem parameters",
+            device=brick_device,
+            profile=record["profile"],
+            mkfs_args=record["mkfs_args"],
+            mount_options=record["mount_options"]
+        ))
+
+    if not record["mount_options"]:
+        return
+
+    try:
+        execute("umount", mountdir)
+        execute("mount", *mount_args(record["mount_options"]),
+                brick_device, mountdir)
+        logging.info(logf(
+            "Mounted brick with recorded options",
+            device=brick_device,
+            mountdir=mountdir,
+            mount_options=record["mount_options"]
+        ))
+    except CommandException as err:
+        # Continue with the default mount options
+        logging.warning(logf(
+            "Failed to mount brick with recorded options",
+            device=brick_device,
+            mountdir=mountdir,
+            mount_options=record["mount_options"],
+            error=err
+        ))
+        if not os.path.ismount(mountdir):
+            execute("mount", brick_device, mountdir)
+
+
 def create_and_mount_brick(brick_device, brick_path, brickfs):
     """
     Create brick filesystem and mount the brick. Currently
-    only xfs is supported
+    only xfs is supported. mkfs and mount options are as per the
+    brick filesystem profile (BRICK_FS_PROFILE)
     """
+    profile_name = os.environ.get("BRICK_FS_PROFILE", DEFAULT_BRICKFS_PROFILE)
+    mkfs_arguments = None
 
     # If brick device path is not starts with /dev then use
     # /brickdev prefix. Brick device directory passed by the user
@@ -125,6 +174,7 @@ def create_and_mount_brick(brick_device, brick_path, brickfs):
             device=brick_device,
             mountdir=mountdir,
             ))
+        apply_brickfs_record(brick_device, mountdir, profile_name)
     except CommandException as err:
         logging.info(logf(
             "Failed to mount device, continuing with mkfs",
@@ -137,11 +187,15 @@ def create_and_mount_brick(brick_device, brick_path, brickfs):
             # This error pops up when we do mount on an empty device or wrong fs
             # Try doing a mkfs and try mount
             try:
-                execute(MKFS_XFS_CMD, brick_device)
+                args = mkfs_args(profile_name, brick_device)
+                execute(MKFS_XFS_CMD, *args, brick_device)
+                mkfs_arguments = args
                 logging.info(logf(
                     "Successfully created xfs file system on device",
                     fstype=brickfs,
                     device=brick_device,
+                    profile=profile_name,
+                    mkfs_args=args,
                     ))
             except CommandException as err:
                 if "appears to contain an existing filesystem" not in err.err:
@@ -167,6 +221,8 @@ def create_and_mount_brick(brick_device, brick_path, brickfs):
                     device=brick_device,
                     mountdir=mountdir,
                     ))
+                apply_brickfs_record(brick_device, mountdir, profile_name,
+                                     mkfs_arguments)
             except CommandException as err:
                 logging.error(logf(
                     "Failed to mount export brick (after mkfs)",
@@ -210,6 +266,7 @@ def start_args():
 
     create_brickdir(brick_path)
     verify_brickdir_xattr_support(brick_path)
+    os.makedirs(IOSTATS_DIR, mode=0o755, exist_ok=True)
     set_volume_id_xattr(brick_path, volume_id)
 
     volfile_id = "%s.%s.%s" % (volname, nodename, brick_path_name)
@@ -0,0 +1,175 @@
+"""
+Heal backlog of the Storage units (bricks) of a Storage.
+
+glfsheal info-summary crawls the whole Storage, so it is run only
+from the pod of the first Storage unit (BRICK_INDEX 0) and the
+summary of all the units is reported from there. It is run
+periodically (HEAL_INFO_INTERVAL) in a background thread of the
+exporter, so that the scrape returns the latest summary without
+waiting for glfsheal. Heal rate is the number of pending entries
+healed per second since the previous run.
+"""
+
+import logging
+import os
+import subprocess
+import threading
+import time
+
+from kadalulib import logf
+
+GLFSHEAL_CMD = "/opt/libexec/glusterfs/glfsheal"
+VOLFILES_DIR = "/var/lib/kadalu/volfiles"
+HEAL_INFO_INTERVAL = int(os.environ.get("HEAL_INFO_INTERVAL", "60"))
+HEAL_INFO_TIMEOUT = int(os.environ.get("HEAL_INFO_TIMEOUT", "300"))
+
+SUMMARY_FIELDS = {
+    "Total Number of entries": "total",
+    "Number of entries in heal pending": "heal_pending",
+    "Number of entries in split-brain": "split_brain",
+    "Number of entries possibly healing": "possibly_healing"
+}
+
+
+def parse_info_summary(output):
+    """
+    Parse the output of "glfsheal <volname> info-summary". Returns
+    the list of bricks in volfile order, counts of a brick are None
+    if it is not connected ("-" in place of count).
+    """
+    bricks = []
+    for line in output.splitlines():
+        line = line.strip()
+        if line.startswith("Brick "):
+            bricks.append({"brick": line[len("Brick "):]})
+            continue
+
+        if not bricks or ":" not in line:
+            continue
+
+        key, value = [part.strip() for part in line.split(":", 1)]
+        if key == "Status":
+            bricks[-1]["status"] = value
+        elif key in SUMMARY_FIELDS:
+            bricks[-1][SUMMARY_FIELDS[key]] = int(value) if value.isdigit() else None
+
+    return bricks
+
+
+def storage_unit_name(brick):
+    """
+    Storage unit label (<pod hostname>:<brick path>) of the brick
+    name (<hostname>.<volname>:<brick path>) reported by glfsheal
+    """
+    host, _, path = brick.partition(":")
+    return "%s:%s" % (host.split(".", 1)[0], path)
+
+
+class HealInfoCollector:
+    """Collects the heal summary of the Storage in a background thread"""
+    def __init__(self, volname):
+        self.volname = volname
+        self.lock = threading.Lock()
+        self.summary = {}
+        self.thread = None
+
+    def run_info_summary(self):
+        """Run glfsheal and return the summary of all the bricks"""
+        volfile_path = os.path.join(VOLFILES_DIR, "%s.vol" % self.volname)
+        proc = subprocess.run(
+            [GLFSHEAL_CMD, self.volname, "info-summary",
+             "volfile-path", volfile_path],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            universal_newlines=True, timeout=HEAL_INFO_TIMEOUT, check=False)
+
+        # glfsheal exits with non zero if heal is pending, parse
+        # the output irrespective of the exit code.
+        bricks = parse_info_summary(proc.stdout)
+        if not bricks:
+            logging.warning(logf("Bricks not found in heal info summary",
+                                 volname=self.volname,
+                                 error=proc.stderr.strip()))
+
+        return bricks
+
+    def collect(self):
+        """Update the summary and the heal rate of each brick"""
+        start_time = time.time()
+        try:
+            bricks = self.run_info_summary()
+        except (OSError, subprocess.TimeoutExpired) as err:
+            logging.warning(logf("Failed to get heal info summary",
+                                 volname=self.volname, error=err))
+            bricks = []
+
+        if not bricks:
+            return
+
+        summary = {}
+        with self.lock:
+            for brick in bricks:
+                brick["heal_rate"] = 0
+                brick["timestamp"] = start_time
+                prev = self.summary.get(brick["brick"], {})
+                if prev.get("heal_pending") is not None and \
+                   brick.get("heal_pending") is not None:
+                    elapsed = start_time - prev["timestamp"]
+                    healed = prev["heal_pending"] - brick["heal_pending"]
+                    if elapsed > 0 and healed > 0:
+                        brick["heal_rate"] = healed / elapsed
+
+                brick["duration_seconds"] = time.time() - start_time
+                summary[brick["brick"]] = brick
+
+            self.summary = summary
+
+    def run(self):
+        """Collect periodically"""
+        while True:
+            self.collect()
+            time.sleep(HEAL_INFO_INTERVAL)
+
+    def start(self):
+        """Start collecting in a background thread"""
+        self.thread = threading.Thread(target=self.run, daemon=True,
+                                       name="heal-info")
+        self.thread.start()
+
+    def get(self):
+        """Latest summary of all the bricks"""
+        with self.lock:
+            bricks = [dict(brick) for brick in self.summary.values()]
+
+        for brick in bricks:
+            brick["storage"] = self.volname
+            brick["storage_unit"] = storage_unit_name(brick["brick"])
+
+        return bricks
+
+
+COLLECTOR = None
+
+
+def start_heal_info_collector():
+    """
+    Start the collector if the Storage has redundancy (Self heal
+    daemon is running in the pod) and this is the pod of the first
+    Storage unit.
+    """
+    global COLLECTOR    # noqa # pylint: disable=global-statement
+    if os.environ.get("SHD_REQUIRED", "0") != "1" or COLLECTOR is not None:
+        return
+
+    if os.environ.get("BRICK_INDEX", "0") != "0":
+        return
+
+    COLLECTOR = HealInfoCollector(os.environ["VOLUME"])
+    COLLECTOR.start()
+
+
+def heal_info():
+    """Latest heal summary of all the bricks, empty if not collected"""
+    if COLLECTOR is None:
+        return []
+
+    return COLLECTOR.get()
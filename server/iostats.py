@@ -0,0 +1,132 @@
+"""
+Per FOP latency and throughput of the Storage unit (brick) process.
+
+The io-stats translator of the brick volfile is configured to dump
+its stats in JSON format every IOSTATS_DUMP_INTERVAL seconds to
+IOSTATS_DIR (See serverutils.generate_brick_volfile). The latest dump
+is parsed when the exporter is scraped, so the scrape doesn't have to
+wait for the brick process.
+
+Keys of the dump are of the form
+
+    gluster.brick.<brick>.<aggr|inter>.fop.<fop>.<stat>
+    gluster.brick.<brick>.<aggr|inter>.<read_bytes|write_bytes>
+
+"aggr" stats are cumulative since the brick start and "inter" stats
+are of the last dump interval.
+"""
+
+import glob
+import json
+import logging
+import os
+import re
+
+from kadalulib import logf
+
+IOSTATS_DIR = "/var/lib/glusterd/stats"
+IOSTATS_DUMP_INTERVAL = int(os.environ.get("IOSTATS_DUMP_INTERVAL", "30"))
+
+# io-stats options of the brick volfile. Storage pool options
+# override these.
+BRICK_IOSTATS_OPTIONS = {
+    "diagnostics.latency-measurement": "on",
+    "diagnostics.count-fop-hits": "on",
+    "diagnostics.stats-dump-interval": str(IOSTATS_DUMP_INTERVAL),
+    "diagnostics.stats-dump-format": "json"
+}
+
+INTERVALS = {
+    "aggr": "cumulative",
+    "inter": "interval"
+}
+
+FOP_STATS = {
+    "count": "calls",
+    "fail_count": "failures",
+    "latency_min_usec": "latency_min_usec",
+    "latency_ave_usec": "latency_avg_usec",
+    "latency_max_usec": "latency_max_usec"
+}
+
+THROUGHPUT_STATS = ["read_bytes", "write_bytes"]
+
+DUMP_KEY_RE = re.compile(
+    r"^gluster\.brick\..+\.(?P<interval>aggr|inter)\."
+    r"(?:fop\.(?P<fop>[A-Za-z_]+)\.(?P<stat>[a-z_]+)|(?P<bytes>[a-z_]+))$"
+)
+
+
+def to_number(value):
+    """Values in the dump are strings, None if not a number"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_iostats_dump(dump):
+    """
+    Parse the JSON dump of io-stats. Returns None if it is not
+    a brick dump, else
+
+        {"cumulative": {"fops": {"LOOKUP": {"calls": 10, ...}},
+                        "read_bytes": 0, "write_bytes": 0},
+         "interval": {...}}
+    """
+    stats = {}
+    for key, value in dump.items():
+        match = DUMP_KEY_RE.match(key)
+        if match is None:
+            continue
+
+        value = to_number(value)
+        if value is None:
+            continue
+
+        interval = stats.setdefault(INTERVALS[match.group("interval")],
+                                    {"fops": {}})
+        if match.group("fop") is not None:
+            stat = FOP_STATS.get(match.group("stat"), None)
+            if stat is not None:
+                fop = interval["fops"].setdefault(match.group("fop").upper(), {})
+                fop[stat] = value
+        elif match.group("bytes") in THROUGHPUT_STATS:
+            interval[match.group("bytes")] = value
+
+    return stats if stats else None
+
+
+def dump_mtime(path):
+    """Modified time of the dump, 0 if removed meanwhile"""
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0
+
+
+def brick_io_stats():
+    """
+    Stats from the latest io-stats dump of the brick process of this
+    pod. Empty dict if no dump is available yet.
+    """
+    dump_files = glob.glob(os.path.join(IOSTATS_DIR, "*.dump"))
+    dump_files.sort(key=dump_mtime, reverse=True)
+
+    for dump_file in dump_files:
+        try:
+            with open(dump_file) as dump_fd:
+                stats = parse_iostats_dump(json.load(dump_fd))
+        except (OSError, ValueError) as err:
+            # Dump may be partially written, use it in the next scrape
+            logging.debug(logf("Failed to parse io-stats dump",
+                               path=dump_file, error=err))
+            continue
+
+        if stats is not None:
+            stats["storage"] = os.environ.get("VOLUME", "")
+            stats["storage_unit"] = "%s:%s" % (os.environ.get("HOSTNAME", ""),
+                                               os.environ.get("BRICK_PATH", ""))
+            return stats
+
+    return {}
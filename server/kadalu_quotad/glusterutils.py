@@ -2,6 +2,8 @@
 Utilities for reading information from gluster for 'external' quotad
 """
 import os
+import time
+
 try:
     from glustercli.cli import volume
 except ImportError:
@@ -9,8 +11,13 @@ except ImportError:
 
 KADALU_PATHS = {'info', 'subvol'}
 UUID_FILE = "/var/lib/glusterd/glusterd.info"
+VOLS_DIR = "/var/lib/glusterd/vols"
+# Bricks are fetched again in this interval if the changes to the
+# volumes can't be detected from VOLS_DIR
+REFRESH_INTERVAL = 60
 
 MYUUID = None
+LOCAL_BRICKS = {"signature": None, "bricks": None, "updated": 0}
 
 def get_node_id():
     """
@@ -32,6 +39,55 @@ def get_node_id():
     return val
 
 
+def vols_info_signature():
+    """
+    mtime of the info file of each volume. glusterd rewrites these
+    files on any change to the volume (including add/remove/replace
+    brick), so the bricks are fetched again only if this is changed.
+    None if glusterd's working directory is not readable.
+    """
+    try:
+        volnames = os.listdir(VOLS_DIR)
+    except OSError:
+        return None
+
+    signature = []
+    for volname in sorted(volnames):
+        try:
+            mtime = os.stat(os.path.join(VOLS_DIR, volname, "info")).st_mtime_ns
+        except FileNotFoundError:
+            continue
+        signature.append((volname, mtime))
+
+    return tuple(signature)
+
+
+def get_local_bricks():
+    """
+    Paths of the bricks hosted on _this_ server, from the info of all
+    volumes fetched in one call. Cached till the volumes are changed.
+    """
+    signature = vols_info_signature()
+    if LOCAL_BRICKS["bricks"] is not None:
+        if signature is not None and signature == LOCAL_BRICKS["signature"]:
+            return LOCAL_BRICKS["bricks"]
+        # Change can't be detected, refresh periodically
+        if signature is None and \
+           time.time() - LOCAL_BRICKS["updated"] < REFRESH_INTERVAL:
+            return LOCAL_BRICKS["bricks"]
+
+    local_uuid = get_node_id()
+    bricks = []
+    for volinfo in volume.info():
+        for brick in volinfo['bricks']:
+            if brick['uuid'] == local_uuid:
+                bricks.append(brick['name'].partition(':')[2])
+
+    LOCAL_BRICKS.update(signature=signature, bricks=bricks,
+                        updated=time.time())
+    return bricks
+
+
 def get_automatic_bricks():
     """
     Returns array of paths to gluster bricks hosted on _this_ server
@@ -40,19 +96,14 @@ def get_automatic_bricks():
     if not volume:
         return []
 
-    local_uuid = get_node_id()
     found_bricks = []
-    for vol in volume.vollist():
-        for brick in volume.info(vol)[0]['bricks']:
-            if brick['uuid'] != local_uuid:
-                continue
-            brick_path = brick['name'].partition(':')[2]
-            is_kadalu_brick = True
-            for kadalu_path in KADALU_PATHS:
-                if not os.path.isdir(brick_path + '/' + kadalu_path):
-                    is_kadalu_brick = False
-                    break
-            if is_kadalu_brick:
-                found_bricks.append(brick_path)
+    for brick_path in get_local_bricks():
+        is_kadalu_brick = True
+        for kadalu_path in KADALU_PATHS:
+            if not os.path.isdir(brick_path + '/' + kadalu_path):
+                is_kadalu_brick = False
+                break
+        if is_kadalu_brick:
+            found_bricks.append(brick_path)
 
     return found_bricks
@@ -1,6 +1,26 @@
 """
 Manage Filesystem Quota
+
+PV info files (info/subvol/xx/yy/<pv>.json) of each brick are
+watched using inotify and the quota is set only for the PVs whose
+info file is changed. If inotify is not available (or the watch
+limit is reached), the info tree is rescanned every
+QUOTAD_RESCAN_INTERVAL seconds. The rescan lists only the
+directories whose mtime changed and reads only the info files whose
+mtime or size changed.
+
+Applied Quota is saved in the state file (See state.py). After a
+restart, the saved state is reconciled with the Quota report and
+the Project ID of the PV directory. Recursive tagging of the PV
+directory is done again only if its Project ID is missing.
+
+Quota is set using ioctl/quotactl directly, xfs_quota command is used
+only if the native calls are not usable (See xfsquota.py).
+
+If QUOTAD_METRICS_PORT is set, usage of each PV is collected from the
+Quota report and exported (See usage.py).
 """
+import errno
 import json
 import logging
 import os
@@ -12,11 +32,22 @@ except ImportError:
     from glusterutils import get_automatic_bricks
 
 try:
-    from .kadalulib import (PV_TYPE_SUBVOL, CommandException, execute,
-                            get_volname_hash, get_volume_path, logf)
+    from .state import get_state
+    from .usage import METRICS_PORT, USAGE, USAGE_INTERVAL, start_metrics_server
+    from .xfsquota import QuotaError, get_backend, get_project_id
 except ImportError:
-    from kadalulib import (PV_TYPE_SUBVOL, CommandException, execute,
-                           get_volname_hash, get_volume_path, logf)
+    from state import get_state
+    from usage import METRICS_PORT, USAGE, USAGE_INTERVAL, start_metrics_server
+    from xfsquota import QuotaError, get_backend, get_project_id
+
+try:
+    from .kadalulib import (IN_CLOSE_WRITE, IN_CREATE, IN_DELETE, IN_IGNORED,
+                            IN_ISDIR, IN_MOVED_TO, IN_Q_OVERFLOW,
+                            PV_TYPE_SUBVOL, Inotify, logf)
+except ImportError:
+    from kadalulib import (IN_CLOSE_WRITE, IN_CREATE, IN_DELETE, IN_IGNORED,
+                           IN_ISDIR, IN_MOVED_TO, IN_Q_OVERFLOW,
+                           PV_TYPE_SUBVOL, Inotify, logf)
 
 # Config file for kadalu info
 # Config file format:
@@ -32,113 +63,382 @@ except ImportError:
 #
 CONFIG_FILE = "/var/lib/glusterd/kadalu.info"
 PROJECT_MOD = 4294967296 # XFS project number is 32bit unsigned
-SIZE_LIMITS = {} # Handles quota updates
+POLL_INTERVAL = 2
+# Rescan interval if inotify is not available. With inotify, the
+# info tree is rescanned once in RECHECK_INTERVAL to recover from
+# any missed events.
+RESCAN_INTERVAL = int(os.environ.get("QUOTAD_RESCAN_INTERVAL", "60"))
+RECHECK_INTERVAL = 3600
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+INFO_FILE_SUFFIX = ".json"
+
+# Hard limit is considered as applied if it is within one
+# filesystem block of the PV size.
+LIMIT_TOLERANCE_BYTES = 4096
+
+BRICKS = {} # Quota state of each brick
 
-def set_quota(rootdir, subdir_path, quota_value):
+def project_id_of(subdir_path):
     """
-    Set Quota for given subdir path. Get project
-    ID from directory inode. XFS can have 64 bit inodes
-    so strip it to 32 bit and hope not to clash.
+    Project ID for the PV directory, from directory inode. XFS can
+    have 64 bit inodes so strip it to 32 bit and hope not to clash.
     """
-    ino = os.lstat(subdir_path).st_ino % PROJECT_MOD
-    execute("xfs_quota",
-            "-x", "-c",
-            'project -s -p %s %d' % (subdir_path, ino),
-            rootdir)
-
-    execute("xfs_quota",
-            "-x", "-c",
-            'limit -p bhard=%s %d' % (quota_value, ino),
-            rootdir)
-
-
-def get_quota_report(rootdir):
-    """Get Project Quota Report"""
-    try:
-        out, _ = execute(
-            "xfs_quota",
-            "-x",
-            "-c",
-            'report -p -b',
-            rootdir)
-        return out.split("\n")
-    except CommandException as err:
-        logging.error(logf("Failed to get Quota Report",
-                           rootdir=rootdir,
-                           err=err.err,
-                           ret=err.ret))
-
-    return []
-
-
-def handle_quota(brick_path, volname, pvtype):
-    """Sets Quota if info file is available"""
-
-    volhash = get_volname_hash(volname)
-    volpath = get_volume_path(pvtype, volhash, volname)
-    subdir_path = os.path.join(brick_path, volpath)
-
-    pvinfo_file_path = os.path.join(brick_path, "info", volpath + ".json")
-    if os.path.exists(pvinfo_file_path):
-        data = {}
-        with open(pvinfo_file_path) as pvinfo_file:
-            data = json.loads(pvinfo_file.read().strip())
-
-            # global dictionary to avoid init to None
-            global SIZE_LIMITS
-
-            # Add every new entry of volnames
-            if volname not in SIZE_LIMITS:
-                SIZE_LIMITS[volname] = {}
-
-            # Handle PV resize quota updates
-
-            # Init existing_size to -1 to handle new quota requests
-            # Update existing_size for every update requests
-            if data["size"] > SIZE_LIMITS[volname].get('existing_size', -1):
-                SIZE_LIMITS[volname]['existing_size'] = data["size"]
-            # Quota already set for size, return
+    return os.lstat(subdir_path).st_ino % PROJECT_MOD
+
+
+class BrickQuota:
+    """
+    Index of the PV info files of a brick and the quota limits
+    applied (PV name -> size)
+    """
+    # noqa # pylint: disable=too-many-instance-attributes
+    def __init__(self, brick_path):
+        self.brick_path = brick_path
+        self.info_dir = os.path.join(brick_path, "info")
+        self.info_root = os.path.join(self.info_dir, PV_TYPE_SUBVOL)
+        self.limits = {}
+        self.project_ids = {}
+        # Info file path -> (mtime_ns, size) when last processed
+        self.info_files = {}
+        # Directory -> (mtime_ns, list of entries) of the last rescan
+        self.dirs = {}
+        self.inotify = None
+        # Watch descriptor -> directory
+        self.watches = {}
+        self.watched_dirs = set()
+        self.last_rescan = 0
+        self.last_usage = 0
+        # Quota backend, None till Project Quota is enabled
+        self.backend = None
+        self.state = get_state()
+
+    def pv_path(self, info_path):
+        """PV directory of the info file"""
+        return os.path.join(
+            self.brick_path,
+            os.path.relpath(info_path, self.info_dir)[:-len(INFO_FILE_SUFFIX)])
+
+    def apply(self, info_path, size, info_key):
+        """
+        Set Quota if the size is increased (or not set yet).
+        Returns False if failed to set.
+        """
+        pvname = os.path.basename(info_path)[:-len(INFO_FILE_SUFFIX)]
+        if size <= self.limits.get(pvname, -1):
+            return True
+
+        subdir_path = self.pv_path(info_path)
+        try:
+            # Already tagged, only the limit is changed on resize
+            project_id = self.project_ids.get(pvname)
+            if project_id is None:
+                project_id = project_id_of(subdir_path)
+                self.backend.set_project_id(subdir_path, project_id)
+            self.backend.set_limit(project_id, size)
+            self.limits[pvname] = size
+            self.project_ids[pvname] = project_id
+            self.state.save(self.brick_path, {
+                "pvname": pvname,
+                "info_path": info_path,
+                "project_id": project_id,
+                "size": size,
+                "info_key": info_key
+            })
+            logging.info(logf(
+                "Quota set for size",
+                pvname=pvname,
+                size=size
+            ))
+        except (QuotaError, OSError) as err:
+            logging.error(logf("Failed to set Quota",
+                               err=err,
+                               pvname=pvname,
+                               size=size))
+            return False
+
+        return True
+
+    def process_info_file(self, path):
+        """Apply Quota if the content of the info file is changed"""
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            self.forget(path)
+            return
+
+        key = (stat.st_mtime_ns, stat.st_size)
+        if self.info_files.get(path) == key:
+            return
+
+        try:
+            with open(path) as pvinfo_file:
+                data = json.loads(pvinfo_file.read().strip())
+        except (OSError, ValueError) as err:
+            # Partially written, processed again on close
+            logging.debug(logf("Failed to read PV info",
+                               path=path, error=err))
+            return
+
+        # Retried in the next rescan if failed
+        if self.apply(path, data["size"], key):
+            self.info_files[path] = key
+
+    def forget(self, path):
+        """Remove the deleted PV from the index"""
+        if self.info_files.pop(path, None) is not None:
+            pvname = os.path.basename(path)[:-len(INFO_FILE_SUFFIX)]
+            self.limits.pop(pvname, None)
+            self.project_ids.pop(pvname, None)
+            self.state.delete(self.brick_path, pvname)
+
+    def reconcile(self):
+        """
+        Load the saved state of the brick. Quota of a PV is set again
+        only if its hard limit is not as per the saved state, and
+        the directory is tagged again only if the Project ID is
+        missing. PVs not loaded here are handled by the rescan.
+        """
+        projects = self.backend.report()
+        retagged = 0
+        for pv_state in self.state.load(self.brick_path):
+            pvname = pv_state["pvname"]
+            project_id = pv_state["project_id"]
+            subdir_path = self.pv_path(pv_state["info_path"])
+            if not os.path.isdir(subdir_path):
+                self.state.delete(self.brick_path, pvname)
+                continue
+
+            hard_limit = projects.get(project_id, {}).get("hard_limit_bytes", 0)
+            limited = abs(hard_limit - pv_state["size"]) < LIMIT_TOLERANCE_BYTES
+            dir_project_id = get_project_id(subdir_path)
+            if dir_project_id is None:
+                tagged = limited
             else:
-                return
+                tagged = dir_project_id == project_id
+
+            try:
+                if not tagged:
+                    self.backend.set_project_id(subdir_path, project_id)
+                    retagged += 1
+                if not limited:
+                    self.backend.set_limit(project_id, pv_state["size"])
+            except (QuotaError, OSError) as err:
+                logging.error(logf("Failed to restore Quota",
+                                   pvname=pvname, err=err))
+                continue
+
+            self.limits[pvname] = pv_state["size"]
+            self.project_ids[pvname] = project_id
+            self.info_files[pv_state["info_path"]] = pv_state["info_key"]
+
+        logging.info(logf("Quota state loaded",
+                          brick_path=self.brick_path,
+                          pvs=len(self.limits),
+                          retagged=retagged,
+                          backend=self.backend.name))
+
+    def list_dir(self, path):
+        """
+        Entries of the directory, listed again only if the mtime
+        of the directory is changed since the last rescan
+        """
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            self.dirs.pop(path, None)
+            return []
+
+        cached = self.dirs.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
 
+        entries = os.listdir(path)
+        self.dirs[path] = (mtime, entries)
+        return entries
+
+    def rescan(self):
+        """Rescan the info tree (mtime pruned)"""
+        self.last_rescan = time.time()
+        seen = set()
+        for dir1 in self.list_dir(self.info_root):
+            dir1_path = os.path.join(self.info_root, dir1)
+            self.add_watch(dir1_path)
+            for dir2 in self.list_dir(dir1_path):
+                dir2_path = os.path.join(dir1_path, dir2)
+                self.add_watch(dir2_path)
+                for name in self.list_dir(dir2_path):
+                    if name.endswith(INFO_FILE_SUFFIX):
+                        path = os.path.join(dir2_path, name)
+                        seen.add(path)
+                        self.process_info_file(path)
+
+        for path in set(self.info_files) - seen:
+            self.forget(path)
+
+    def start_watch(self):
+        """Start inotify watch, rescan is used if it fails"""
+        try:
+            self.inotify = Inotify()
+        except OSError as err:
+            logging.warning(logf("inotify not available, using rescan",
+                                 brick_path=self.brick_path, error=err))
+            return
+
+        # Watch the parent dirs till the info tree is created
+        for path in [self.brick_path, self.info_dir, self.info_root]:
+            self.add_watch(path)
+
+    def add_watch(self, path):
+        """Watch the directory, stop using inotify if limit is reached"""
+        if self.inotify is None or path in self.watched_dirs:
+            return
+
+        try:
+            wdesc = self.inotify.add_watch(path, WATCH_MASK)
+            self.watches[wdesc] = path
+            self.watched_dirs.add(path)
+        except FileNotFoundError:
+            pass
+        except OSError as err:
+            if err.errno != errno.ENOSPC:
+                raise
+            logging.warning(logf(
+                "inotify watch limit reached, using rescan",
+                brick_path=self.brick_path,
+                interval=RESCAN_INTERVAL
+            ))
+            self.stop_watch()
+
+    def stop_watch(self):
+        """Close the inotify instance"""
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
+            self.watches = {}
+            self.watched_dirs = set()
+
+    def handle_events(self):
+        """Process the inotify events, returns False if rescan required"""
+        for wdesc, mask, name in self.inotify.read_events(0):
+            if mask & IN_Q_OVERFLOW:
+                return False
+
+            if mask & IN_IGNORED:
+                self.watched_dirs.discard(self.watches.pop(wdesc, None))
+                continue
+
+            parent = self.watches.get(wdesc)
+            if parent is None:
+                continue
+
+            path = os.path.join(parent, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self.scan_new_dir(path)
+            elif name.endswith(INFO_FILE_SUFFIX):
+                if mask & IN_DELETE:
+                    self.forget(path)
+                elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                    self.process_info_file(path)
+
+            # Watch limit reached
+            if self.inotify is None:
+                return False
+
+        return True
+
+    def scan_new_dir(self, path):
+        """
+        Watch the newly created directory. Entries created before
+        the watch is added are processed here.
+        """
+        self.add_watch(path)
+        try:
+            entries = os.listdir(path)
+        except FileNotFoundError:
+            return
+
+        for name in entries:
+            entry_path = os.path.join(path, name)
+            if name.endswith(INFO_FILE_SUFFIX):
+                self.process_info_file(entry_path)
+            elif os.path.isdir(entry_path):
+                self.scan_new_dir(entry_path)
+
+    def update(self):
+        """Apply the Quota changes since the last update"""
+        if self.backend is None:
+            self.backend = get_backend(os.path.dirname(self.brick_path))
+            if self.backend is None:
+                return
             try:
-                set_quota(os.path.dirname(brick_path), subdir_path, data["size"])
-                logging.info(logf(
-                    "Quota set for size",
-                    size=data["size"]
-                ))
-            except CommandException as err:
-                logging.error(logf("Failed to set Quota",
-                                   err=err.err,
-                                   path=subdir_path.replace(
-                                       brick_path, ""),
-                                   size=data["size"]))
-    return
+                self.reconcile()
+            except (QuotaError, OSError):
+                self.backend = None
+                raise
+            self.start_watch()
+            self.rescan()
+            return
+
+        interval = RESCAN_INTERVAL
+        if self.inotify is not None:
+            interval = RECHECK_INTERVAL
+            if not self.handle_events():
+                self.rescan()
+                return
+
+        if time.time() - self.last_rescan >= interval:
+            self.rescan()
+
+        if METRICS_PORT > 0 and time.time() - self.last_usage >= USAGE_INTERVAL:
+            self.collect_usage()
+
+    def collect_usage(self):
+        """Usage of the PVs from the Quota report of the brick"""
+        self.last_usage = time.time()
+        try:
+            projects = self.backend.report()
+        except (QuotaError, OSError) as err:
+            logging.error(logf("Failed to get Quota usage",
+                               brick_path=self.brick_path, error=err))
+            return
+
+        pvs = []
+        for pvname, project_id in self.project_ids.items():
+            project = projects.get(project_id)
+            if project is None:
+                continue
+
+            pvs.append({
+                "pvname": pvname,
+                "used_bytes": project["used_bytes"],
+                "limit_bytes": project["hard_limit_bytes"],
+                "used_inodes": project["used_inodes"],
+                "inodes_limit": project["inodes_hard_limit"]
+            })
+
+        USAGE.update(self.brick_path, pvs)
 
 
 def crawl(brick_path):
     """
-    Crawl to find if Quota set is pending for any directory.
-    Get Quota size information from info file
+    Find if Quota set is pending for any directory. Get Quota size
+    information from info file
     """
     if not brick_path:
         return
 
-    subvol_root = os.path.join(brick_path, PV_TYPE_SUBVOL)
-
-    quota_report = get_quota_report(os.path.dirname(brick_path))
-    if not quota_report:
-        return
+    if brick_path not in BRICKS:
+        BRICKS[brick_path] = BrickQuota(brick_path)
 
-    if not os.path.exists(subvol_root):
-        return
+    BRICKS[brick_path].update()
 
-    for dir1 in os.listdir(subvol_root):
-        for dir2 in os.listdir(os.path.join(subvol_root, dir1)):
-            for pvdir in os.listdir(os.path.join(subvol_root, dir1, dir2)):
-                handle_quota(brick_path, pvdir, PV_TYPE_SUBVOL)
 
-    return
+def remove_bricks(brick_paths):
+    """Stop watching the bricks which are not available now"""
+    for brick_path in set(BRICKS) - set(brick_paths):
+        BRICKS.pop(brick_path).stop_watch()
+        USAGE.remove(brick_path)
 
 
 def start():
@@ -146,33 +446,37 @@ def start():
     Start Quota Manager
     """
     first_time = True
-    automatic_bricks = []
-    automatic_pass = 0
+    start_metrics_server()
     while True:
+        brick_paths = []
         brick_path = os.environ.get("BRICK_PATH", None)
         if brick_path is not None:
             if brick_path.lower() == 'auto':
-                # Getting the bricks is expensive, do it roughly
-                # once a minute
-                if automatic_pass % 30 == 0:
-                    automatic_bricks = get_automatic_bricks()
-                automatic_pass += 1
-                for brick in automatic_bricks:
-                    crawl(brick)
+                # Bricks are fetched from glusterd only if the
+                # volumes are changed (See glusterutils.py)
+                brick_paths.extend(get_automatic_bricks())
             else:
-                crawl(brick_path)
+                brick_paths.append(brick_path)
         try:
             with open(CONFIG_FILE) as conf_file:
                 config_data = json.loads(conf_file.read().strip())
-                for brick in config_data.get('bricks', None):
-                    crawl(brick)
+                brick_paths.extend(config_data.get('bricks', []))
         except json.decoder.JSONDecodeError as jex:
             print("Decoding "+CONFIG_FILE+" failed: "+str(jex))
         except:    # noqa # pylint: disable=bare-except
             # Ignore all other errors
             pass
 
-        time.sleep(2)
+        remove_bricks(brick_paths)
+        for brick in brick_paths:
+            try:
+                crawl(brick)
+            except (QuotaError, OSError) as err:
+                # Retried in the next poll
+                logging.error(logf("Failed to update Quota",
+                                   brick_path=brick, error=err))
+
+        time.sleep(POLL_INTERVAL)
 
         if first_time:
             print("Successfully started quotad process")
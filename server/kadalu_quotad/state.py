@@ -0,0 +1,88 @@
+"""
+Persistent state of quotad
+
+Project ID and the limit applied for each PV are saved in a sqlite
+database, along with the mtime and size of the PV info file when it
+was applied. After a restart, quotad reconciles this state with the
+Quota report instead of setting the Quota again for every PV.
+"""
+import os
+import sqlite3
+import threading
+
+STATE_FILE = os.environ.get("QUOTAD_STATE_FILE",
+                            "/var/lib/glusterd/kadalu-quotad.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pv_quota (
+    brick_path    TEXT NOT NULL,
+    pvname        TEXT NOT NULL,
+    info_path     TEXT NOT NULL,
+    project_id    INTEGER NOT NULL,
+    size          INTEGER NOT NULL,
+    info_mtime_ns INTEGER NOT NULL,
+    info_size     INTEGER NOT NULL,
+    PRIMARY KEY (brick_path, pvname)
+)
+"""
+
+
+class QuotaState:
+    """Applied Quota of the PVs of all the bricks"""
+    def __init__(self, path=STATE_FILE):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.execute(SCHEMA)
+
+    def load(self, brick_path):
+        """Saved state of all the PVs of the brick"""
+        with self.lock:
+            cursor = self.conn.execute(
+                "SELECT pvname, info_path, project_id, size, "
+                "info_mtime_ns, info_size FROM pv_quota WHERE brick_path = ?",
+                (brick_path, ))
+            return [
+                {
+                    "pvname": row[0],
+                    "info_path": row[1],
+                    "project_id": row[2],
+                    "size": row[3],
+                    "info_key": (row[4], row[5])
+                }
+                for row in cursor.fetchall()
+            ]
+
+    def save(self, brick_path, pv_state):
+        """
+        Save the applied Quota of a PV, pv_state has the same
+        fields as returned by load
+        """
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO pv_quota VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (brick_path, pv_state["pvname"], pv_state["info_path"],
+                 pv_state["project_id"], pv_state["size"],
+                 pv_state["info_key"][0], pv_state["info_key"][1]))
+
+    def delete(self, brick_path, pvname):
+        """Remove the state of the deleted PV"""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "DELETE FROM pv_quota WHERE brick_path = ? AND pvname = ?",
+                (brick_path, pvname))
+
+
+STATE = None
+
+
+def get_state():
+    """Shared state instance"""
+    global STATE    # noqa # pylint: disable=global-statement
+    if STATE is None:
+        STATE = QuotaState()
+
+    return STATE
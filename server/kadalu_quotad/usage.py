@@ -0,0 +1,126 @@
+"""
+Per PV usage from the Quota report of the bricks
+
+quotad collects the usage and limits of each PV from the Project
+Quota report once in QUOTAD_USAGE_INTERVAL seconds (Project IDs are
+mapped to the PV names using the index of quotad). The latest usage
+is served at QUOTAD_METRICS_PORT in Prometheus format (/metrics) and
+as JSON (/_api/metrics). Metrics server is not started if the port
+is not set.
+"""
+import json
+import logging
+import os
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    from .kadalulib import logf
+except ImportError:
+    from kadalulib import logf
+
+USAGE_INTERVAL = int(os.environ.get("QUOTAD_USAGE_INTERVAL", "30"))
+METRICS_PORT = int(os.environ.get("QUOTAD_METRICS_PORT", "0"))
+
+# Metric name, help and the field of PV usage
+PV_METRICS = [
+    ("kadalu_quota_pv_used_bytes", "PV used bytes", "used_bytes"),
+    ("kadalu_quota_pv_limit_bytes", "PV Quota hard limit bytes",
+     "limit_bytes"),
+    ("kadalu_quota_pv_used_inodes", "PV used inodes", "used_inodes"),
+    ("kadalu_quota_pv_inodes_limit", "PV Quota inodes hard limit",
+     "inodes_limit")
+]
+
+
+class Usage:
+    """Latest usage of the PVs of all the bricks"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.storage_units = {}
+
+    def update(self, brick_path, pvs):
+        """Replace the usage of the PVs of the brick"""
+        with self.lock:
+            self.storage_units[brick_path] = pvs
+
+    def remove(self, brick_path):
+        """Usage of the brick which is not available now"""
+        with self.lock:
+            self.storage_units.pop(brick_path, None)
+
+    def get(self):
+        """Usage of the PVs of all the bricks"""
+        hostname = socket.gethostname()
+        with self.lock:
+            return [
+                {
+                    "storage_unit": "%s:%s" % (hostname, brick_path),
+                    "pvs": pvs
+                }
+                for brick_path, pvs in self.storage_units.items()
+            ]
+
+
+USAGE = Usage()
+
+
+def escape_label(value):
+    """Escape the Prometheus label value"""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_metrics(storage_units):
+    """Usage in Prometheus text format"""
+    lines = []
+    for name, help_text, field in PV_METRICS:
+        lines.append("# HELP %s %s" % (name, help_text))
+        lines.append("# TYPE %s gauge" % name)
+        for storage_unit in storage_units:
+            for pv_usage in storage_unit["pvs"]:
+                lines.append('%s{storage_unit="%s",pv="%s"} %d' % (
+                    name,
+                    escape_label(storage_unit["storage_unit"]),
+                    escape_label(pv_usage["pvname"]),
+                    pv_usage[field]
+                ))
+
+    return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Serves the latest usage, doesn't run the Quota report"""
+    def do_GET(self):    # noqa # pylint: disable=invalid-name
+        """Prometheus or JSON format based on the path"""
+        if self.path == "/metrics":
+            body = format_metrics(USAGE.get())
+            content_type = "text/plain; version=0.0.4"
+        elif self.path == "/_api/metrics":
+            body = json.dumps({"storage_units": USAGE.get()})
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+
+        body = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):    # noqa # pylint: disable=redefined-builtin
+        """Access logs are not required"""
+
+
+def start_metrics_server():
+    """Serve the usage in a background thread if the port is set"""
+    if METRICS_PORT <= 0:
+        return
+
+    server = ThreadingHTTPServer(("", METRICS_PORT), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True,
+                              name="quotad-metrics")
+    thread.start()
+    logging.info(logf("Started quotad metrics server", port=METRICS_PORT))
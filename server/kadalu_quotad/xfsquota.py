@@ -0,0 +1,316 @@
+"""
+XFS Project Quota backends
+
+Native backend sets the Project ID using FS_IOC_FSSETXATTR ioctl (with
+the inherit flag on directories) and limits/usage using quotactl(2)
+(Q_XSETQLIM, Q_XGETQUOTA and Q_XGETNEXTQUOTA) through ctypes, without
+forking a process per PV. xfs_quota CLI backend is used if the native
+backend is not usable (QUOTAD_BACKEND=auto) or if QUOTAD_BACKEND=cli.
+"""
+import ctypes
+import ctypes.util
+import errno
+import fcntl
+import logging
+import os
+import re
+import struct
+
+try:
+    from .kadalulib import CommandException, execute, logf
+except ImportError:
+    from kadalulib import CommandException, execute, logf
+
+QUOTAD_BACKEND = os.environ.get("QUOTAD_BACKEND", "auto")
+MOUNTS_FILE = "/proc/self/mounts"
+
+# struct fsxattr and ioctls, see linux/fs.h
+FSXATTR = struct.Struct("IIIII8s")
+FS_IOC_FSGETXATTR = 0x801c581f
+FS_IOC_FSSETXATTR = 0x401c5820
+FS_XFLAG_PROJINHERIT = 0x00000200
+
+# quotactl commands, see linux/dqblk_xfs.h and linux/quota.h
+PRJQUOTA = 2
+Q_XGETQUOTA = 0x5803
+Q_XSETQLIM = 0x5804
+Q_XGETNEXTQUOTA = 0x5809
+FS_DQUOT_VERSION = 1
+FS_PROJ_QUOTA = 2
+FS_DQ_BHARD = 1 << 3
+BASIC_BLOCK_SIZE = 512
+
+# Project ID, blocks used/soft/hard and optionally (with -i) inodes
+# used/soft/hard after the blocks warn count and grace columns.
+REPORT_LINE_RE = re.compile(r"^#(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s"
+                            r"(?:\s*\d+\s+\[[^\]]*\]\s+(\d+)\s+(\d+)\s+(\d+))?")
+
+
+class QuotaError(Exception):
+    """Quota operation failed"""
+
+
+class FsDiskQuota(ctypes.Structure):
+    """struct fs_disk_quota (Blocks are in 512 bytes units)"""
+    # noqa # pylint: disable=too-few-public-methods
+    _fields_ = [
+        ("d_version", ctypes.c_int8),
+        ("d_flags", ctypes.c_int8),
+        ("d_fieldmask", ctypes.c_uint16),
+        ("d_id", ctypes.c_uint32),
+        ("d_blk_hardlimit", ctypes.c_uint64),
+        ("d_blk_softlimit", ctypes.c_uint64),
+        ("d_ino_hardlimit", ctypes.c_uint64),
+        ("d_ino_softlimit", ctypes.c_uint64),
+        ("d_bcount", ctypes.c_uint64),
+        ("d_icount", ctypes.c_uint64),
+        ("d_itimer", ctypes.c_int32),
+        ("d_btimer", ctypes.c_int32),
+        ("d_iwarns", ctypes.c_uint16),
+        ("d_bwarns", ctypes.c_uint16),
+        ("d_itimer_hi", ctypes.c_int8),
+        ("d_btimer_hi", ctypes.c_int8),
+        ("d_rtbtimer_hi", ctypes.c_int8),
+        ("d_padding2", ctypes.c_int8),
+        ("d_rtb_hardlimit", ctypes.c_uint64),
+        ("d_rtb_softlimit", ctypes.c_uint64),
+        ("d_rtbcount", ctypes.c_uint64),
+        ("d_rtbtimer", ctypes.c_int32),
+        ("d_rtbwarns", ctypes.c_uint16),
+        ("d_padding3", ctypes.c_int16),
+        ("d_padding4", ctypes.c_char * 8)
+    ]
+
+
+def qcmd(cmd, qtype):
+    """QCMD macro of linux/quota.h"""
+    return (cmd << 8) | (qtype & 0x00ff)
+
+
+def get_mount_device(path):
+    """Device of the filesystem mounted at the longest prefix of path"""
+    path = os.path.realpath(path)
+    device = None
+    mountpoint_len = -1
+    with open(MOUNTS_FILE, encoding="utf-8") as mounts_file:
+        for line in mounts_file:
+            parts = line.split()
+            if len(parts) < 2:
+                continue
+            # Spaces in mount point are escaped as \040
+            mountpoint = parts[1].replace("\\040", " ")
+            if path != mountpoint and \
+               not path.startswith(mountpoint.rstrip("/") + "/"):
+                continue
+            if len(mountpoint) > mountpoint_len:
+                device = parts[0]
+                mountpoint_len = len(mountpoint)
+
+    return device
+
+
+def get_project_id(path):
+    """
+    Project ID of the file or directory using FS_IOC_FSGETXATTR
+    ioctl. None if not supported.
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY | os.O_NOFOLLOW | os.O_NONBLOCK)
+    except OSError:
+        return None
+
+    try:
+        buf = fcntl.ioctl(fd, FS_IOC_FSGETXATTR, bytes(FSXATTR.size))
+        return FSXATTR.unpack(buf)[3]
+    except OSError:
+        return None
+    finally:
+        os.close(fd)
+
+
+def set_path_project_id(path, project_id, is_dir):
+    """Set the Project ID, directories inherit it to new entries"""
+    fd = os.open(path, os.O_RDONLY | os.O_NOFOLLOW | os.O_NONBLOCK)
+    try:
+        buf = fcntl.ioctl(fd, FS_IOC_FSGETXATTR, bytes(FSXATTR.size))
+        xflags, extsize, nextents, _, cowextsize, pad = FSXATTR.unpack(buf)
+        if is_dir:
+            xflags |= FS_XFLAG_PROJINHERIT
+        fcntl.ioctl(fd, FS_IOC_FSSETXATTR,
+                    FSXATTR.pack(xflags, extsize, nextents, project_id,
+                                 cowextsize, pad))
+    finally:
+        os.close(fd)
+
+
+def dquot_usage(dquot):
+    """Limits and usage from struct fs_disk_quota"""
+    return {
+        "hard_limit_bytes": dquot.d_blk_hardlimit * BASIC_BLOCK_SIZE,
+        "used_bytes": dquot.d_bcount * BASIC_BLOCK_SIZE,
+        "inodes_hard_limit": dquot.d_ino_hardlimit,
+        "used_inodes": dquot.d_icount
+    }
+
+
+class NativeBackend:
+    """Project Quota using ioctl and quotactl"""
+    name = "native"
+
+    def __init__(self, rootdir):
+        self.rootdir = rootdir
+        self.device = get_mount_device(rootdir)
+        if self.device is None:
+            raise QuotaError("Mount device not found for %s" % rootdir)
+
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6",
+                                use_errno=True)
+        self.libc.quotactl.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                                       ctypes.c_int, ctypes.c_void_p]
+
+    def quotactl(self, cmd, project_id, dquot):
+        """Run quotactl for the Project, raises OSError on failure"""
+        # qid_t is unsigned, but the argument is declared as int
+        ret = self.libc.quotactl(qcmd(cmd, PRJQUOTA),
+                                 os.fsencode(self.device),
+                                 ctypes.c_int32(project_id).value,
+                                 ctypes.byref(dquot))
+        if ret != 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), self.device)
+
+    def set_project_id(self, subdir_path, project_id):
+        """Tag the directory tree with the Project ID"""
+        set_path_project_id(subdir_path, project_id, True)
+        for dirpath, dirnames, filenames in os.walk(subdir_path):
+            for name in dirnames:
+                set_path_project_id(os.path.join(dirpath, name),
+                                    project_id, True)
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                # Symlinks and special files can't be opened for ioctl
+                if os.path.isfile(path) and not os.path.islink(path):
+                    set_path_project_id(path, project_id, False)
+
+    def set_limit(self, project_id, size):
+        """Set the hard limit (bytes) of the Project"""
+        dquot = FsDiskQuota(
+            d_version=FS_DQUOT_VERSION,
+            d_flags=FS_PROJ_QUOTA,
+            d_fieldmask=FS_DQ_BHARD,
+            d_id=project_id,
+            d_blk_hardlimit=(size + BASIC_BLOCK_SIZE - 1) // BASIC_BLOCK_SIZE
+        )
+        self.quotactl(Q_XSETQLIM, project_id, dquot)
+
+    def get_quota(self, project_id):
+        """Hard limit and usage (bytes) of the Project"""
+        dquot = FsDiskQuota()
+        self.quotactl(Q_XGETQUOTA, project_id, dquot)
+        return dquot_usage(dquot)
+
+    def report(self):
+        """Hard limit and usage of all the Projects"""
+        projects = {}
+        project_id = 0
+        while True:
+            dquot = FsDiskQuota()
+            try:
+                self.quotactl(Q_XGETNEXTQUOTA, project_id, dquot)
+            except OSError as err:
+                # No more Projects with Quota
+                if err.errno == errno.ENOENT:
+                    break
+                raise
+
+            projects[dquot.d_id] = dquot_usage(dquot)
+            if dquot.d_id >= 0xffffffff:
+                break
+            project_id = dquot.d_id + 1
+
+        return projects
+
+
+def parse_quota_report(lines):
+    """
+    Hard limit and usage in bytes of each Project ID from the output
+    of "xfs_quota -x -c 'report -p -b -i'" (Blocks are in KiB). Inode
+    counts are 0 if the report is of blocks only.
+    """
+    projects = {}
+    for line in lines:
+        match = REPORT_LINE_RE.match(line.strip())
+        if match:
+            projects[int(match.group(1))] = {
+                "hard_limit_bytes": int(match.group(4)) * 1024,
+                "used_bytes": int(match.group(2)) * 1024,
+                "inodes_hard_limit": int(match.group(7) or 0),
+                "used_inodes": int(match.group(5) or 0)
+            }
+
+    return projects
+
+
+class CliBackend:
+    """Project Quota using xfs_quota command"""
+    name = "cli"
+
+    def __init__(self, rootdir):
+        self.rootdir = rootdir
+
+    def xfs_quota(self, command):
+        """Run the xfs_quota command, raises QuotaError on failure"""
+        try:
+            out, _, _ = execute("xfs_quota", "-x", "-c", command, self.rootdir)
+        except CommandException as err:
+            raise QuotaError(err.err) from err
+        except OSError as err:
+            # xfsprogs not installed
+            raise QuotaError(str(err)) from err
+
+        return out
+
+    def set_project_id(self, subdir_path, project_id):
+        """Tag the directory tree with the Project ID (Recursive)"""
+        self.xfs_quota('project -s -p %s %d' % (subdir_path, project_id))
+
+    def set_limit(self, project_id, size):
+        """Set the hard limit (bytes) of the Project"""
+        self.xfs_quota('limit -p bhard=%s %d' % (size, project_id))
+
+    def get_quota(self, project_id):
+        """Hard limit and usage (bytes) of the Project"""
+        return self.report().get(project_id, None)
+
+    def report(self):
+        """Hard limit and usage of all the Projects"""
+        return parse_quota_report(
+            self.xfs_quota('report -p -b -i').split("\n"))
+
+
+def get_backend(rootdir):
+    """
+    Native backend if usable, else xfs_quota CLI backend. Returns
+    None if Project Quota is not enabled on the filesystem.
+    """
+    if QUOTAD_BACKEND != "cli":
+        try:
+            backend = NativeBackend(rootdir)
+            backend.report()
+            return backend
+        except (OSError, AttributeError, QuotaError) as err:
+            logging.warning(logf("Native Quota backend not usable, "
+                                 "using xfs_quota",
+                                 rootdir=rootdir, error=err))
+
+    backend = CliBackend(rootdir)
+    try:
+        # Report is empty if Quota is not enabled
+        if not backend.xfs_quota('report -p -b').strip():
+            return None
+    except QuotaError as err:
+        logging.error(logf("Failed to get Quota Report",
+                           rootdir=rootdir, err=err))
+        return None
+
+    return backend
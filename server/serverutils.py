@@ -1,7 +1,11 @@
 """ Utils for server component """
 
 import copy
+import logging
 import kadalu_volgen
+from iostats import BRICK_IOSTATS_OPTIONS
+from kadalulib import logf
+from resourceutils import thread_counts
 
 DEFAULT_OPTIONS = {
     "performance.client-io-threads": "off",
@@ -13,6 +17,99 @@ DEFAULT_OPTIONS = {
     "performance.readdir-ahead": "off"
 }
 
+# Storage pool option to choose the tuning profile. Options with
+# "kadalu." prefix are used by Kadalu and not passed to Volgen.
+PROFILE_OPTION = "kadalu.profile"
+KADALU_OPTION_PREFIX = "kadalu."
+DEFAULT_PROFILE = "default"
+
+# Named tuning profiles, options of the profile are applied
+# over DEFAULT_OPTIONS and the Storage pool options are
+# applied over the profile options.
+PROFILES = {
+    DEFAULT_PROFILE: {},
+    "small-file": {
+        "performance.client-io-threads": "on",
+        "performance.stat-prefetch": "on",
+        "performance.quick-read": "on",
+        "performance.open-behind": "on",
+        "performance.readdir-ahead": "on"
+    },
+    "large-sequential": {
+        "performance.client-io-threads": "on",
+        "performance.stat-prefetch": "on",
+        "performance.open-behind": "on",
+        "performance.read-ahead": "on"
+    },
+    "database": {
+        "performance.client-io-threads": "on"
+    },
+    "metadata-heavy": {
+        "performance.client-io-threads": "on",
+        "performance.stat-prefetch": "on",
+        "performance.readdir-ahead": "on"
+    }
+}
+
+
+# Storage pool options applicable to the Self-Heal-Daemon
+SHD_OPTIONS = [
+    "cluster.shd-max-threads",
+    "cluster.shd-wait-qlength",
+    "cluster.heal-timeout",
+    "disperse.shd-max-threads",
+    "disperse.shd-wait-qlength"
+]
+
+
+def validate_profiles():
+    """Profiles should set only the known options to on/off"""
+    for name, profile_options in PROFILES.items():
+        for key, value in profile_options.items():
+            if key not in DEFAULT_OPTIONS or value not in ("on", "off"):
+                raise ValueError("Invalid option %s=%s in profile %s"
+                                 % (key, value, name))
+
+
+validate_profiles()
+
+
+def thread_options():
+    """
+    Event threads and io-threads sized to the CPUs available
+    to the server pod. FUSE clients in the CSI pods override the
+    client event threads as per their own CPU limit.
+    """
+    counts = thread_counts()
+    return {
+        "server.event-threads": str(counts["event_threads"]),
+        "client.event-threads": str(counts["event_threads"]),
+        "performance.io-thread-count": str(counts["io_threads"])
+    }
+
+
+def get_volgen_options(custom_options):
+    """
+    Options to pass to Volgen. Default options and thread counts,
+    then the options of the profile chosen using "kadalu.profile"
+    and then the Storage pool options.
+    """
+    custom_options = custom_options or {}
+    profile = custom_options.get(PROFILE_OPTION, DEFAULT_PROFILE)
+    if profile not in PROFILES:
+        logging.warning(logf("Unknown tuning profile, using default",
+                             profile=profile))
+        profile = DEFAULT_PROFILE
+
+    options = copy.copy(DEFAULT_OPTIONS)
+    options.update(thread_options())
+    options.update(PROFILES[profile])
+    for key, value in custom_options.items():
+        if not key.startswith(KADALU_OPTION_PREFIX):
+            options[key] = value
+
+    return options
+
 def generate_client_volgen_data(data):
     """
     Create and return client volgen data, which is parsed by
@@ -86,8 +183,11 @@ def generate_client_volgen_data(data):
 def generate_brick_volfile(storage_unit, storage_unit_volfile_path, custom_options):
     """ Generate brick/storage_unit volfile using Kadalu Volgen library"""
 
-    options = copy.copy(DEFAULT_OPTIONS)
-    options.update(custom_options)
+    options = get_volgen_options(custom_options)
+
+    # io-stats dump for the per FOP metrics (See iostats.py)
+    for key, value in BRICK_IOSTATS_OPTIONS.items():
+        options.setdefault(key, value)
 
     kadalu_volgen.generate(
         "/var/lib/kadalu/templates/storage_unit.vol.j2",
@@ -100,11 +200,18 @@ def generate_brick_volfile(storage_unit, storage_unit_volfile_path, custom_optio
 def generate_shd_volfile(data, shd_volfile_path):
     """ Generate Self-Heal-Daemon(SHD) volfile using Kadalu Volgen library"""
 
+    # Heal parallelism as per the Storage pool options
+    options = {}
+    for key, value in data.get("options", {}).items():
+        if key in SHD_OPTIONS:
+            options[key] = value
+
     client_data = generate_client_volgen_data(data)
 
     kadalu_volgen.generate(
         "/var/lib/kadalu/templates/shd.vol.j2",
         data=client_data,
+        options=options,
         output_file=shd_volfile_path
     )
 
@@ -112,8 +219,7 @@ def generate_shd_volfile(data, shd_volfile_path):
 def generate_client_volfile(data, client_volfile_path):
     """ Generate client volfile using Kadalu Volgen library"""
 
-    options = copy.copy(DEFAULT_OPTIONS)
-    options.update(data["options"])
+    options = get_volgen_options(data["options"])
     client_data = generate_client_volgen_data(data)
 
     kadalu_volgen.generate(
@@ -0,0 +1,10 @@
+import os
+import sys
+
+# Server modules import kadalulib as a top level module, as they
+# are laid out in the container image. quotad is imported as the
+# kadalu_quotad package.
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(ROOT_DIR, "lib"))
+sys.path.insert(0, os.path.join(ROOT_DIR, "server"))
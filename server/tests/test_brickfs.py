@@ -0,0 +1,70 @@
+import brickfs
+from brickfs import MIN_AG_SIZE, mkfs_args, mount_args, stripe_options
+
+DEVICE = "/dev/sdc"
+
+
+def geometry(size_bytes=0, minimum_io_size=0, optimal_io_size=0):
+    return {
+        "size_bytes": size_bytes,
+        "minimum_io_size": minimum_io_size,
+        "optimal_io_size": optimal_io_size
+    }
+
+
+def test_stripe_options_raid():
+    # 64k chunk, 4 data disks
+    assert stripe_options(geometry(minimum_io_size=65536,
+                                   optimal_io_size=262144)) == \
+        ["su=65536", "sw=4"]
+
+
+def test_stripe_options_not_striped():
+    assert stripe_options(geometry()) == []
+    # Sector sized minimum IO is not a RAID chunk
+    assert stripe_options(geometry(minimum_io_size=512,
+                                   optimal_io_size=4096)) == []
+    assert stripe_options(geometry(minimum_io_size=65536,
+                                   optimal_io_size=65536)) == []
+    # Optimal IO size is not a multiple of the chunk
+    assert stripe_options(geometry(minimum_io_size=65536,
+                                   optimal_io_size=100000)) == []
+
+
+def test_mkfs_args_none_profile(monkeypatch):
+    monkeypatch.setattr(brickfs, "device_geometry",
+                        lambda device: geometry(minimum_io_size=65536,
+                                                optimal_io_size=262144))
+    assert mkfs_args("none", DEVICE) == []
+
+
+def test_mkfs_args_default_profile(monkeypatch):
+    monkeypatch.setattr(brickfs, "device_geometry",
+                        lambda device: geometry(size_bytes=MIN_AG_SIZE))
+    assert mkfs_args("default", DEVICE) == ["-i", "size=512"]
+    # Unknown profile uses the default profile
+    assert mkfs_args("unknown", DEVICE) == ["-i", "size=512"]
+
+
+def test_mkfs_args_stripe_and_agcount(monkeypatch):
+    monkeypatch.setattr(brickfs, "device_geometry",
+                        lambda device: geometry(size_bytes=64 * MIN_AG_SIZE,
+                                                minimum_io_size=65536,
+                                                optimal_io_size=262144))
+    assert mkfs_args("small-file", DEVICE) == [
+        "-i", "size=512", "-n", "size=8192",
+        "-d", "su=65536,sw=4,agcount=32"
+    ]
+
+
+def test_mkfs_args_small_device_skips_agcount(monkeypatch):
+    monkeypatch.setattr(brickfs, "device_geometry",
+                        lambda device: geometry(size_bytes=MIN_AG_SIZE))
+    assert mkfs_args("small-file", DEVICE) == [
+        "-i", "size=512", "-n", "size=8192"
+    ]
+
+
+def test_mount_args():
+    assert mount_args([]) == []
+    assert mount_args(["noatime", "inode64"]) == ["-o", "noatime,inode64"]
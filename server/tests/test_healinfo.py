@@ -0,0 +1,111 @@
+import healinfo
+from healinfo import HealInfoCollector, parse_info_summary, storage_unit_name
+
+VOLNAME = "storage-pool"
+BRICK_1 = "server-storage-pool-0-0.storage-pool:/bricks/storage-pool/data/brick"
+BRICK_2 = "server-storage-pool-1-0.storage-pool:/bricks/storage-pool/data/brick"
+
+
+def info_summary(pending_1, pending_2="-"):
+    status_2 = "Connected" if pending_2 != "-" else \
+        "Transport endpoint is not connected"
+    return f"""Brick {BRICK_1}
+Status: Connected
+Total Number of entries: {pending_1 + 1}
+Number of entries in heal pending: {pending_1}
+Number of entries in split-brain: 1
+Number of entries possibly healing: 0
+
+Brick {BRICK_2}
+Status: {status_2}
+Total Number of entries: {pending_2}
+Number of entries in heal pending: {pending_2}
+Number of entries in split-brain: {pending_2}
+Number of entries possibly healing: {pending_2}
+"""
+
+
+def test_parse_info_summary():
+    assert parse_info_summary(info_summary(10)) == [
+        {
+            "brick": BRICK_1,
+            "status": "Connected",
+            "total": 11,
+            "heal_pending": 10,
+            "split_brain": 1,
+            "possibly_healing": 0
+        },
+        {
+            "brick": BRICK_2,
+            "status": "Transport endpoint is not connected",
+            "total": None,
+            "heal_pending": None,
+            "split_brain": None,
+            "possibly_healing": None
+        }
+    ]
+
+
+def test_parse_info_summary_empty():
+    assert parse_info_summary("") == []
+    assert parse_info_summary("Volume storage-pool is not started\n") == []
+
+
+def test_storage_unit_name():
+    assert storage_unit_name(BRICK_1) == \
+        "server-storage-pool-0-0:/bricks/storage-pool/data/brick"
+
+
+def test_collector_reports_all_bricks(monkeypatch):
+    outputs = [info_summary(10, 4), info_summary(4, 4)]
+    times = iter([100, 100, 100, 103, 103, 103])
+    monkeypatch.setattr(healinfo.time, "time", lambda: next(times))
+
+    collector = HealInfoCollector(VOLNAME)
+    monkeypatch.setattr(collector, "run_info_summary",
+                        lambda: parse_info_summary(outputs.pop(0)))
+
+    collector.collect()
+    bricks = collector.get()
+    assert [brick["storage_unit"] for brick in bricks] == [
+        "server-storage-pool-0-0:/bricks/storage-pool/data/brick",
+        "server-storage-pool-1-0:/bricks/storage-pool/data/brick"
+    ]
+    assert all(brick["storage"] == VOLNAME for brick in bricks)
+    assert [brick["heal_rate"] for brick in bricks] == [0, 0]
+
+    # 6 entries healed in 3 seconds in the first brick only
+    collector.collect()
+    assert [brick["heal_rate"] for brick in collector.get()] == [2, 0]
+
+
+def test_collector_keeps_last_summary_on_failure(monkeypatch):
+    collector = HealInfoCollector(VOLNAME)
+    monkeypatch.setattr(collector, "run_info_summary",
+                        lambda: parse_info_summary(info_summary(1)))
+    collector.collect()
+
+    def fail():
+        raise OSError("glfsheal not found")
+
+    monkeypatch.setattr(collector, "run_info_summary", fail)
+    collector.collect()
+    assert len(collector.get()) == 2
+
+
+def test_heal_info_collected_only_in_first_unit(monkeypatch):
+    started = []
+    monkeypatch.setattr(healinfo, "COLLECTOR", None)
+    monkeypatch.setattr(HealInfoCollector, "start",
+                        lambda self: started.append(self.volname))
+    monkeypatch.setenv("SHD_REQUIRED", "1")
+    monkeypatch.setenv("VOLUME", VOLNAME)
+
+    monkeypatch.setenv("BRICK_INDEX", "1")
+    healinfo.start_heal_info_collector()
+    assert started == []
+    assert healinfo.heal_info() == []
+
+    monkeypatch.setenv("BRICK_INDEX", "0")
+    healinfo.start_heal_info_collector()
+    assert started == [VOLNAME]
@@ -0,0 +1,105 @@
+import json
+import os
+
+import iostats
+from iostats import DUMP_KEY_RE, brick_io_stats, parse_iostats_dump
+
+PREFIX = "gluster.brick.bricks.storage-pool-1.data.brick"
+
+# Fragment of the io-stats JSON dump of a brick
+DUMP = {
+    PREFIX + ".aggr.read_bytes": "1048576",
+    PREFIX + ".aggr.write_bytes": "4194304",
+    PREFIX + ".aggr.read_1b": "0",
+    PREFIX + ".aggr.fop.WRITE.count": "32",
+    PREFIX + ".aggr.fop.WRITE.fail_count": "1",
+    PREFIX + ".aggr.fop.WRITE.latency_ave_usec": "212.53",
+    PREFIX + ".aggr.fop.WRITE.latency_min_usec": "35.00",
+    PREFIX + ".aggr.fop.WRITE.latency_max_usec": "1875.00",
+    PREFIX + ".aggr.fop.LOOKUP.count": "120",
+    PREFIX + ".aggr.fop.LOOKUP.latency_ave_usec": "",
+    PREFIX + ".aggr.fop.lookup.hits": "120",
+    PREFIX + ".inter.read_bytes": "0",
+    PREFIX + ".inter.write_bytes": "131072",
+    PREFIX + ".inter.fop.WRITE.count": "1",
+    PREFIX + ".inter.fop.WRITE.latency_ave_usec": "98.10",
+    PREFIX + ".inter.fop.FXATTROP.count": "not-a-number",
+    PREFIX + ".uptime": "3600",
+    "gluster.nfs.storage-pool-1.aggr.read_bytes": "512",
+    "gluster.client.storage-pool-1.aggr.fop.READ.count": "7",
+}
+
+
+def test_dump_key_re():
+    match = DUMP_KEY_RE.match(PREFIX + ".inter.fop.FXATTROP.fail_count")
+    assert match.group("interval") == "inter"
+    assert match.group("fop") == "FXATTROP"
+    assert match.group("stat") == "fail_count"
+
+    match = DUMP_KEY_RE.match(PREFIX + ".aggr.write_bytes")
+    assert match.group("interval") == "aggr"
+    assert match.group("fop") is None
+    assert match.group("bytes") == "write_bytes"
+
+    for key in [PREFIX + ".uptime",
+                "gluster.nfs.storage-pool-1.aggr.read_bytes",
+                "gluster.client.storage-pool-1.aggr.fop.READ.count"]:
+        assert DUMP_KEY_RE.match(key) is None
+
+
+def test_parse_iostats_dump():
+    assert parse_iostats_dump(DUMP) == {
+        "cumulative": {
+            "read_bytes": 1048576,
+            "write_bytes": 4194304,
+            "fops": {
+                "WRITE": {
+                    "calls": 32,
+                    "failures": 1,
+                    "latency_avg_usec": 212.53,
+                    "latency_min_usec": 35,
+                    "latency_max_usec": 1875,
+                },
+                # Non numeric average is skipped, unknown stats ignored
+                "LOOKUP": {"calls": 120},
+            }
+        },
+        "interval": {
+            "read_bytes": 0,
+            "write_bytes": 131072,
+            "fops": {
+                "WRITE": {"calls": 1, "latency_avg_usec": 98.1},
+            }
+        }
+    }
+
+
+def test_parse_non_brick_dump():
+    assert parse_iostats_dump({
+        "gluster.nfs.storage-pool-1.aggr.read_bytes": "512",
+        "gluster.client.storage-pool-1.aggr.fop.READ.count": "7",
+    }) is None
+    assert parse_iostats_dump({}) is None
+
+
+def test_brick_io_stats(tmp_path, monkeypatch):
+    monkeypatch.setattr(iostats, "IOSTATS_DIR", str(tmp_path))
+    monkeypatch.setenv("VOLUME", "storage-pool-1")
+    monkeypatch.setenv("HOSTNAME", "server-storage-pool-1-0-0")
+    monkeypatch.setenv("BRICK_PATH", "/bricks/storage-pool-1/data/brick")
+    assert brick_io_stats() == {}
+
+    old_dump = tmp_path / "glusterfsd_1.dump"
+    old_dump.write_text(json.dumps({PREFIX + ".aggr.read_bytes": "1"}))
+    os.utime(old_dump, (1000, 1000))
+    # Latest dump is partially written, the previous one is used
+    (tmp_path / "glusterfsd_2.dump").write_text('{"%s.aggr' % PREFIX)
+
+    stats = brick_io_stats()
+    assert stats["cumulative"]["read_bytes"] == 1
+    assert stats["storage"] == "storage-pool-1"
+    assert stats["storage_unit"] == \
+        "server-storage-pool-1-0-0:/bricks/storage-pool-1/data/brick"
+
+    (tmp_path / "glusterfsd_2.dump").write_text(json.dumps(DUMP))
+    assert brick_io_stats()["cumulative"]["read_bytes"] == 1048576
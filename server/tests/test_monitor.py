@@ -0,0 +1,113 @@
+import signal
+import sys
+import threading
+import time
+
+import pytest
+
+import kadalulib
+from kadalulib import Monitor, Proc, ProcState, restart_delay
+
+# Ignores SIGTERM, so it is stopped only after the grace period
+STUBBORN_PROC_ARGS = [
+    "-c",
+    "import signal, time; signal.signal(signal.SIGTERM, signal.SIG_IGN); "
+    "time.sleep(60)"
+]
+
+
+@pytest.fixture(name="pid_dir", autouse=True)
+def fixture_pid_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(kadalulib, "PROC_PID_DIR", str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture(name="monitor")
+def fixture_monitor():
+    handlers = {signum: signal.getsignal(signum)
+                for signum in [signal.SIGINT, signal.SIGTERM, signal.SIGCHLD]}
+    monitor = Monitor()
+    yield monitor
+
+    for state in monitor.procs.values():
+        if state.subproc is not None:
+            state.subproc.kill()
+            state.subproc.wait()
+    signal.set_wakeup_fd(-1)
+    for signum, handler in handlers.items():
+        signal.signal(signum, handler)
+
+
+def test_restart_delay(monkeypatch):
+    monkeypatch.setattr(kadalulib, "RESTART_BACKOFF_BASE", 1)
+    monkeypatch.setattr(kadalulib, "RESTART_BACKOFF_MAX", 10)
+
+    assert restart_delay(0) == 0
+    # Exponential with 20% jitter
+    assert 0.8 <= restart_delay(1) <= 1.2
+    assert 3.2 <= restart_delay(3) <= 4.8
+    # Capped at the maximum including the jitter
+    assert restart_delay(10) <= 10
+
+
+def test_exited_backoff_and_crash_loop(monkeypatch):
+    monkeypatch.setattr(kadalulib, "restart_delay", lambda failures: failures)
+    state = ProcState(Proc("glusterfsd", "glusterfsd", []))
+    state.start_time = time.time()
+
+    for failures in range(1, kadalulib.CRASH_LOOP_THRESHOLD + 1):
+        assert not state.is_crash_loop()
+        assert state.exited(1) == failures
+        assert state.failures == failures
+        assert state.last_exit_code == 1
+        assert state.restart_at == pytest.approx(time.time() + failures,
+                                                 abs=1)
+
+    assert state.is_crash_loop()
+    assert state.info()["crash_loop"]
+
+
+def test_exited_resets_failures_after_stable_run(monkeypatch):
+    monkeypatch.setattr(kadalulib, "restart_delay", lambda failures: failures)
+    state = ProcState(Proc("glusterfsd", "glusterfsd", []))
+    state.failures = kadalulib.CRASH_LOOP_THRESHOLD
+    state.start_time = time.time() - kadalulib.RESTART_RESET_SECONDS
+
+    assert state.exited(0) == 1
+    assert state.failures == 1
+    assert not state.is_crash_loop()
+
+
+def test_restart_process_does_not_block_monitor(monitor, monkeypatch):
+    monkeypatch.setattr(kadalulib, "STOP_GRACE_SECONDS", 1)
+    proc = Proc("stubborn", sys.executable, STUBBORN_PROC_ARGS)
+    monitor.add_process(proc)
+    state = monitor.procs["stubborn"]
+    state.start()
+    old_pid = state.subproc.pid
+    # Wait till SIGTERM is ignored
+    time.sleep(0.5)
+
+    restart = threading.Thread(target=monitor.restart_process,
+                               args=("stubborn", ))
+    restart.start()
+    time.sleep(0.2)
+
+    # Old process is still in its grace period
+    assert restart.is_alive()
+    assert state.restarting
+    start_time = time.time()
+    assert len(monitor.list_processes()) == 1
+    assert monitor.handle_control_request("health", {})["processes"]
+    # Exit of the old process is not handled by the monitor loop
+    assert monitor.monitor_proc(state) is None
+    assert monitor.handle_control_request(
+        "restart", {"name": "stubborn"})["ok"] is False
+    assert time.time() - start_time < 0.5
+
+    restart.join(5)
+    assert not restart.is_alive()
+    assert not state.restarting
+    assert state.restarts == 1
+    assert state.is_running()
+    assert state.subproc.pid != old_pid
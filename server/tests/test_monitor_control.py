@@ -0,0 +1,157 @@
+import os
+import signal
+import sys
+import threading
+import time
+
+import pytest
+
+import kadalulib
+import monitorctl
+from kadalulib import Monitor, MonitorControlServer, Proc
+
+# Reload signals are ignored, the ready file is created after that
+SLEEP_PROC_ARGS = [
+    "-c",
+    "import signal, sys, time; "
+    "signal.signal(signal.SIGHUP, signal.SIG_IGN); "
+    "signal.signal(signal.SIGUSR1, signal.SIG_IGN); "
+    "open(sys.argv[1], 'w').close(); time.sleep(60)"
+]
+
+
+def wait_for_file(path):
+    """Wait till the process creates the ready file"""
+    end_time = time.time() + 5
+    while not os.path.exists(path) and time.time() < end_time:
+        time.sleep(0.01)
+
+
+@pytest.fixture(name="monitor")
+def fixture_monitor(tmp_path, monkeypatch):
+    monkeypatch.setattr(kadalulib, "PROC_PID_DIR", str(tmp_path))
+    handlers = {signum: signal.getsignal(signum)
+                for signum in [signal.SIGINT, signal.SIGTERM, signal.SIGCHLD]}
+    monitor = Monitor([
+        Proc("glusterfsd", sys.executable,
+             SLEEP_PROC_ARGS + [str(tmp_path / "glusterfsd.ready")]),
+        Proc("shd", sys.executable,
+             SLEEP_PROC_ARGS + [str(tmp_path / "shd.ready")])
+    ])
+    monitor.procs["glusterfsd"].start()
+    wait_for_file(str(tmp_path / "glusterfsd.ready"))
+    yield monitor
+
+    for state in monitor.procs.values():
+        if state.subproc is not None:
+            state.subproc.kill()
+            state.subproc.wait()
+    signal.set_wakeup_fd(-1)
+    for signum, handler in handlers.items():
+        signal.signal(signum, handler)
+
+
+@pytest.fixture(name="socket_path")
+def fixture_socket_path(tmp_path, monitor):
+    path = str(tmp_path / "monitor.sock")
+    server = MonitorControlServer(path, monitor)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield path
+
+    server.shutdown()
+    server.server_close()
+
+
+def test_list_and_health(monitor):
+    resp = monitor.handle_control_request("list", {})
+    assert resp["ok"]
+    processes = {proc["name"]: proc for proc in resp["processes"]}
+    assert processes["glusterfsd"]["running"]
+    assert not processes["shd"]["running"]
+
+    # shd is enabled but not running
+    resp = monitor.handle_control_request("health", {})
+    assert resp["ok"] is False
+    assert len(resp["processes"]) == 2
+
+
+def test_unknown_command(monitor):
+    assert monitor.handle_control_request("stop", {"name": "glusterfsd"}) == {
+        "ok": False,
+        "error": "Unknown command stop"
+    }
+
+
+def test_unknown_process(monitor):
+    for cmd in ["reload", "signal", "restart"]:
+        assert monitor.handle_control_request(cmd, {"name": "nfs"}) == {
+            "ok": False,
+            "error": "Unknown process nfs"
+        }
+
+
+def test_signal(monitor):
+    events = monitor.subscribe()
+    resp = monitor.handle_control_request(
+        "signal", {"name": "glusterfsd", "signal": "USR1"})
+    assert resp == {"ok": True}
+
+    event = events.get_nowait()
+    assert event["event"] == "signalled"
+    assert event["signal"] == "SIGUSR1"
+    monitor.unsubscribe(events)
+
+
+def test_handler_errors(monitor):
+    # Not running
+    resp = monitor.handle_control_request("reload", {"name": "shd"})
+    assert resp["ok"] is False
+    assert "not running" in resp["error"]
+
+    # Unknown signal name
+    resp = monitor.handle_control_request(
+        "signal", {"name": "glusterfsd", "signal": "SIGNOTHING"})
+    assert resp["ok"] is False
+
+
+def test_monitorctl_round_trip(monitor, socket_path):
+    processes = monitorctl.list_processes(socket_path)
+    assert sorted(proc["name"] for proc in processes) == ["glusterfsd", "shd"]
+    assert monitorctl.monitored_processes(socket_path) == processes
+    assert monitorctl.is_healthy(socket_path) is False
+
+    monitorctl.reload("glusterfsd", "SIGUSR1", socket_path)
+
+    with pytest.raises(monitorctl.MonitorCtlError):
+        monitorctl.reload("nfs", path=socket_path)
+
+    with pytest.raises(monitorctl.MonitorCtlError):
+        monitorctl.request("stop", socket_path)
+
+    assert monitor.procs["glusterfsd"].is_running()
+
+
+def test_monitorctl_events(monitor, socket_path):
+    events = monitorctl.events(socket_path)
+    received = []
+
+    def read_event():
+        received.append(next(events))
+
+    reader = threading.Thread(target=read_event, daemon=True)
+    reader.start()
+    # Wait till the events connection is subscribed
+    for _ in range(100):
+        if monitor.subscribers:
+            break
+        reader.join(0.05)
+
+    monitor.signal_process("glusterfsd", signal.SIGUSR1)
+    reader.join(5)
+    assert received[0]["event"] == "signalled"
+    assert received[0]["name"] == "glusterfsd"
+
+
+def test_monitored_processes_without_socket(tmp_path):
+    assert monitorctl.monitored_processes(str(tmp_path / "missing.sock")) == []
@@ -0,0 +1,172 @@
+import json
+import os
+
+import pytest
+
+from kadalu_quotad import quotad
+from kadalu_quotad.quotad import BrickQuota
+from kadalu_quotad.state import QuotaState
+
+GiB = 1073741824
+
+
+class FakeBackend:
+    """Records the Project IDs and limits set"""
+    name = "fake"
+
+    def __init__(self):
+        self.project_ids = {}
+        self.limits = {}
+        self.set_limit_calls = 0
+        self.error = None
+
+    def set_project_id(self, path, project_id):
+        self.project_ids[path] = project_id
+
+    def set_limit(self, project_id, size):
+        self.set_limit_calls += 1
+        if self.error is not None:
+            raise self.error
+        self.limits[project_id] = size
+
+    def report(self):
+        return {}
+
+
+class ListdirCounter:
+    """Counts the directories listed"""
+    def __init__(self, monkeypatch):
+        self.paths = []
+        self.listdir = os.listdir
+        monkeypatch.setattr(quotad.os, "listdir", self)
+
+    def __call__(self, path):
+        self.paths.append(path)
+        return self.listdir(path)
+
+
+@pytest.fixture(name="brick")
+def fixture_brick(tmp_path, monkeypatch):
+    state = QuotaState(str(tmp_path / "kadalu-quotad.db"))
+    monkeypatch.setattr(quotad, "get_state", lambda: state)
+    brick_path = tmp_path / "brick"
+    (brick_path / "info" / "subvol").mkdir(parents=True)
+
+    brick = BrickQuota(str(brick_path))
+    brick.backend = FakeBackend()
+    return brick
+
+
+def bump_mtime(path):
+    """
+    Directory mtime uses the coarse kernel clock, move it ahead so
+    that the change is seen even within the same clock tick.
+    """
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+def add_pv(brick, hashdir, pvname, size):
+    """Create the PV directory and its info file"""
+    dir1, dir2 = hashdir
+    pv_dir = os.path.join(brick.brick_path, "subvol", dir1, dir2, pvname)
+    os.makedirs(pv_dir)
+    info_dir = brick.info_root
+    for name in [dir1, dir2]:
+        info_dir = os.path.join(info_dir, name)
+        if not os.path.exists(info_dir):
+            os.mkdir(info_dir)
+            bump_mtime(os.path.dirname(info_dir))
+
+    info_path = os.path.join(info_dir, pvname + ".json")
+    with open(info_path, "w") as info_file:
+        info_file.write(json.dumps({"size": size}))
+    bump_mtime(info_dir)
+    return info_path
+
+
+def test_rescan_applies_quota(brick):
+    add_pv(brick, ("ab", "cd"), "pvc-1", GiB)
+    add_pv(brick, ("ab", "ef"), "pvc-2", 2 * GiB)
+    brick.rescan()
+
+    assert brick.limits == {"pvc-1": GiB, "pvc-2": 2 * GiB}
+    assert sorted(brick.backend.limits.values()) == [GiB, 2 * GiB]
+    assert len(brick.backend.project_ids) == 2
+    assert [pv["pvname"] for pv in brick.state.load(brick.brick_path)] == \
+        ["pvc-1", "pvc-2"]
+
+
+def test_rescan_skips_unchanged_dirs(brick, monkeypatch):
+    add_pv(brick, ("ab", "cd"), "pvc-1", GiB)
+    brick.rescan()
+
+    listdir = ListdirCounter(monkeypatch)
+    brick.rescan()
+
+    # Nothing changed, no directory listed and no Quota set again
+    assert not listdir.paths
+    assert brick.backend.set_limit_calls == 1
+
+
+def test_rescan_picks_new_pvs(brick, monkeypatch):
+    add_pv(brick, ("ab", "cd"), "pvc-1", GiB)
+    add_pv(brick, ("12", "34"), "pvc-3", GiB)
+    brick.rescan()
+
+    listdir = ListdirCounter(monkeypatch)
+    add_pv(brick, ("ab", "cd"), "pvc-2", 2 * GiB)
+    add_pv(brick, ("ab", "ef"), "pvc-4", GiB)
+    brick.rescan()
+
+    assert brick.limits == {"pvc-1": GiB, "pvc-2": 2 * GiB,
+                            "pvc-3": GiB, "pvc-4": GiB}
+    # Only the changed directories are listed again
+    assert sorted(listdir.paths) == sorted([
+        os.path.join(brick.info_root, "ab"),
+        os.path.join(brick.info_root, "ab", "cd"),
+        os.path.join(brick.info_root, "ab", "ef"),
+    ])
+    assert brick.backend.set_limit_calls == 4
+
+
+def test_rescan_applies_resize(brick):
+    info_path = add_pv(brick, ("ab", "cd"), "pvc-1", GiB)
+    brick.rescan()
+
+    with open(info_path, "w") as info_file:
+        info_file.write(json.dumps({"size": 2 * GiB}))
+    brick.rescan()
+
+    assert brick.limits == {"pvc-1": 2 * GiB}
+    assert list(brick.backend.limits.values()) == [2 * GiB]
+    # Directory is tagged only once
+    assert len(brick.backend.project_ids) == 1
+
+
+def test_rescan_drops_removed_pvs(brick):
+    info_path = add_pv(brick, ("ab", "cd"), "pvc-1", GiB)
+    add_pv(brick, ("ab", "cd"), "pvc-2", GiB)
+    brick.rescan()
+
+    os.remove(info_path)
+    bump_mtime(os.path.dirname(info_path))
+    brick.rescan()
+
+    assert brick.limits == {"pvc-2": GiB}
+    assert info_path not in brick.info_files
+    assert [pv["pvname"] for pv in brick.state.load(brick.brick_path)] == \
+        ["pvc-2"]
+
+
+def test_rescan_retries_failed_quota(brick):
+    add_pv(brick, ("ab", "cd"), "pvc-1", GiB)
+    brick.backend.error = quotad.QuotaError("quotactl failed")
+    brick.rescan()
+    assert brick.limits == {}
+    assert not brick.info_files
+
+    # Info file is not changed, retried in the next rescan
+    brick.backend.error = None
+    brick.rescan()
+    assert brick.limits == {"pvc-1": GiB}
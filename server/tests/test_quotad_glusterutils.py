@@ -0,0 +1,119 @@
+import os
+import time
+
+import pytest
+
+from kadalu_quotad import glusterutils
+from kadalu_quotad.glusterutils import get_local_bricks, vols_info_signature
+
+LOCAL_UUID = "4e1b3a7c-35b2-4d3a-9c8e-1f6a2b9d7c01"
+PEER_UUID = "9a7c2d4e-6b1f-4c3e-8d2a-5e0f1b3c6d02"
+
+
+class FakeVolume:
+    """Volume info of glustercli, counts the calls"""
+    def __init__(self):
+        self.calls = 0
+        self.volumes = []
+
+    def add(self, volname, bricks):
+        self.volumes.append({
+            "name": volname,
+            "bricks": [{"name": "%s:%s" % (host, path), "uuid": uuid}
+                       for host, path, uuid in bricks]
+        })
+
+    def info(self):
+        self.calls += 1
+        return self.volumes
+
+
+@pytest.fixture(name="volume")
+def fixture_volume(tmp_path, monkeypatch):
+    uuid_file = tmp_path / "glusterd.info"
+    uuid_file.write_text("UUID=%s\noperating-version=100000\n" % LOCAL_UUID)
+    (tmp_path / "vols").mkdir()
+
+    volume = FakeVolume()
+    monkeypatch.setattr(glusterutils, "volume", volume)
+    monkeypatch.setattr(glusterutils, "UUID_FILE", str(uuid_file))
+    monkeypatch.setattr(glusterutils, "VOLS_DIR", str(tmp_path / "vols"))
+    monkeypatch.setattr(glusterutils, "MYUUID", None)
+    monkeypatch.setattr(glusterutils, "LOCAL_BRICKS",
+                        {"signature": None, "bricks": None, "updated": 0})
+    return volume
+
+
+def write_volinfo(volname, mtime):
+    """Create or update the info file of the volume in glusterd dir"""
+    vol_dir = os.path.join(glusterutils.VOLS_DIR, volname)
+    os.makedirs(vol_dir, exist_ok=True)
+    info_path = os.path.join(vol_dir, "info")
+    with open(info_path, "w") as info_file:
+        info_file.write("type=2\ncount=3\n")
+    os.utime(info_path, (mtime, mtime))
+
+
+def test_vols_info_signature(volume):
+    assert vols_info_signature() == ()
+
+    write_volinfo("storage-pool-2", 2000)
+    write_volinfo("storage-pool-1", 1000)
+    # Volume dir without info file (being created)
+    os.mkdir(os.path.join(glusterutils.VOLS_DIR, "storage-pool-3"))
+    assert vols_info_signature() == (
+        ("storage-pool-1", 1000 * 10 ** 9),
+        ("storage-pool-2", 2000 * 10 ** 9),
+    )
+
+
+def test_vols_info_signature_not_readable(volume, monkeypatch):
+    monkeypatch.setattr(glusterutils, "VOLS_DIR", "/nonexisting/vols")
+    assert vols_info_signature() is None
+
+
+def test_bricks_cached_till_volumes_change(volume):
+    volume.add("storage-pool-1", [
+        ("server-1", "/bricks/storage-pool-1/data/brick", LOCAL_UUID),
+        ("server-2", "/bricks/storage-pool-1/data/brick", PEER_UUID),
+    ])
+    write_volinfo("storage-pool-1", 1000)
+
+    assert get_local_bricks() == ["/bricks/storage-pool-1/data/brick"]
+    assert get_local_bricks() == ["/bricks/storage-pool-1/data/brick"]
+    assert volume.calls == 1
+
+    # New volume created
+    volume.add("storage-pool-2", [
+        ("server-1", "/bricks/storage-pool-2/data/brick", LOCAL_UUID),
+    ])
+    write_volinfo("storage-pool-2", 1000)
+    assert get_local_bricks() == ["/bricks/storage-pool-1/data/brick",
+                                  "/bricks/storage-pool-2/data/brick"]
+    assert volume.calls == 2
+
+    # Brick replaced, only the mtime of the info file is changed
+    volume.volumes[1]["bricks"][0]["uuid"] = PEER_UUID
+    write_volinfo("storage-pool-2", 2000)
+    assert get_local_bricks() == ["/bricks/storage-pool-1/data/brick"]
+    assert volume.calls == 3
+
+    assert get_local_bricks() == ["/bricks/storage-pool-1/data/brick"]
+    assert volume.calls == 3
+
+
+def test_bricks_refreshed_after_interval(volume, monkeypatch):
+    # Changes can't be detected if glusterd dir is not readable
+    monkeypatch.setattr(glusterutils, "VOLS_DIR", "/nonexisting/vols")
+    volume.add("storage-pool-1", [
+        ("server-1", "/bricks/storage-pool-1/data/brick", LOCAL_UUID),
+    ])
+
+    assert get_local_bricks() == ["/bricks/storage-pool-1/data/brick"]
+    assert get_local_bricks() == ["/bricks/storage-pool-1/data/brick"]
+    assert volume.calls == 1
+
+    glusterutils.LOCAL_BRICKS["updated"] = \
+        time.time() - glusterutils.REFRESH_INTERVAL
+    assert get_local_bricks() == ["/bricks/storage-pool-1/data/brick"]
+    assert volume.calls == 2
@@ -0,0 +1,51 @@
+import pytest
+
+from kadalu_quotad.state import QuotaState
+
+BRICK_1 = "/bricks/storage-pool/data/brick"
+BRICK_2 = "/bricks/storage-pool-2/data/brick"
+
+
+def pv_state(pvname, size, info_key=(1000, 20)):
+    return {
+        "pvname": pvname,
+        "info_path": "%s/info/subvol/ab/cd/%s.json" % (BRICK_1, pvname),
+        "project_id": 4242,
+        "size": size,
+        "info_key": info_key
+    }
+
+
+@pytest.fixture(name="state")
+def fixture_state(tmp_path):
+    return QuotaState(str(tmp_path / "kadalu-quotad.db"))
+
+
+def test_save_and_load(state):
+    state.save(BRICK_1, pv_state("pvc-1", 1073741824))
+    state.save(BRICK_2, pv_state("pvc-2", 2147483648))
+
+    assert state.load(BRICK_1) == [pv_state("pvc-1", 1073741824)]
+    assert state.load(BRICK_2) == [pv_state("pvc-2", 2147483648)]
+
+
+def test_save_replaces_on_resize(state):
+    state.save(BRICK_1, pv_state("pvc-1", 1073741824))
+    state.save(BRICK_1, pv_state("pvc-1", 2147483648, (2000, 21)))
+
+    assert state.load(BRICK_1) == [pv_state("pvc-1", 2147483648, (2000, 21))]
+
+
+def test_delete(state):
+    state.save(BRICK_1, pv_state("pvc-1", 1073741824))
+    state.save(BRICK_1, pv_state("pvc-2", 1073741824))
+    state.delete(BRICK_1, "pvc-1")
+
+    assert [pv["pvname"] for pv in state.load(BRICK_1)] == ["pvc-2"]
+
+
+def test_state_persists_across_restart(tmp_path):
+    path = str(tmp_path / "kadalu-quotad.db")
+    QuotaState(path).save(BRICK_1, pv_state("pvc-1", 1073741824))
+
+    assert QuotaState(path).load(BRICK_1) == [pv_state("pvc-1", 1073741824)]
@@ -0,0 +1,77 @@
+from kadalu_quotad.usage import Usage, escape_label, format_metrics
+
+STORAGE_UNIT = "server-storage-pool-1-0-0:/bricks/storage-pool-1/data/brick"
+
+
+def pv_usage(pvname, used_bytes, limit_bytes):
+    return {
+        "pvname": pvname,
+        "used_bytes": used_bytes,
+        "limit_bytes": limit_bytes,
+        "used_inodes": 12,
+        "inodes_limit": 0
+    }
+
+
+def test_escape_label():
+    assert escape_label("pvc-1") == "pvc-1"
+    assert escape_label('a"b') == 'a\\"b'
+    assert escape_label("a\\b") == "a\\\\b"
+    assert escape_label("a\nb") == "a\\nb"
+    # Backslash is escaped first, not doubled again for the quote
+    assert escape_label('\\"') == '\\\\\\"'
+
+
+def test_format_metrics():
+    storage_units = [{
+        "storage_unit": STORAGE_UNIT,
+        "pvs": [pv_usage("pvc-1", 4096, 1073741824),
+                pv_usage("pvc-2", 0, 2147483648)]
+    }]
+    label_1 = 'storage_unit="%s",pv="pvc-1"' % STORAGE_UNIT
+    label_2 = 'storage_unit="%s",pv="pvc-2"' % STORAGE_UNIT
+    assert format_metrics(storage_units) == "\n".join([
+        "# HELP kadalu_quota_pv_used_bytes PV used bytes",
+        "# TYPE kadalu_quota_pv_used_bytes gauge",
+        "kadalu_quota_pv_used_bytes{%s} 4096" % label_1,
+        "kadalu_quota_pv_used_bytes{%s} 0" % label_2,
+        "# HELP kadalu_quota_pv_limit_bytes PV Quota hard limit bytes",
+        "# TYPE kadalu_quota_pv_limit_bytes gauge",
+        "kadalu_quota_pv_limit_bytes{%s} 1073741824" % label_1,
+        "kadalu_quota_pv_limit_bytes{%s} 2147483648" % label_2,
+        "# HELP kadalu_quota_pv_used_inodes PV used inodes",
+        "# TYPE kadalu_quota_pv_used_inodes gauge",
+        "kadalu_quota_pv_used_inodes{%s} 12" % label_1,
+        "kadalu_quota_pv_used_inodes{%s} 12" % label_2,
+        "# HELP kadalu_quota_pv_inodes_limit PV Quota inodes hard limit",
+        "# TYPE kadalu_quota_pv_inodes_limit gauge",
+        "kadalu_quota_pv_inodes_limit{%s} 0" % label_1,
+        "kadalu_quota_pv_inodes_limit{%s} 0" % label_2,
+    ]) + "\n"
+
+
+def test_format_metrics_escapes_labels():
+    metrics = format_metrics([{
+        "storage_unit": 'host:/bricks/"pool"',
+        "pvs": [pv_usage("pvc\n1", 1, 2)]
+    }])
+    assert 'kadalu_quota_pv_used_bytes{storage_unit="host:/bricks/\\"pool\\"",' \
+        'pv="pvc\\n1"} 1\n' in metrics
+
+
+def test_format_metrics_without_usage():
+    # Only the HELP and TYPE lines
+    lines = format_metrics([]).splitlines()
+    assert len(lines) == 8
+    assert all(line.startswith("# ") for line in lines)
+
+
+def test_usage_update_and_remove(monkeypatch):
+    monkeypatch.setattr("socket.gethostname", lambda: "server-0")
+    usage = Usage()
+    usage.update("/bricks/b1", [pv_usage("pvc-1", 1, 2)])
+    usage.update("/bricks/b2", [])
+    usage.remove("/bricks/b2")
+
+    assert usage.get() == [{"storage_unit": "server-0:/bricks/b1",
+                            "pvs": [pv_usage("pvc-1", 1, 2)]}]
@@ -0,0 +1,298 @@
+import pytest
+
+import resourceutils
+from resourceutils import (UNAVAILABLE, CgroupInfo, CgroupSampler,
+                           classify_gluster_process, parse_blkio_v1,
+                           parse_io_stat_v2, parse_mountinfo,
+                           parse_proc_cgroup, parse_psi, resolve_cgroup_dir,
+                           thread_counts)
+
+# Server pod with the host's cgroupfs mounted (cgroup v1) and a
+# hybrid cgroup2 mount
+MOUNTINFO_V1 = """\
+22 1 0:21 / /proc rw,nosuid,nodev,noexec,relatime shared:12 - proc proc rw
+30 25 0:26 / /sys/fs/cgroup/unified rw,nosuid,nodev,noexec,relatime shared:10 - cgroup2 cgroup2 rw,nsdelegate
+33 25 0:29 / /sys/fs/cgroup/cpu,cpuacct rw,nosuid,nodev,noexec,relatime shared:15 - cgroup cgroup rw,cpu,cpuacct
+35 25 0:31 / /sys/fs/cgroup/memory rw,nosuid,nodev,noexec,relatime shared:17 - cgroup cgroup rw,memory
+36 25 0:32 / /sys/fs/cgroup/blkio rw,nosuid,nodev,noexec,relatime shared:18 - cgroup cgroup rw,blkio
+37 25 0:33 /kubepods /sys/fs/cgroup/pids rw,nosuid - cgroup cgroup rw,pids
+malformed line
+"""
+
+PROC_CGROUP_V1 = """\
+12:pids:/kubepods/burstable/pod1234/abcd
+9:blkio:/kubepods/burstable/pod1234/abcd
+5:memory:/kubepods/burstable/pod1234/abcd
+3:cpu,cpuacct:/kubepods/burstable/pod1234/abcd
+1:name=systemd:/kubepods/burstable/pod1234/abcd
+0::/kubepods/burstable/pod1234/abcd
+"""
+
+# CSI pod in its own cgroup namespace (cgroup v2)
+MOUNTINFO_V2 = """\
+1062 1061 0:26 / /sys/fs/cgroup ro,nosuid,nodev,noexec,relatime - cgroup2 cgroup rw,nsdelegate,memory_recursiveprot
+"""
+
+PROC_CGROUP_V2 = "0::/\n"
+
+PSI = """\
+some avg10=1.50 avg60=0.75 avg300=0.10 total=123456
+full avg10=0.00 avg60=0.25 avg300=x total=7890
+"""
+
+IO_STAT = """\
+8:0 rbytes=1024 wbytes=2048 rios=1 wios=2 dbytes=0 dios=0
+8:16 rbytes=4096 wbytes=0 rios=4 wios=0 dbytes=0 dios=0
+"""
+
+BLKIO_BYTES = """\
+8:0 Read 1024
+8:0 Write 2048
+8:0 Sync 3072
+8:0 Async 0
+8:0 Total 3072
+8:16 Read 4096
+8:16 Write 0
+Total 7168
+"""
+
+BLKIO_IOS = """\
+8:0 Read 1
+8:0 Write 2
+8:16 Read 4
+Total 7
+"""
+
+
+def write(path, content):
+    path.write_text(content)
+    return str(path)
+
+
+def test_parse_mountinfo(tmp_path):
+    mounts = parse_mountinfo(write(tmp_path / "mountinfo", MOUNTINFO_V1))
+    assert mounts == [
+        ("cgroup2", "/", "/sys/fs/cgroup/unified", "rw,nsdelegate"),
+        ("cgroup", "/", "/sys/fs/cgroup/cpu,cpuacct", "rw,cpu,cpuacct"),
+        ("cgroup", "/", "/sys/fs/cgroup/memory", "rw,memory"),
+        ("cgroup", "/", "/sys/fs/cgroup/blkio", "rw,blkio"),
+        ("cgroup", "/kubepods", "/sys/fs/cgroup/pids", "rw,pids"),
+    ]
+    assert parse_mountinfo(str(tmp_path / "missing")) == []
+
+
+def test_parse_proc_cgroup(tmp_path):
+    path = "/kubepods/burstable/pod1234/abcd"
+    paths = parse_proc_cgroup(write(tmp_path / "cgroup", PROC_CGROUP_V1))
+    assert paths == {
+        "pids": path,
+        "blkio": path,
+        "memory": path,
+        "cpu": path,
+        "cpuacct": path,
+        "name=systemd": path,
+        "": path,
+    }
+
+    assert parse_proc_cgroup(write(tmp_path / "cgroup2",
+                                   PROC_CGROUP_V2)) == {"": "/"}
+    assert parse_proc_cgroup(str(tmp_path / "missing")) == {}
+
+
+def test_resolve_cgroup_dir(tmp_path):
+    mountpoint = tmp_path / "memory"
+    nested = mountpoint / "kubepods" / "burstable" / "pod1234" / "abcd"
+    nested.mkdir(parents=True)
+
+    # Host cgroupfs mounted in the container, full host path
+    assert resolve_cgroup_dir(str(mountpoint), "/",
+                              "/kubepods/burstable/pod1234/abcd") == \
+        str(nested)
+
+    # Mount root is a prefix of the path
+    pids_mountpoint = tmp_path / "pids"
+    (pids_mountpoint / "burstable" / "pod1234" / "abcd").mkdir(parents=True)
+    assert resolve_cgroup_dir(str(pids_mountpoint), "/kubepods",
+                              "/kubepods/burstable/pod1234/abcd") == \
+        str(pids_mountpoint / "burstable" / "pod1234" / "abcd")
+
+    # cgroup namespace, path is "/"
+    assert resolve_cgroup_dir(str(mountpoint), "/", "/") == \
+        str(mountpoint) + "/"
+
+    # Path not visible in the container
+    assert resolve_cgroup_dir(str(mountpoint), "/",
+                              "/system.slice/kubelet.service") == \
+        str(mountpoint)
+
+
+def test_parse_psi(tmp_path):
+    psi = parse_psi(write(tmp_path / "cpu.pressure", PSI))
+    assert psi == {
+        "some": {"avg10": 1.5, "avg60": 0.75, "avg300": 0.1,
+                 "total": 123456},
+        # Invalid values are skipped
+        "full": {"avg10": 0.0, "avg60": 0.25, "total": 7890},
+    }
+    assert isinstance(psi["some"]["total"], int)
+
+    # cpu.pressure has only "some" line in older kernels
+    psi = parse_psi(write(tmp_path / "io.pressure", PSI.splitlines()[0]))
+    assert list(psi.keys()) == ["some"]
+
+    # PSI not enabled in the kernel
+    assert parse_psi(str(tmp_path / "memory.pressure")) == {}
+
+
+def test_parse_io_stat_v2(tmp_path):
+    assert parse_io_stat_v2(write(tmp_path / "io.stat", IO_STAT)) == {
+        "read_bytes": 5120,
+        "write_bytes": 2048,
+        "read_ios": 5,
+        "write_ios": 2,
+    }
+    # No I/O yet, io.stat is empty
+    assert parse_io_stat_v2(write(tmp_path / "empty", "")) == {
+        "read_bytes": 0,
+        "write_bytes": 0,
+        "read_ios": 0,
+        "write_ios": 0,
+    }
+    assert parse_io_stat_v2(str(tmp_path / "missing")) is None
+
+
+def test_parse_blkio_v1(tmp_path):
+    bytes_path = write(tmp_path / "blkio.throttle.io_service_bytes",
+                       BLKIO_BYTES)
+    ios_path = write(tmp_path / "blkio.throttle.io_serviced", BLKIO_IOS)
+
+    assert parse_blkio_v1(bytes_path, ios_path) == {
+        "read_bytes": 5120,
+        "write_bytes": 2048,
+        "read_ios": 5,
+        "write_ios": 2,
+    }
+
+    # Only one of the files available
+    assert parse_blkio_v1(bytes_path, str(tmp_path / "missing")) == {
+        "read_bytes": 5120,
+        "write_bytes": 2048,
+        "read_ios": 0,
+        "write_ios": 0,
+    }
+
+    # blkio controller not mounted
+    assert parse_blkio_v1(None, None) is None
+    assert parse_blkio_v1(str(tmp_path / "missing"),
+                          str(tmp_path / "missing")) is None
+
+
+def test_sampler_io_unavailable(tmp_path):
+    unavailable = {"read_bytes": UNAVAILABLE, "write_bytes": UNAVAILABLE,
+                   "read_ios": UNAVAILABLE, "write_ios": UNAVAILABLE}
+
+    sampler = CgroupSampler(CgroupInfo(2, {"": str(tmp_path)}))
+    assert sampler.io() == unavailable
+    assert sampler.pressure() == {}
+
+    sampler = CgroupSampler(CgroupInfo(1, {"memory": str(tmp_path)}))
+    assert sampler.io() == unavailable
+
+
+def test_sampler_v2(tmp_path):
+    write(tmp_path / "io.stat", IO_STAT)
+    write(tmp_path / "cpu.pressure", PSI)
+    write(tmp_path / "cpu.max", "150000 100000\n")
+    write(tmp_path / "memory.max", "max\n")
+
+    sampler = CgroupSampler(CgroupInfo(2, {"": str(tmp_path)}))
+    assert sampler.io()["read_bytes"] == 5120
+    assert list(sampler.pressure().keys()) == ["cpu"]
+    assert sampler.cpu_limit() == 1.5
+    assert sampler.memory_limit_bytes() == UNAVAILABLE
+
+
+def test_detect_cgroup_v1(tmp_path, monkeypatch):
+    cgroup_root = tmp_path / "sys" / "fs" / "cgroup"
+    mountinfo = MOUNTINFO_V1.replace("/sys/fs/cgroup", str(cgroup_root))
+    pod_dir = "kubepods/burstable/pod1234/abcd"
+    for controller in ["cpu,cpuacct", "memory", "blkio"]:
+        (cgroup_root / controller / pod_dir).mkdir(parents=True)
+
+    mountinfo_path = write(tmp_path / "mountinfo", mountinfo)
+    cgroup_path = write(tmp_path / "cgroup", PROC_CGROUP_V1)
+    monkeypatch.setattr(resourceutils, "parse_mountinfo",
+                        lambda: parse_mountinfo(mountinfo_path))
+    monkeypatch.setattr(resourceutils, "parse_proc_cgroup",
+                        lambda: parse_proc_cgroup(cgroup_path))
+
+    cgroup = resourceutils.detect_cgroup()
+    assert cgroup.version == 1
+    assert cgroup.path("memory", "memory.stat") == \
+        str(cgroup_root / "memory" / pod_dir / "memory.stat")
+    assert cgroup.path("cpuacct", "cpuacct.usage") == \
+        str(cgroup_root / "cpu,cpuacct" / pod_dir / "cpuacct.usage")
+    assert cgroup.path("io", "io.stat") is None
+
+
+def test_detect_cgroup_v2(tmp_path, monkeypatch):
+    cgroup_root = tmp_path / "cgroup"
+    cgroup_root.mkdir()
+    mountinfo = MOUNTINFO_V2.replace("/sys/fs/cgroup", str(cgroup_root))
+    mountinfo_path = write(tmp_path / "mountinfo", mountinfo)
+    cgroup_path = write(tmp_path / "proc_cgroup", PROC_CGROUP_V2)
+    monkeypatch.setattr(resourceutils, "parse_mountinfo",
+                        lambda: parse_mountinfo(mountinfo_path))
+    monkeypatch.setattr(resourceutils, "parse_proc_cgroup",
+                        lambda: parse_proc_cgroup(cgroup_path))
+
+    cgroup = resourceutils.detect_cgroup()
+    assert cgroup.version == 2
+    assert cgroup.path("io", "io.stat") == str(cgroup_root / "io.stat")
+
+
+@pytest.mark.parametrize("args, expected", [
+    (["/usr/sbin/glusterfsd", "-s", "server-storage-pool-1-0-0",
+      "--volfile-id",
+      "storage-pool-1.server-storage-pool-1-0-0.bricks-storage-pool-1-data-brick",
+      "-p", "/var/run/gluster/glusterfsd-bricks-storage-pool-1-data-brick.pid",
+      "--brick-name", "/bricks/storage-pool-1/data/brick"],
+     ("glusterfsd", "storage-pool-1")),
+    (["/usr/sbin/glusterfs", "-s", "localhost",
+      "--volfile-id", "gluster/glustershd",
+      "-p", "/var/run/gluster/glustershd/glustershd.pid",
+      "--fs-display-name=kadalu:storage-pool-1"],
+     ("shd", "storage-pool-1")),
+    (["/opt/sbin/glusterfs", "--process-name", "fuse",
+      "--volfile-server=kadalu-storage-pool-1-0",
+      "--volfile-id=storage-pool-1", "/mnt/storage-pool-1"],
+     ("fuse", "storage-pool-1")),
+    # Gluster processes not managed by Kadalu
+    (["/usr/sbin/glusterfs", "--volfile-id=gluster/snapd"], None),
+    (["/usr/sbin/glusterd", "-p", "/var/run/glusterd.pid"], None),
+    (["python3", "/kadalu/server.py"], None),
+    ([], None),
+])
+def test_classify_gluster_process(args, expected):
+    assert classify_gluster_process(args) == expected
+
+
+@pytest.mark.parametrize("cpus, expected", [
+    # Fractional CPU limits are rounded up
+    (0.1, {"event_threads": 1, "io_threads": 4, "reader_threads": 1}),
+    (0.5, {"event_threads": 1, "io_threads": 4, "reader_threads": 1}),
+    (1, {"event_threads": 1, "io_threads": 4, "reader_threads": 1}),
+    (1.5, {"event_threads": 2, "io_threads": 8, "reader_threads": 1}),
+    (4, {"event_threads": 4, "io_threads": 16, "reader_threads": 2}),
+    (7.2, {"event_threads": 8, "io_threads": 32, "reader_threads": 4}),
+    # Bounded by the maximums
+    (64, {"event_threads": 16, "io_threads": 64, "reader_threads": 8}),
+    (0, {"event_threads": 1, "io_threads": 4, "reader_threads": 1}),
+])
+def test_thread_counts(cpus, expected):
+    assert thread_counts(cpus) == expected
+
+
+def test_thread_counts_available_cpus(monkeypatch):
+    monkeypatch.setattr(resourceutils, "available_cpus", lambda: 2.5)
+    assert thread_counts()["event_threads"] == 3
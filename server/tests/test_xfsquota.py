@@ -0,0 +1,100 @@
+import pytest
+
+from kadalu_quotad import xfsquota
+from kadalu_quotad.xfsquota import (FS_DQ_BHARD, FS_DQUOT_VERSION,
+                                    FS_PROJ_QUOTA, NativeBackend, QuotaError,
+                                    get_mount_device, parse_quota_report)
+
+REPORT = """Project quota on /bricks/storage-pool (/dev/sdc)
+                               Blocks                                          Inodes
+Project ID       Used       Soft       Hard    Warn/Grace           Used       Soft       Hard    Warn/ Grace
+---------- -------------------------------------------------- --------------------------------------------------
+#0                  4          0          0     00 [--------]          3          0          0     00 [--------]
+#4242           10240          0    1048576     00 [--------]         12          0       1000     00 [--------]
+"""
+
+REPORT_BLOCKS_ONLY = """Project quota on /bricks/storage-pool (/dev/sdc)
+                               Blocks
+Project ID       Used       Soft       Hard    Warn/Grace
+---------- --------------------------------------------------
+#4242           10240          0    1048576     00 [--------]
+"""
+
+MOUNTS = """proc /proc proc rw,nosuid,nodev,noexec,relatime 0 0
+/dev/sda1 / ext4 rw,relatime 0 0
+/dev/sdc /bricks/storage-pool xfs rw,relatime,prjquota 0 0
+/dev/sdd /bricks/storage\\040pool xfs rw,relatime,prjquota 0 0
+"""
+
+
+def test_parse_quota_report():
+    assert parse_quota_report(REPORT.split("\n")) == {
+        0: {
+            "hard_limit_bytes": 0,
+            "used_bytes": 4096,
+            "inodes_hard_limit": 0,
+            "used_inodes": 3
+        },
+        4242: {
+            "hard_limit_bytes": 1048576 * 1024,
+            "used_bytes": 10240 * 1024,
+            "inodes_hard_limit": 1000,
+            "used_inodes": 12
+        }
+    }
+
+
+def test_parse_quota_report_blocks_only():
+    assert parse_quota_report(REPORT_BLOCKS_ONLY.split("\n")) == {
+        4242: {
+            "hard_limit_bytes": 1048576 * 1024,
+            "used_bytes": 10240 * 1024,
+            "inodes_hard_limit": 0,
+            "used_inodes": 0
+        }
+    }
+
+
+@pytest.fixture(name="mounts_file")
+def fixture_mounts_file(tmp_path, monkeypatch):
+    path = tmp_path / "mounts"
+    path.write_text(MOUNTS, encoding="utf-8")
+    monkeypatch.setattr(xfsquota, "MOUNTS_FILE", str(path))
+    return path
+
+
+def test_get_mount_device(mounts_file):
+    assert get_mount_device("/bricks/storage-pool/data/brick") == "/dev/sdc"
+    assert get_mount_device("/bricks/storage-pool") == "/dev/sdc"
+    assert get_mount_device("/bricks/storage pool/data") == "/dev/sdd"
+    # Longest prefix match, not a string prefix
+    assert get_mount_device("/bricks/storage-pool2") == "/dev/sda1"
+
+
+def test_native_backend_set_limit(mounts_file):
+    backend = NativeBackend("/bricks/storage-pool")
+    calls = []
+    backend.quotactl = lambda cmd, project_id, dquot: calls.append(
+        (cmd, project_id, dquot))
+
+    backend.set_limit(4242, 1000)
+
+    assert len(calls) == 1
+    cmd, project_id, dquot = calls[0]
+    assert cmd == xfsquota.Q_XSETQLIM
+    assert project_id == 4242
+    assert dquot.d_version == FS_DQUOT_VERSION
+    assert dquot.d_flags == FS_PROJ_QUOTA
+    assert dquot.d_fieldmask == FS_DQ_BHARD
+    assert dquot.d_id == 4242
+    # Rounded up to 512 byte basic blocks
+    assert dquot.d_blk_hardlimit == 2
+
+
+def test_native_backend_without_device(tmp_path, monkeypatch):
+    path = tmp_path / "mounts"
+    path.write_text("", encoding="utf-8")
+    monkeypatch.setattr(xfsquota, "MOUNTS_FILE", str(path))
+
+    with pytest.raises(QuotaError):
+        NativeBackend("/bricks/storage-pool")
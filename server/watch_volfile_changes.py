@@ -1,17 +1,23 @@
 import os
-import time
+import hashlib
 import json
 import logging
 import signal
-import serverutils
-from kadalulib import (CommandException, execute, logf,
-                       logging_setup)
+import time
+import monitorctl
+from kadalulib import (IN_CREATE, IN_MOVED_TO, Inotify, get_proc_pid,
+                       is_configmap_updated, logf, logging_setup)
 from glusterfsd import (create_brick_volfile, create_client_volfile)
 from shd import create_shd_volfile
 
 VOLINFO_DIR = "/var/lib/gluster"
 VOLFILES_DIR = "/var/lib/kadalu/volfiles"
 
+# Volfiles are checked once in a while even without any inotify
+# events, or at this interval if inotify is not available.
+RECHECK_INTERVAL = 300
+POLL_INTERVAL = 10
+
 brick_device = os.environ.get("BRICK_DEVICE", None)
 brick_path = os.environ["BRICK_PATH"]
 
@@ -29,62 +35,116 @@ shd_volfile_path = os.path.join(VOLFILES_DIR, "glustershd.vol")
 data = {}
 info_file_path = os.path.join(VOLINFO_DIR, "%s.info" % volname)
 
-def send_sighup():
-    """ Send SIGHUP to Brick & SHD Process notifing change in volfiles """
 
+def file_hash(path):
+    """Hash of the file content, None if not exists"""
     try:
-        out, _, _ = execute("pgrep", "-f", "-a", "glusterfsd|shd")
-        for line in out.split("\n"):
-            try:
-                pid = line.split(" ", 1)[0]
-                os.kill(int(pid), signal.SIGHUP)
-            except ProcessLookupError as err:
-                logging.error(logf(
-                    "Failed to send SIGHUP",
-                    line=line,
-                    error=err
-                ))
-    except CommandException as err:
-        logging.error(logf(
-            "Failed to get pid",
-            error=err
-        ))
+        with open(path, "rb") as volfile:
+            return hashlib.sha256(volfile.read()).hexdigest()
+    except FileNotFoundError:
+        return None
 
 
-# TODO: Find more efficient ways to watch change on configmap.
-# As mtime based watch will not work on Configmap,
-# since it is immutable & require pod refresh for mtime to be changed.
-def watch_volfile_changes():
+def update_volfile(path, generate):
     """
-    Watch mounted configmap file for changes infinitely every 10 seconds.
-    If file is changed, regenerate volfiles & send SIGHUP
+    Generate the volfile to a temp file using generate(tmp_path) and
+    replace the volfile only if the content is changed. Returns True
+    if the volfile is changed.
     """
+    tmp_path = path + ".tmp"
+    generate(tmp_path)
+    if file_hash(tmp_path) == file_hash(path):
+        os.remove(tmp_path)
+        return False
+
+    os.replace(tmp_path, path)
+    logging.info(logf("Volfile updated", path=path))
+    return True
+
 
-    last_content = None
+def send_sighup(name):
+    """ Send SIGHUP to the process (started by Monitor) notifing change in volfiles """
+    try:
+        monitorctl.reload(name)
+        logging.info(logf("Sent SIGHUP", name=name))
+        return
+    except (OSError, monitorctl.MonitorCtlError) as err:
+        logging.warning(logf("Failed to reload using Monitor control socket",
+                             name=name, error=err))
+
+    # Monitor control socket is not available, use the PID file
+    pid = get_proc_pid(name)
+    if pid is None:
+        logging.info(logf("Process is not running, SIGHUP not sent", name=name))
+        return
 
-    # Intialize last_content to avoid regenerating volfiles on first pass.
+    try:
+        os.kill(pid, signal.SIGHUP)
+        logging.info(logf("Sent SIGHUP", name=name, pid=pid))
+    except ProcessLookupError as err:
+        logging.error(logf(
+            "Failed to send SIGHUP",
+            name=name,
+            pid=pid,
+            error=err
+        ))
+
+
+def regenerate_volfiles():
+    """Regenerate volfiles and SIGHUP the processes whose volfile changed"""
     with open(info_file_path, "r") as info_file:
-        last_content = info_file.read()
+        data = json.load(info_file)
 
-    while True:
-        with open(info_file_path, "r") as info_file:
-            content = info_file.read()
+    # glusterfsd serves the client volfile to the clients
+    glusterfsd_changed = update_volfile(
+        storage_unit_volfile_path,
+        lambda path: create_brick_volfile(path, volname, volume_id, brick_path, data))
+    glusterfsd_changed = update_volfile(
+        client_volfile_path,
+        lambda path: create_client_volfile(path, data)) or glusterfsd_changed
 
-            if last_content is not None and content != last_content:
-                last_content = content
-                logging.info(logf(
-                    "Detected change in configmap content. Regenerating volfiles."
-                ))
+    if glusterfsd_changed:
+        send_sighup("glusterfsd")
 
-                data = json.loads(content)
-                create_brick_volfile(storage_unit_volfile_path, volname, volume_id, brick_path, data)
-                create_shd_volfile(shd_volfile_path, volname)
-                create_client_volfile(client_volfile_path, data)
+    if os.environ.get("SHD_REQUIRED", "0") == "1" and update_volfile(
+            shd_volfile_path,
+            lambda path: create_shd_volfile(path, volname)):
+        send_sighup("shd")
 
-                # Send HUP to GlusterFSD & SHD processes
-                send_sighup()
 
-        time.sleep(10)
+def watch_volfile_changes():
+    """
+    Watch mounted configmap for changes using inotify (Kubelet updates
+    the ConfigMap volume by swapping "..data" symlink). If changed,
+    regenerate volfiles and SIGHUP the processes only if the generated
+    volfiles are changed.
+    """
+    try:
+        inotify = Inotify()
+        inotify.add_watch(VOLINFO_DIR, IN_MOVED_TO | IN_CREATE)
+    except OSError as err:
+        logging.warning(logf("inotify not available, polling for changes",
+                             error=err))
+        inotify = None
+
+    while True:
+        if inotify is not None:
+            events = inotify.read_events(RECHECK_INTERVAL)
+            if events and not is_configmap_updated(events):
+                continue
+        else:
+            events = []
+            time.sleep(POLL_INTERVAL)
+
+        if events:
+            logging.info(logf(
+                "Detected change in configmap content. Regenerating volfiles."
+            ))
+
+        try:
+            regenerate_volfiles()
+        except (OSError, ValueError) as err:
+            logging.error(logf("Failed to regenerate volfiles", error=err))
 
 
 if __name__ == "__main__":